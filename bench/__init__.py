@@ -0,0 +1,14 @@
+"""
+Performance benchmarks for org-python.
+
+Each module can be run on its own, e.g.
+
+    python -m bench.parse_classifier --size 100
+
+bench.run runs the parse and export benchmarks on every synthetic corpus (see
+bench.corpus), and saves the results as JSON to compare them between commits:
+
+    python -m bench.run --output before.json
+    python -m bench.run --compare before.json
+
+"""
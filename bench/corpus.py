@@ -0,0 +1,328 @@
+"""
+Synthetic org documents for the benchmarks.
+
+"""
+
+import random
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit mauris '
+         'imperdiet tincidunt lacus nisi iaculis lectus eget pellentesque '
+         'nulla velit odio duis justo molestie hendrerit convallis ante').split()
+
+
+def _sentence(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in xrange(words))
+
+
+def text_heavy(size, seed=0):
+    """Return an org document of roughly `size` bytes made mostly of
+    paragraphs, with a few headlines and lists in between.
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        level = rnd.randint(1, 3)
+        section = ['*' * level + ' ' + _sentence(rnd, 4)]
+
+        for _ in xrange(rnd.randint(2, 6)):
+            section.append('')
+            section.extend(_sentence(rnd, 12) for _ in xrange(rnd.randint(3, 10)))
+
+        if rnd.random() < 0.3:
+            section.append('')
+            section.extend('  - ' + _sentence(rnd, 6)
+                           for _ in xrange(rnd.randint(2, 5)))
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def node_tree(nodes, seed=0):
+    """Build an OrgDoc with about `nodes` nodes directly, without parsing:
+    headlines up to three levels deep, each with paragraphs and small nested
+    lists.
+    """
+    from orgpython.parser import parser
+
+    rnd = random.Random(seed)
+    doc = parser.OrgDoc()
+    count = 0
+    path = [doc.root]
+
+    while count < nodes:
+        level = rnd.randint(1, min(len(path), 3))
+        del path[level:]
+        headline = parser.HeadlineNode(path[-1], level, _sentence(rnd, 4))
+        path.append(headline)
+        count += 1
+
+        for _ in xrange(rnd.randint(1, 3)):
+            text = parser.TextNode(headline)
+            text.lines.extend(_sentence(rnd, 10) for _ in xrange(3))
+            count += 1
+
+        if rnd.random() < 0.5:
+            ulist = parser.ListNode(headline, '-', 0)
+            for _ in xrange(rnd.randint(2, 4)):
+                item = parser.ListItemNode(ulist, _sentence(rnd, 5))
+                count += 2
+
+                if rnd.random() < 0.3:
+                    olist = parser.ListNode(item, '1.', 2)
+                    parser.ListItemNode(olist, _sentence(rnd, 3))
+                    count += 2
+
+    return doc
+
+
+def count_nodes(doc):
+    count = 0
+    stack = [doc.root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def list_heavy(size, seed=0):
+    """Return an org document of roughly `size` bytes made of short
+    paragraphs and nested lists, i.e. many small nodes.
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['*' * rnd.randint(1, 3) + ' ' + _sentence(rnd, 3)]
+
+        for _ in xrange(rnd.randint(1, 4)):
+            section.append(_sentence(rnd, 5))
+            section.append('')
+            for _ in xrange(rnd.randint(2, 6)):
+                section.append(' ' * rnd.randint(0, 2) * 2 + '- ' +
+                               _sentence(rnd, 2))
+            section.append('')
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def _markup_sentence(rnd, words):
+    """A sentence with some of its words formatted, linked or dated"""
+    output = []
+    for _ in xrange(words):
+        word = rnd.choice(WORDS)
+        roll = rnd.random()
+        if roll < 0.04:
+            word = '/%s %s/' % (word, rnd.choice(WORDS))
+        elif roll < 0.08:
+            word = '*%s*' % word
+        elif roll < 0.10:
+            word = '_%s_' % word
+        elif roll < 0.11:
+            word = '[[http://example.com/%s][%s]]' % (word, word)
+        elif roll < 0.12:
+            word = '[[%s][%s]]' % (word, rnd.choice(WORDS))
+        elif roll < 0.125:
+            word = '<2011-08-%02d Sun>' % rnd.randint(10, 28)
+        elif roll < 0.13:
+            word = '\\*%s' % word
+        output.append(word)
+    return ' '.join(output)
+
+
+def markup_heavy(size, seed=0):
+    """Return an org document of roughly `size` bytes made of paragraphs with
+    inline formatting, links and dates.
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['*' * rnd.randint(1, 3) + ' ' + _markup_sentence(rnd, 4)]
+
+        for _ in xrange(rnd.randint(2, 6)):
+            section.append('')
+            section.extend(_markup_sentence(rnd, 12)
+                           for _ in xrange(rnd.randint(3, 10)))
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def templated(size, seed=0, distinct=200):
+    """Return an org document of roughly `size` bytes where headlines, list
+    items and paragraphs are drawn from `distinct` templates, as in recurring
+    meeting notes and TODO lists.
+    """
+    rnd = random.Random(seed)
+    items = ['- ' + _markup_sentence(rnd, 6) for _ in xrange(distinct)]
+    paragraphs = [_markup_sentence(rnd, 14) for _ in xrange(distinct)]
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['* ' + _sentence(rnd, 3), rnd.choice(paragraphs), '']
+        section.extend(rnd.choice(items) for _ in xrange(rnd.randint(2, 8)))
+        section.append('')
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def deep_headlines(size, seed=0, depth=200):
+    """Return an org document of roughly `size` bytes whose headlines go down
+    to `depth` levels and back up, with a short paragraph under each.
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+    level = 1
+
+    while total < size:
+        chunk = '%s %s\n%s\n' % ('*' * level, _sentence(rnd, 3),
+                                 _sentence(rnd, 8))
+        chunks.append(chunk)
+        total += len(chunk)
+
+        # mostly deeper, sometimes back to a random ancestor
+        if level < depth and rnd.random() < 0.9:
+            level += 1
+        else:
+            level = rnd.randint(1, level)
+
+    return ''.join(chunks)
+
+
+def nested_lists(size, seed=0, depth=100):
+    """Return an org document of roughly `size` bytes of lists nested down to
+    `depth` levels, with items continued on the next line
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['* ' + _sentence(rnd, 3), '']
+        level = 0
+        for _ in xrange(rnd.randint(depth // 2, depth * 2)):
+            bullet = rnd.choice(('-', '+', '1.', '2)'))
+            section.append('  ' * level + bullet + ' ' + _sentence(rnd, 4))
+            if rnd.random() < 0.2:
+                section.append('  ' * level + '   ' + _sentence(rnd, 4))
+
+            if level < depth and rnd.random() < 0.7:
+                level += 1
+            else:
+                level = rnd.randint(0, level)
+        section.append('')
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def long_paragraphs(size, seed=0, line_words=400):
+    """Return an org document of roughly `size` bytes of paragraphs made of a
+    few very long lines
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['* ' + _sentence(rnd, 3)]
+        for _ in xrange(rnd.randint(1, 3)):
+            section.append('')
+            section.extend(_markup_sentence(rnd, line_words)
+                           for _ in xrange(rnd.randint(1, 4)))
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def blank_lines(size, seed=0):
+    """Return an org document of roughly `size` bytes where short paragraphs
+    and list items are separated by runs of empty or whitespace-only lines
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        if rnd.random() < 0.1:
+            line = '* ' + _sentence(rnd, 3)
+        elif rnd.random() < 0.3:
+            line = ' ' * rnd.randint(0, 4) + '- ' + _sentence(rnd, 3)
+        else:
+            line = _sentence(rnd, 5)
+
+        chunk = line + '\n' + ''.join(rnd.choice(('', ' ', '\t', '   ')) + '\n'
+                                      for _ in xrange(rnd.randint(1, 12)))
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
+
+
+def _adversarial_line(rnd, length):
+    """A line crafted to make inline markup matching expensive: unclosed links
+    and emphasis, and runs of special characters
+    """
+    pieces = []
+    total = 0
+    while total < length:
+        piece = rnd.choice(('[[', '[[' + rnd.choice(WORDS) + ']',
+                            '[[a][b', '/' + rnd.choice(WORDS), '*', '_ ',
+                            '\\/', '<2011-08-', rnd.choice(WORDS) + ' '))
+        pieces.append(piece)
+        total += len(piece)
+    return ''.join(pieces)
+
+
+def link_heavy(size, seed=0, adversarial=0.1):
+    """Return an org document of roughly `size` bytes of paragraphs full of
+    links and markup. A fraction `adversarial` of the lines are crafted to
+    trigger worst cases in inline markup matching.
+    """
+    rnd = random.Random(seed)
+    chunks = []
+    total = 0
+
+    while total < size:
+        section = ['* ' + _markup_sentence(rnd, 4), '']
+        for _ in xrange(rnd.randint(3, 10)):
+            if rnd.random() < adversarial:
+                section.append(_adversarial_line(rnd, 2000))
+            else:
+                section.append(' '.join(
+                    '[[http://example.com/%s][%s]] /%s/' % (
+                        rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS))
+                    for _ in xrange(rnd.randint(2, 6))))
+
+        chunk = '\n'.join(section) + '\n'
+        chunks.append(chunk)
+        total += len(chunk)
+
+    return ''.join(chunks)
@@ -0,0 +1,55 @@
+"""
+Export documents with different options on a pool of threads sharing
+HtmlExporter instances, and check every result against a sequential export.
+
+With the interpreter lock, threads don't convert faster than a single one; the
+point is that a threaded server gets the right html at the same throughput,
+instead of needing a process per request.
+
+Usage: python -m bench.exporter_threads [--docs N] [--threads N,N,...]
+
+"""
+
+import getopt
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from bench import corpus
+from orgpython.export.html import HtmlExporter, InlineCache
+from orgpython.parser.parser import parse
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['docs=', 'threads='])
+    ndocs = 200
+    thread_counts = [1, 2, 4, 8]
+    for opt, arg in opts:
+        if opt == '--docs':
+            ndocs = int(arg)
+        elif opt == '--threads':
+            thread_counts = [int(n) for n in arg.split(',')]
+
+    docs = [parse(corpus.markup_heavy(20 * 1024, seed)) for seed in xrange(20)]
+    cache = InlineCache()
+    exporters = [HtmlExporter(hl_offset=offset, remove_empty_p=remove,
+                              inline_cache=cache)
+                 for offset in range(3) for remove in (False, True)]
+
+    tasks = [(i % len(exporters), i % len(docs)) for i in xrange(ndocs)]
+    expected = dict(((e, d), exporters[e].to_html(docs[d])) for e, d in tasks)
+
+    def export(task):
+        e, d = task
+        return exporters[e].to_html(docs[d]) == expected[task]
+
+    for threads in thread_counts:
+        pool = ThreadPool(threads)
+        start = time.time()
+        results = pool.map(export, tasks)
+        seconds = time.time() - start
+        pool.close()
+        pool.join()
+
+        print '%2d threads: %7.1f docs/s, %d wrong' % (
+            threads, ndocs / seconds, results.count(False))
@@ -0,0 +1,66 @@
+"""
+Query the nodes of documents of increasing size by type and level, and the
+headlines by path, with the index built by parse(index=True) and by walking
+the tree. The indexed queries should only cost the number of results.
+
+Usage: python -m bench.find_nodes [--sizes MB,MB,...] [--queries N]
+
+"""
+
+import getopt
+import random
+import sys
+import time
+
+from bench import corpus
+from orgpython.parser.parser import parse, HeadlineNode, ListNode, TextNode
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+
+def median_ms(function, args_list):
+    times = sorted(timed(function, *args)[0] for args in args_list)
+    return times[len(times) // 2] * 1000
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['sizes=', 'queries='])
+    sizes = [1, 5, 20]
+    queries = 20
+    for opt, arg in opts:
+        if opt == '--sizes':
+            sizes = [float(size) for size in arg.split(',')]
+        elif opt == '--queries':
+            queries = int(arg)
+
+    print '%8s %10s %10s %-22s %10s %10s %10s' % (
+        'size MB', 'parse ms', 'index ms', 'query', 'results', 'walk ms',
+        'index ms')
+
+    rnd = random.Random(0)
+    for size in sizes:
+        text = corpus.text_heavy(int(size * 1024 * 1024))
+        parse_time, walked = timed(parse, text)
+        index_time, indexed = timed(lambda: parse(text, index=True))
+
+        for name, cls, level in (('headlines level 1', HeadlineNode, 1),
+                                 ('headlines level 3', HeadlineNode, 3),
+                                 ('lists', ListNode, None),
+                                 ('texts', TextNode, None)):
+            results = len(indexed.find_all(cls, level))
+            walk = median_ms(walked.find_all, [(cls, level)] * queries)
+            index = median_ms(indexed.find_all, [(cls, level)] * queries)
+            print '%8.1f %10.1f %10.1f %-22s %10d %10.3f %10.3f' % (
+                size, parse_time * 1000, index_time * 1000, name, results,
+                walk, index)
+
+        paths = indexed.headline_paths.keys()
+        lookups = [(rnd.choice(paths),) for _ in xrange(queries)]
+        print '%8.1f %10.1f %10.1f %-22s %10d %10.3f %10.3f' % (
+            size, parse_time * 1000, index_time * 1000, 'headline by path',
+            1, median_ms(walked.headline, lookups),
+            median_ms(indexed.headline, lookups))
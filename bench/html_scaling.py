@@ -0,0 +1,36 @@
+"""
+Show how HTML export time grows with the number of nodes in the tree. With a
+linear traversal the time per node stays flat from 1k to 1M nodes.
+
+Usage: python -m bench.html_scaling [--max NODES]
+
+"""
+
+import getopt
+import sys
+import time
+
+from bench import corpus
+from orgpython.export.html import org_to_html
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['max='])
+    max_nodes = 1000000
+    for opt, arg in opts:
+        if opt == '--max':
+            max_nodes = int(arg)
+
+    print '%10s %10s %12s' % ('nodes', 'seconds', 'us/node')
+
+    size = 1000
+    while size <= max_nodes:
+        doc = corpus.node_tree(size)
+        nodes = corpus.count_nodes(doc)
+
+        start = time.time()
+        org_to_html(doc)
+        elapsed = time.time() - start
+
+        print '%10d %10.3f %12.2f' % (nodes, elapsed, elapsed * 1e6 / nodes)
+        size *= 10
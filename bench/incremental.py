@@ -0,0 +1,59 @@
+"""
+Measure the latency of re-parsing a large document after single line edits,
+with a full parse and with reparse(), which only parses the section edited.
+Both must give the same tree.
+
+Usage: python -m bench.incremental [--size MB] [--edits N]
+
+"""
+
+import getopt
+import random
+import sys
+import time
+
+from bench import corpus
+from orgpython.parser import parser
+from orgpython.parser.incremental import parse_editable, reparse
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size=', 'edits='])
+    size = 10
+    edits = 200
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--edits':
+            edits = int(arg)
+
+    text = corpus.text_heavy(int(size * 1024 * 1024))
+
+    start = time.time()
+    orgdoc = parse_editable(text)
+    print 'parse_editable: %8.1f ms' % ((time.time() - start) * 1000)
+
+    start = time.time()
+    parser.parse(text)
+    print 'full parse:     %8.1f ms' % ((time.time() - start) * 1000)
+
+    # typing a word at the end of random lines which aren't headlines
+    rnd = random.Random(0)
+    lines = orgdoc.lines()
+    times = []
+
+    for _ in xrange(edits):
+        lineno = rnd.randrange(len(lines))
+        while lines[lineno][:1] in ('*', '#'):
+            lineno = rnd.randrange(len(lines))
+        lines[lineno] += ' ' + rnd.choice(corpus.WORDS)
+
+        start = time.time()
+        reparse(orgdoc, lineno, lineno + 1, lines[lineno] + '\n')
+        times.append(time.time() - start)
+
+    times.sort()
+    print 'reparse:        %8.2f ms median, %.2f ms max (%d edits)' % (
+        times[len(times) // 2] * 1000, times[-1] * 1000, edits)
+
+    print 'same tree:', str(orgdoc) == str(parser.parse('\n'.join(lines)))
@@ -0,0 +1,45 @@
+"""
+Export a document made of repeated templates with and without an InlineCache,
+and report the hit rate. Both must produce the same output.
+
+Usage: python -m bench.inline_cache [--size MB] [--cache-size N]
+
+"""
+
+import getopt
+import sys
+import time
+
+from bench import corpus
+from orgpython.export.html import org_to_html, InlineCache
+from orgpython.parser import parser
+
+
+def timed(doc, **export_options):
+    start = time.time()
+    html = org_to_html(doc, **export_options)
+    return time.time() - start, html
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size=', 'cache-size='])
+    size = 10
+    cache_size = 1024
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--cache-size':
+            cache_size = int(arg)
+
+    doc = parser.parse(corpus.templated(int(size * 1024 * 1024)))
+    cache = InlineCache(cache_size)
+
+    uncached, expected = timed(doc)
+    cached, html = timed(doc, inline_cache=cache)
+
+    print 'uncached: %6.2f s' % uncached
+    print 'cached:   %6.2f s' % cached
+    print 'hits: %d misses: %d (%.1f%%)' % (
+        cache.hits, cache.misses,
+        100.0 * cache.hits / max(1, cache.hits + cache.misses))
+    print 'identical output:', html == expected
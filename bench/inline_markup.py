@@ -0,0 +1,77 @@
+"""
+Compare text_to_html with the previous implementation, which escaped links and
+then applied one regular expression substitution per kind of markup, on the
+paragraphs of a markup-heavy corpus. Both must produce the same output.
+
+Usage: python -m bench.inline_markup [--size MB]
+
+"""
+
+import getopt
+import re
+import sys
+import time
+
+from bench import corpus
+from orgpython.export.html import text_to_html
+from orgpython.parser import parser
+
+SEQUENTIAL_SUBS = [
+    (r'([^\\]|\A)/([^/\s][^/]+[^/\s\\])/', r'\1<i>\2</i>'),
+    (r'([^\\]|\A)\*([^*\s][^*]+[^*\s\\])\*', r'\1<b>\2</b>'),
+    (r'([^\\]|\A)_([^_\s][^_]+[^_\s\\])_', r'\1<u>\2</u>'),
+    (r'\\([\*/_])', r'\1'),
+    (r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3} \d{2}:\d{2})>',
+     r'<span class="datetime">\1</span>'),
+    (r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3})>', r'<span class="date">\1</span>'),
+    (r'\[\[([a-zA-Z]+://[^\]]+)\]\[([^\]]+)\]\]', r'<a href="\1">\2</a>'),
+    (r'\[\[([^\]]+)\]\[([^\]]+)\]\]', r'<a href="#\1">\2</a>'),
+    ]
+
+
+def _escape_link(match):
+    href = re.sub(r'(/|\*|_)', r'\\\1', match.group(1))
+    desc = re.sub(r'(/|\*|_)', r'\\\1', match.group(2))
+    return '[[%s][%s]]' % (href, desc)
+
+
+def sequential_text_to_html(text):
+    text = re.sub(r'\[\[([^\]]+)\]\[([^\]]+)\]\]', _escape_link, text)
+    for pattern, repl in SEQUENTIAL_SUBS:
+        text = re.sub(pattern, repl, text)
+    return text
+
+
+def paragraphs(doc):
+    stack = [doc.root]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        if isinstance(node, parser.TextNode):
+            yield str(node)
+
+
+def timed(function, texts):
+    start = time.time()
+    results = [function(text) for text in texts]
+    return time.time() - start, results
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 10
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    texts = list(paragraphs(parser.parse(
+        corpus.markup_heavy(int(size * 1024 * 1024)))))
+
+    sequential, expected = timed(sequential_text_to_html, texts)
+    single, results = timed(text_to_html, texts)
+
+    print 'paragraphs: %d' % len(texts)
+    print 'sequential substitutions: %6.2f s' % sequential
+    print 'single pass:              %6.2f s' % single
+    print 'speedup: %.1fx' % (sequential / single)
+    print 'identical output:', results == expected
@@ -0,0 +1,66 @@
+"""
+Helpers to measure memory use. Python 2 has no tracemalloc, so measurements are
+taken from the resident set size of a child process, which only holds what is
+being measured.
+
+"""
+
+import gc
+import multiprocessing
+import resource
+
+from orgpython.instrument import _peak_resident, _reset_peak
+
+
+def _resident(private=False):
+    """Current resident set size, in bytes. If private is True, the pages
+    shared with other processes or backed by files (e.g. mapped files in the
+    page cache) aren't counted.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            fields = statm.read().split()
+        pages = int(fields[1])
+        if private:
+            pages -= int(fields[2])
+        return pages * resource.getpagesize()
+    except IOError:
+        # Only the peak is available, in kilobytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _child(queue, function, args, private):
+    gc.collect()
+    before = _resident(private)
+    result = function(*args)
+    gc.collect()
+    queue.put(_resident(private) - before)
+    del result
+
+
+def measure(function, *args, **kwargs):
+    """Return how many bytes the result of function(*args) keeps alive. The
+    function is run in a separate process. With private=True, only the memory
+    of the process itself is counted, see _resident.
+    """
+    private = kwargs.pop('private', False)
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child,
+                                      args=(queue, function, args, private))
+    process.start()
+    used = queue.get()
+    process.join()
+    return used
+
+
+def peak(function, *args):
+    """Return the peak memory used while running function(*args) in this
+    process, in bytes, above what the process used before. Memory freed
+    earlier by the process may be reused without showing, so this is best
+    measured in a new interpreter.
+    """
+    gc.collect()
+    _reset_peak()
+    before = _resident()
+    function(*args)
+    return max(_peak_resident() - before, 0)
@@ -0,0 +1,106 @@
+"""
+Compare the memory taken by a parsed tree with the current node classes and
+with the previous ones, which had a __dict__ and a children list per instance.
+
+Usage: python -m bench.node_memory [--size MB]
+
+"""
+
+import getopt
+import sys
+
+from bench import corpus, memory
+from orgpython.parser import parser
+
+
+class LegacyNode:
+    def __init__(self, parent):
+        self.children = []
+        self.parent = parent
+        if parent:
+            parent.children.append(self)
+
+class LegacyText(LegacyNode):
+    def __init__(self, parent):
+        LegacyNode.__init__(self, parent)
+        self.lines = []
+
+class LegacyHeadline(LegacyNode):
+    def __init__(self, parent, level, text):
+        LegacyNode.__init__(self, parent)
+        self.level = level
+        self.text = text
+
+class LegacyList(LegacyNode):
+    def __init__(self, parent, char, level):
+        LegacyNode.__init__(self, parent)
+        self.char = char
+        self.level = level
+        self.ordered = char[0].isdigit()
+
+class LegacyLeaf(LegacyNode):
+    def __init__(self, parent, text):
+        LegacyNode.__init__(self, parent)
+        self.text = text
+
+
+class LegacyTreeBuilder(parser.ContentHandler):
+    """Build the same tree as parser.TreeBuilder, with the legacy classes"""
+
+    def __init__(self):
+        self.root = LegacyHeadline(None, 0, None)
+        self.nodes = [self.root]
+
+    def enter(self, kind, value):
+        parent = self.nodes[-1]
+        if kind == 'text':
+            node = LegacyText(parent)
+        elif kind == 'item':
+            node = LegacyLeaf(parent, value)
+        elif kind == 'list':
+            node = LegacyList(parent, value[1], value[0])
+        elif kind == 'headline':
+            node = LegacyHeadline(parent, value[0], value[1])
+        elif kind == 'hrule':
+            node = LegacyLeaf(parent, value)
+        else:
+            node = LegacyLeaf(self.root, value[-1])
+        self.nodes.append(node)
+
+    def leave(self, kind):
+        self.nodes.pop()
+
+    def data(self, kind, value):
+        if kind == 'text':
+            self.nodes[-1].lines.append(value)
+        else:
+            self.nodes[-1].text += '\n' + value
+
+
+def build(handler, text):
+    push_parser = parser.PushParser(handler)
+    push_parser.feed(text)
+    push_parser.close()
+    return handler
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 20
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    # Short paragraphs and lists: many nodes for the amount of text
+    text = corpus.list_heavy(int(size * 1024 * 1024))
+    nodes = corpus.count_nodes(parser.parse(text))
+
+    legacy = memory.measure(build, LegacyTreeBuilder(), text)
+    current = memory.measure(build, parser.TreeBuilder(), text)
+
+    print 'corpus: %.1f MB, %d nodes' % (size, nodes)
+    print 'legacy nodes:  %7.1f MB (%5.1f bytes/node)' % (legacy / 1048576.0,
+                                                          float(legacy) / nodes)
+    print 'current nodes: %7.1f MB (%5.1f bytes/node)' % (current / 1048576.0,
+                                                          float(current) / nodes)
+    print 'saved: %.0f%%' % (100.0 * (legacy - current) / legacy)
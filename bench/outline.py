@@ -0,0 +1,66 @@
+"""
+Extract the outline (the headline hierarchy) of a large document with a full
+parse and with parse(outline=True): time, and memory kept by the tree.
+
+Usage: python -m bench.outline [--size MB]
+
+"""
+
+import getopt
+import sys
+import time
+
+from bench import corpus, memory
+from orgpython.parser.parser import parse
+
+
+def outline(orgdoc):
+    """The (level, text) of every headline, in document order"""
+    headlines = []
+    stack = [orgdoc.root.headlines()]
+    while stack:
+        if not stack[-1]:
+            stack.pop()
+            continue
+        headline = stack[-1].pop(0)
+        headlines.append((headline.level, headline.text))
+        stack.append(headline.headlines())
+    return headlines
+
+
+def parse_full(text):
+    return parse(text)
+
+
+def parse_outline(text):
+    return parse(text, outline=True)
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 20
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    text = corpus.text_heavy(int(size * 1024 * 1024))
+    print 'document: %.1f MB' % (len(text) / 1048576.0)
+
+    results = []
+    for name, function in (('full parse', parse_full),
+                           ('outline', parse_outline)):
+        seconds, orgdoc = timed(function, text)
+        extract, headlines = timed(outline, orgdoc)
+        results.append(headlines)
+        used = memory.measure(function, text)
+        print '%-11s %8.1f ms %8.1f MB  %d headlines' % (
+            name, (seconds + extract) * 1000, used / 1048576.0,
+            len(headlines))
+
+    print 'same outline:', results[0] == results[1]
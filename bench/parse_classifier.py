@@ -0,0 +1,124 @@
+"""
+Compare the single-pass line classifier with the sequential probing of one
+pattern per kind of line that parse() used before, on a text-heavy corpus, both
+alone and in a full parse() of the corpus.
+
+Usage: python -m bench.parse_classifier [--size MB]
+
+"""
+
+import getopt
+import re
+import sys
+import time
+
+from bench import corpus
+from orgpython.parser import parser
+
+
+class LineMatcher:
+    """The previous implementation: helper class for compiling all possible
+    patterns and performing line by line matching.
+    """
+    ## List of regexes
+    RE = {'COMMENT': re.compile(r'^#.*'),
+          'OPTION': re.compile(r'^#\+([A-Z_]+):(.*)$'),
+          'HEADLINE': re.compile(r'^(\*+)\s(.*)$'),
+          'ULIST': re.compile(r'^(\s*)([\+\-\*])\s(.*)$'),
+          'OLIST': re.compile(r'^(\s*)(\d+[\.\)])\s(.*)$'),
+          'HRULE': re.compile(r'^\s*\-{5,}\s*'),
+          'EMPTYLINE': re.compile(r'^\s*$'),
+          'TEXT': re.compile(r'^(\s*)(.*)$'),
+          }
+
+    def __init__(self):
+        self.line = ''
+        self.match = None
+
+    def matches(self, line, linetype):
+
+        # We need to reset these, since a matcher can be used multiple times
+        self.line = line
+        self.match = None
+
+        try:
+            pattern = self.RE[linetype]
+            self.match = pattern.match(line)
+        except KeyError:
+            pass
+
+        return self.match
+
+
+# The order in which parse() used to probe the LineMatcher patterns
+PROBE_ORDER = ('OPTION', 'COMMENT', 'HEADLINE', 'ULIST', 'OLIST', 'EMPTYLINE',
+               'HRULE', 'TEXT')
+
+
+def probe_lines(lines):
+    matcher = LineMatcher()
+    for line in lines:
+        for kind in PROBE_ORDER:
+            if matcher.matches(line, kind):
+                break
+
+
+def probe_line(line, matcher=LineMatcher()):
+    """classify_line() done by probing the patterns in PROBE_ORDER"""
+    for kind in PROBE_ORDER:
+        match = matcher.matches(line, kind)
+        if match:
+            return kind, match.groups()
+
+
+def probing_parse(text):
+    """parse() with the lines classified by probing"""
+    classify_line = parser.classify_line
+    parser.classify_line = probe_line
+    try:
+        return parser.parse(text)
+    finally:
+        parser.classify_line = classify_line
+
+
+def classify_lines(lines):
+    classify_line = parser.classify_line
+    for line in lines:
+        classify_line(line)
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 100
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    text = corpus.text_heavy(int(size * 1024 * 1024))
+    lines = text.split('\n')
+    mb = len(text) / (1024.0 * 1024.0)
+
+    print 'corpus: %.1f MB, %d lines' % (mb, len(lines))
+
+    probe = timed(probe_lines, lines)
+    classify = timed(classify_lines, lines)
+    print 'sequential probing: %6.2f s (%8.0f lines/s)' % (probe,
+                                                            len(lines) / probe)
+    print 'single-pass:        %6.2f s (%8.0f lines/s)' % (classify,
+                                                            len(lines) / classify)
+    print 'classification speedup: %.1fx' % (probe / classify)
+
+    if str(probing_parse(text)) != str(parser.parse(text)):
+        sys.exit('the trees differ')
+
+    probe = timed(probing_parse, text)
+    parse = timed(parser.parse, text)
+    print 'parse, probing:     %6.2f s (%.2f MB/s)' % (probe, mb / probe)
+    print 'parse, single-pass: %6.2f s (%.2f MB/s)' % (parse, mb / parse)
+    print 'parse speedup: %.1fx' % (probe / parse)
@@ -0,0 +1,50 @@
+"""
+Compare parsing a large file with parse() and with parse_mapped(): time, and
+memory kept by the tree (not counting the mapped file, which is in the page
+cache and shared between processes).
+
+Usage: python -m bench.parse_mapped [--size MB]
+
+"""
+
+import getopt
+import os
+import sys
+import tempfile
+import time
+
+from bench import corpus, memory
+from orgpython.parser.mapped import parse_mapped
+from orgpython.parser.parser import parse
+
+
+def parse_file(path):
+    return parse(open(path))
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 50
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    fd, path = tempfile.mkstemp(suffix='.org')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(corpus.text_heavy(int(size * 1024 * 1024)))
+
+        print 'file: %.1f MB' % (os.path.getsize(path) / 1048576.0)
+        for name, function in (('parse', parse_file),
+                               ('parse_mapped', parse_mapped)):
+            used = memory.measure(function, path, private=True)
+            print '%-13s %8.1f ms %8.1f MB' % (
+                name, timed(function, path) * 1000, used / 1048576.0)
+    finally:
+        os.remove(path)
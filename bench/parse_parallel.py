@@ -0,0 +1,60 @@
+"""
+Parse a large document sequentially and with parse_parallel on 1 to N worker
+processes, and report the throughput. The cost of sending the parsed parts back
+from the workers is reported separately, since it is the part of the work that
+doesn't parallelize.
+
+Usage: python -m bench.parse_parallel [--size MB] [--workers N]
+
+"""
+
+import getopt
+import multiprocessing
+import sys
+import time
+
+from bench import corpus
+from orgpython.parser import parser
+from orgpython.parser import parallel
+from orgpython.parser.parallel import parse_parallel
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size=', 'workers='])
+    size = 50
+    workers = multiprocessing.cpu_count()
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--workers':
+            workers = int(arg)
+
+    text = corpus.text_heavy(int(size * 1024 * 1024))
+    mb = len(text) / (1024.0 * 1024.0)
+
+    sequential, orgdoc = timed(parser.parse, text)
+    print 'sequential:   %6.2f s  %6.2f MB/s' % (sequential, mb / sequential)
+
+    # what the workers send back, and the parent turns into nodes
+    parallel._init_worker(text)
+    dumps, data = timed(parallel._parse_part, (0, len(text)))
+    loads, _ = timed(parallel._stitch, parser.OrgDoc(), data)
+    print 'transfer:     %6.2f s  (%.1f MB, %.2f s of it in this process)' % (
+        dumps - sequential + loads, len(data) / (1024.0 * 1024.0), loads)
+
+    expected = str(orgdoc)
+    del orgdoc, data
+
+    for n in sorted(set([1, 2, workers])):
+        if n > workers:
+            continue
+        seconds, orgdoc = timed(parse_parallel, text, n)
+        print '%2d workers:   %6.2f s  %6.2f MB/s  %.2fx' % (
+            n, seconds, mb / seconds, sequential / seconds)
+        assert str(orgdoc) == expected
@@ -0,0 +1,65 @@
+"""
+Export a large document after single line edits, as a live preview would,
+rendering everything and with a RenderCache. The document is updated with
+reparse(). Both exports must produce the same output.
+
+Usage: python -m bench.render_cache [--size MB] [--edits N]
+
+"""
+
+import getopt
+import random
+import sys
+import time
+
+from bench import corpus
+from orgpython.export.html import org_to_html, RenderCache
+from orgpython.parser.incremental import parse_editable, reparse
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size=', 'edits='])
+    size = 5
+    edits = 20
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--edits':
+            edits = int(arg)
+
+    orgdoc = parse_editable(corpus.markup_heavy(int(size * 1024 * 1024)))
+    cache = RenderCache()
+
+    seconds, html = timed(org_to_html, orgdoc, render_cache=cache)
+    print 'first export:  %8.1f ms' % (seconds * 1000)
+
+    rnd = random.Random(0)
+    lines = orgdoc.lines()
+    full = []
+    cached = []
+    identical = True
+
+    for _ in xrange(edits):
+        lineno = rnd.randrange(len(lines))
+        while lines[lineno][:1] in ('*', '#'):
+            lineno = rnd.randrange(len(lines))
+        lines[lineno] += ' *' + rnd.choice(corpus.WORDS) + '*'
+        reparse(orgdoc, lineno, lineno + 1, lines[lineno] + '\n')
+
+        seconds, expected = timed(org_to_html, orgdoc)
+        full.append(seconds)
+        seconds, html = timed(org_to_html, orgdoc, render_cache=cache)
+        cached.append(seconds)
+        identical = identical and html == expected
+
+    print 'full render:   %8.1f ms per edit' % (sum(full) / edits * 1000)
+    print 'cached render: %8.1f ms per edit' % (sum(cached) / edits * 1000)
+    print 'hit rate: %.1f%% (%d hits, %d misses)' % (
+        cache.hit_rate * 100, cache.hits, cache.misses)
+    print 'identical output:', identical
@@ -0,0 +1,81 @@
+"""
+Latency of converting a document with a running render server, compared with
+starting org_to_html.py for every conversion, as an editor preview would.
+
+Usage: python -m bench.render_server [--size KB] [--requests N]
+
+"""
+
+import getopt
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import corpus
+from orgpython.export.server import RenderClient
+
+
+def median_ms(times):
+    times = sorted(times)
+    return times[len(times) // 2] * 1000
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size=', 'requests='])
+    size = 50
+    requests = 50
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--requests':
+            requests = int(arg)
+
+    directory = tempfile.mkdtemp()
+    script = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'org_to_html.py')
+    path = os.path.join(directory, 'doc.org')
+    address = os.path.join(directory, 'render.sock')
+
+    text = corpus.markup_heavy(int(size * 1024))
+    with open(path, 'w') as f:
+        f.write(text)
+
+    server = subprocess.Popen([sys.executable, script, '--serve', address])
+    try:
+        while not os.path.exists(address):
+            time.sleep(0.01)
+
+        spawn = [timed(subprocess.check_call,
+                       [sys.executable, script, '-o', path + '.html', path])
+                 for _ in xrange(min(requests, 20))]
+
+        client = RenderClient(address)
+        texts = [timed(client.render, text) for _ in xrange(requests)]
+        paths = [timed(client.render, path=path) for _ in xrange(requests)]
+
+        start = time.time()
+        for _ in xrange(requests):
+            client.send(text)
+        for _ in xrange(requests):
+            client.receive()
+        pipelined = (time.time() - start) / requests
+        client.close()
+
+        print 'document: %.1f KB' % (len(text) / 1024.0)
+        print 'spawn org_to_html.py: %8.1f ms' % median_ms(spawn)
+        print 'server, text:         %8.1f ms' % median_ms(texts)
+        print 'server, cached path:  %8.1f ms' % median_ms(paths)
+        print 'server, pipelined:    %8.1f ms per request' % (pipelined * 1000)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
@@ -0,0 +1,190 @@
+"""
+Run the parse and export benchmarks on the synthetic corpora, and save the
+results as JSON to compare them between commits.
+
+For every scenario the corpus is generated from a fixed seed, parsed and
+exported a few times, keeping the best time, and then parsed and exported
+once more in a new interpreter to measure the peak memory.
+
+Usage: python -m bench.run [--size MB] [--repeat N] [--seed N]
+                           [--scenarios name,...] [--output results.json]
+                           [--compare baseline.json]
+
+"""
+
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from bench import corpus, memory
+from orgpython.export.html import org_to_html
+from orgpython.parser.parser import parse
+
+# name -> corpus generator, called with (size, seed)
+SCENARIOS = [
+    ('text', corpus.text_heavy),
+    ('lists', corpus.list_heavy),
+    ('markup', corpus.markup_heavy),
+    ('templated', corpus.templated),
+    ('deep_headlines', corpus.deep_headlines),
+    ('nested_lists', corpus.nested_lists),
+    ('long_paragraphs', corpus.long_paragraphs),
+    ('blank_lines', corpus.blank_lines),
+    ('links', corpus.link_heavy),
+]
+
+
+def best_time(repeat, function, *args):
+    """Return the shortest of repeat runs of function(*args), and its result"""
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        result = function(*args)
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+
+def parse_and_export(text):
+    org_to_html(parse(text))
+
+
+def peak_memory(name, size, seed):
+    """Return the peak memory taken by parsing and exporting the corpus of the
+    scenario name, measured in a new interpreter
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + filter(None, [env.get('PYTHONPATH')]))
+
+    return int(subprocess.check_output(
+        [sys.executable, '-m', 'bench.run', '--peak-of', name,
+         '--size', str(size), '--seed', str(seed)], env=env))
+
+
+def run_scenario(name, size, seed, repeat):
+    """Return the measurements for the corpus of the scenario name as a
+    dictionary. size is in MB.
+    """
+
+    text = dict(SCENARIOS)[name](int(size * 1024 * 1024), seed)
+    lines = text.count('\n')
+    megabytes = len(text) / 1048576.0
+
+    parse_seconds, orgdoc = best_time(repeat, parse, text)
+    export_seconds, html = best_time(repeat, org_to_html, orgdoc)
+    nodes = corpus.count_nodes(orgdoc)
+    del orgdoc, html
+
+    return {
+        'bytes': len(text),
+        'lines': lines,
+        'nodes': nodes,
+        'parse_seconds': parse_seconds,
+        'parse_mb_per_s': megabytes / parse_seconds,
+        'parse_lines_per_s': lines / parse_seconds,
+        'export_seconds': export_seconds,
+        'export_mb_per_s': megabytes / export_seconds,
+        'export_nodes_per_s': nodes / export_seconds,
+        'peak_memory_mb': peak_memory(name, size, seed) / 1048576.0,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ratio(new, old):
+    if not old:
+        return '     -'
+    return '%5.2fx' % (new / old)
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '',
+                               ['size=', 'repeat=', 'seed=', 'scenarios=',
+                                'output=', 'compare=', 'peak-of='])
+    size = 2
+    repeat = 3
+    seed = 0
+    names = [name for name, generator in SCENARIOS]
+    output = None
+    baseline = None
+    peak_of = None
+
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+        elif opt == '--repeat':
+            repeat = int(arg)
+        elif opt == '--seed':
+            seed = int(arg)
+        elif opt == '--scenarios':
+            names = arg.split(',')
+        elif opt == '--output':
+            output = arg
+        elif opt == '--compare':
+            with open(arg) as f:
+                baseline = json.load(f)['scenarios']
+        elif opt == '--peak-of':
+            peak_of = arg
+
+    generators = dict(SCENARIOS)
+
+    if peak_of:
+        # run by peak_memory()
+        text = generators[peak_of](int(size * 1024 * 1024), seed)
+        print memory.peak(parse_and_export, text)
+        sys.exit(0)
+
+    for name in names:
+        if name not in generators:
+            sys.exit('Unknown scenario %s, choose from %s' % (
+                name, ', '.join(generators)))
+
+    results = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'size': size,
+        'seed': seed,
+        'repeat': repeat,
+        'scenarios': {},
+    }
+
+    header = '%-16s %10s %10s %10s %10s %10s' % (
+        'scenario', 'parse MB/s', 'klines/s', 'export MB/s', 'knodes/s',
+        'peak MB')
+    if baseline:
+        header += '  %6s %6s' % ('parse', 'export')
+    print header
+
+    for name in names:
+        result = run_scenario(name, size, seed, repeat)
+        results['scenarios'][name] = result
+
+        line = '%-16s %10.2f %10.1f %10.2f %10.1f %10.1f' % (
+            name, result['parse_mb_per_s'], result['parse_lines_per_s'] / 1000,
+            result['export_mb_per_s'], result['export_nodes_per_s'] / 1000,
+            result['peak_memory_mb'])
+
+        if baseline:
+            old = baseline.get(name, {})
+            line += '  %6s %6s' % (
+                _ratio(result['parse_mb_per_s'], old.get('parse_mb_per_s')),
+                _ratio(result['export_mb_per_s'], old.get('export_mb_per_s')))
+        print line
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
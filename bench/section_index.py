@@ -0,0 +1,66 @@
+"""
+Parse single sections of files of increasing size through a HeadlineIndex, and
+compare with parsing the whole file. The lookup latency shouldn't depend on the
+size of the file.
+
+Usage: python -m bench.section_index [--sizes MB,MB,...] [--lookups N]
+
+"""
+
+import getopt
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench import corpus
+from orgpython.parser.index import build_index, load_index, parse_section
+from orgpython.parser.parser import parse
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['sizes=', 'lookups='])
+    sizes = [5, 20, 80]
+    lookups = 200
+    for opt, arg in opts:
+        if opt == '--sizes':
+            sizes = [float(size) for size in arg.split(',')]
+        elif opt == '--lookups':
+            lookups = int(arg)
+
+    print '%8s %10s %10s %10s %12s %12s' % (
+        'size MB', 'headlines', 'build ms', 'load ms', 'section ms',
+        'full parse ms')
+
+    rnd = random.Random(0)
+    for size in sizes:
+        fd, path = tempfile.mkstemp(suffix='.org')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(corpus.text_heavy(int(size * 1024 * 1024)))
+
+            build, index = timed(build_index, path)
+            index.save()
+            load, index = timed(load_index, path)
+
+            # the deepest sections, which are about the same size in any file
+            paths = [entry[0] for entry in index.entries if entry[1] == 3]
+            times = sorted(timed(parse_section, rnd.choice(paths), index)[0]
+                           for _ in xrange(lookups))
+
+            full, _ = timed(parse, open(path))
+
+            print '%8.1f %10d %10.1f %10.1f %12.3f %12.1f' % (
+                size, len(index), build * 1000, load * 1000,
+                times[len(times) // 2] * 1000, full * 1000)
+        finally:
+            os.remove(path)
+            if os.path.exists(path + '.orgidx'):
+                os.remove(path + '.orgidx')
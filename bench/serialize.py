@@ -0,0 +1,51 @@
+"""
+Compare the serialization format with pickling the tree: size, time to dump and
+time to load, eagerly and lazily (text decoded on use).
+
+Usage: python -m bench.serialize [--size MB]
+
+"""
+
+import cPickle
+import getopt
+import sys
+import time
+
+from bench import corpus
+from orgpython.parser import serialize
+from orgpython.parser.parser import parse
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], '', ['size='])
+    size = 10
+    for opt, arg in opts:
+        if opt == '--size':
+            size = float(arg)
+
+    text = corpus.text_heavy(int(size * 1024 * 1024))
+    seconds, orgdoc = timed(parse, text)
+    print 'document: %.1f MB, parsed in %.1f ms' % (
+        len(text) / 1048576.0, seconds * 1000)
+
+    sys.setrecursionlimit(100000)
+    dump_pickle, pickled = timed(cPickle.dumps, orgdoc, 2)
+    load_pickle, _ = timed(cPickle.loads, pickled)
+
+    dump_binary, data = timed(serialize.dumps, orgdoc)
+    load_binary, _ = timed(serialize.loads, data)
+    load_lazy, _ = timed(serialize.loads, memoryview(data), lazy=True)
+
+    print '%-14s %10s %10s %10s' % ('', 'size MB', 'dump ms', 'load ms')
+    for name, length, dumped, loaded in (
+            ('pickle', len(pickled), dump_pickle, load_pickle),
+            ('binary', len(data), dump_binary, load_binary),
+            ('binary, lazy', len(data), dump_binary, load_lazy)):
+        print '%-14s %10.1f %10.1f %10.1f' % (
+            name, length / 1048576.0, dumped * 1000, loaded * 1000)
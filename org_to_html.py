@@ -4,43 +4,116 @@
 Convert from an org-file to HTML using the parsing and exporting capabilities of
 org-python.
 
-Usage: %s [-o outfile] [--no-empty-text] input.org 
+Usage: %s [-o outfile] [--cache-dir dir] [--no-empty-text] [--profile]
+           input.org 
+       %s -d outdir [-j jobs] [--chunk-size n] [--cache-dir dir]
+           [--no-empty-text] input...
+       %s --serve address [-j jobs]
   
     outfile           :: the output HTML file
+    outdir            :: convert every input file, or the .org files under
+                         every input directory, to HTML files in outdir.
+                         Inputs with the same output as an earlier input
+                         fail
+    jobs              :: number of worker processes (default: number of CPUs)
+    --chunk-size      :: files sent to a worker at a time (default: 16)
+    --cache-dir       :: keep the parsed files in dir, and reuse them while
+                         they don't change
     --no-empty-text   :: remove empty paragraphs
+    --profile         :: print the time spent parsing each kind of line and
+                         exporting each type of node, and the peak memory of
+                         each phase, to stderr
+    --serve           :: run a render server (see orgpython.export.server)
+                         on address, a Unix socket path or host:port (a
+                         loopback host), with jobs worker threads (default:
+                         4)
 
 """
 
 import getopt
 import sys
 
-from orgpython.parser import parser
-from orgpython.export.html import org_to_html
+from orgpython.export.batch import convert_batch
+from orgpython.export.html import org_to_html, org_to_html_stream
+from orgpython.export.server import RenderServer, parse_address
+from orgpython.instrument import Stats
+from orgpython.parser.parser import parse
+from orgpython.parser.cache import ParseCache
 
 def usage():
-    print __doc__ % sys.argv[0]
+    print __doc__ % (sys.argv[0], sys.argv[0], sys.argv[0])
     sys.exit(1)
 
 if __name__ == '__main__':
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], \
-                                       'o:', \
-                                       ['output=','no-empty-text'])
+                                       'o:d:j:', \
+                                       ['output=', 'output-dir=', 'jobs=',
+                                        'chunk-size=', 'cache-dir=',
+                                        'no-empty-text', 'serve=',
+                                        'profile'])
     except getopt.GetoptError, e:
         print e
         usage()
 
     output = None
+    output_dir = None
+    jobs = None
+    chunksize = 16
+    cache_dir = None
+    serve = None
+    stats = None
     export_options = {}
 
     for opt, arg in opts:
         if opt in ('-o', '--output'):
             output = arg
 
+        elif opt in ('-d', '--output-dir'):
+            output_dir = arg
+
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+
+        elif opt == '--chunk-size':
+            chunksize = int(arg)
+
+        elif opt == '--cache-dir':
+            cache_dir = arg
+
         elif opt == '--no-empty-text':
             export_options['remove_empty_p'] = True
-            
+
+        elif opt == '--serve':
+            serve = arg
+
+        elif opt == '--profile':
+            stats = Stats()
+
+    if serve:
+        try:
+            server = RenderServer(parse_address(serve), jobs or 4)
+        except ValueError, e:
+            print >> sys.stderr, e
+            sys.exit(1)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.close()
+        sys.exit(0)
+
+    if output_dir:
+        if not args:
+            print 'Need to specify input files'
+            usage()
+
+        result = convert_batch(args, output_dir, jobs, chunksize, cache_dir,
+                               **export_options)
+        print result.summary()
+        sys.exit(1 if result.failures else 0)
+
     if len(args) != 1:
         print 'Need to specify input file'
         usage()
@@ -52,9 +125,6 @@ if __name__ == '__main__':
     except IOError:
         print 'Could not find', input_file
 
-    org_tree = parser.parse(fin)
-    fin.close()
-
     if output:
         try:
             out = open(output, 'w')
@@ -65,9 +135,33 @@ if __name__ == '__main__':
     else:
         out = sys.stdout
 
-    out.write(str(org_to_html(org_tree, **export_options)))
+    if stats:
+        # parsed and exported separately, to measure each phase
+        with stats.phase('parse'):
+            if cache_dir:
+                fin.close()
+                orgdoc = ParseCache(cache_dir).parse(input_file)
+            else:
+                orgdoc = parse(fin, stats=stats)
+        with stats.phase('export'):
+            html = org_to_html(orgdoc, stats=stats, **export_options)
+        with stats.phase('write'):
+            out.write(html)
+
+    elif cache_dir:
+        fin.close()
+        orgdoc = ParseCache(cache_dir).parse(input_file)
+        out.write(org_to_html(orgdoc, **export_options))
+
+    else:
+        # The HTML is written as the file is parsed, so the whole document is
+        # never kept in memory
+        org_to_html_stream(fin, out, **export_options)
 
     out.close()
+
+    if stats:
+        print >> sys.stderr, stats.report()
                         
 
     
@@ -0,0 +1,174 @@
+"""
+Batch conversion of many org files to HTML on a pool of worker processes
+
+"""
+
+import itertools
+import multiprocessing
+import os
+import time
+
+from orgpython.export.html import org_to_html, org_to_html_stream
+from orgpython.parser.cache import ParseCache
+
+# The parse cache of each directory, in this process
+_caches = {}
+
+
+def find_inputs(paths, extension='.org'):
+    """Yield (path, name) for every file in paths, where name is the path of
+    the output relative to the output directory, without extension.
+
+    Directories are searched recursively for files ending in extension, and
+    keep their structure in the output. Other files are output by their base
+    name.
+    """
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.splitext(os.path.basename(path))[0]
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(extension):
+                    src = os.path.join(dirpath, filename)
+                    yield src, os.path.splitext(os.path.relpath(src, path))[0]
+
+
+def convert_file(task):
+    """Convert the org file src to the HTML file dest. task is a tuple
+    (src, dest, cache_dir, export_options), so it can be sent to a worker
+    process. If cache_dir isn't None, the parsed file is taken from, or added
+    to, the ParseCache in that directory.
+
+    Returns (src, size of src, error, cached), where error is None or a
+    description of what went wrong, and cached whether the parsed file was
+    found in the cache. Errors are reported instead of raised, so one bad file
+    doesn't stop the batch.
+    """
+
+    src, dest, cache_dir, export_options = task
+    cached = False
+
+    try:
+        dest_dir = os.path.dirname(dest)
+        if dest_dir and not os.path.isdir(dest_dir):
+            try:
+                os.makedirs(dest_dir)
+            except OSError:
+                # created by another worker in the meantime
+                if not os.path.isdir(dest_dir):
+                    raise
+
+        size = os.path.getsize(src)
+
+        if cache_dir is None:
+            with open(src, 'r') as fin:
+                with open(dest, 'w') as out:
+                    org_to_html_stream(fin, out, **export_options)
+        else:
+            cache = _caches.get(cache_dir)
+            if cache is None:
+                cache = _caches[cache_dir] = ParseCache(cache_dir)
+
+            hits = cache.hits
+            orgdoc = cache.parse(src)
+            cached = cache.hits > hits
+
+            with open(dest, 'w') as out:
+                out.write(org_to_html(orgdoc, **export_options))
+
+    except Exception, e:
+        return src, 0, '%s: %s' % (e.__class__.__name__, e), False
+
+    return src, size, None, cached
+
+
+class BatchResult(object):
+    """Outcome of convert_batch"""
+
+    def __init__(self):
+        self.files = 0
+        # files whose parsed tree was taken from the cache
+        self.cached = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        # (src, error) of the files that couldn't be converted
+        self.failures = []
+
+    def summary(self):
+        """A report of the failures and the throughput"""
+
+        lines = ['FAILED %s: %s' % failure for failure in self.failures]
+
+        seconds = self.seconds or 1e-9
+        lines.append('%d files (%d failed, %d cached), %.1f MB in %.2f s: '
+                     '%.1f files/s, %.2f MB/s' % (
+                         self.files, len(self.failures), self.cached,
+                         self.bytes / 1048576.0, self.seconds,
+                         self.files / seconds,
+                         self.bytes / 1048576.0 / seconds))
+
+        return '\n'.join(lines)
+
+
+def convert_batch(paths, output_dir, workers=None, chunksize=16,
+                  cache_dir=None, **export_options):
+    """Convert the org files and directories in paths to HTML files under
+    output_dir. If cache_dir is given, the parsed files are kept in a
+    ParseCache there, and taken from it while they don't change.
+
+    The files are converted by a pool of worker processes (as many as CPUs by
+    default), which receive them in chunks of chunksize to limit the
+    communication overhead. With a single worker, files are converted in this
+    process.
+
+    Inputs whose output would have the same path as an earlier input's (e.g.
+    index.org in two of the directories) aren't converted, and are reported
+    as failures.
+    """
+
+    result = BatchResult()
+    start = time.time()
+
+    # output path -> the input converted to it
+    outputs = {}
+    tasks = []
+    for src, name in find_inputs(paths):
+        dest = os.path.join(output_dir, name + '.html')
+        key = os.path.normcase(os.path.abspath(dest))
+        if key in outputs:
+            result.files += 1
+            result.failures.append((src, 'Output %s is already the output of '
+                                         '%s' % (dest, outputs[key])))
+            continue
+
+        outputs[key] = src
+        tasks.append((src, dest, cache_dir, export_options))
+
+    if workers == 1:
+        pool = None
+        results = itertools.imap(convert_file, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(convert_file, tasks, chunksize)
+
+    try:
+        for src, size, error, cached in results:
+            result.files += 1
+            result.bytes += size
+            result.cached += cached
+            if error:
+                result.failures.append((src, error))
+    finally:
+        # every result has been received, or the batch was interrupted
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    result.failures.sort()
+    result.seconds = time.time() - start
+
+    return result
@@ -3,163 +3,556 @@ Parsed Org-Tree to HTML conversion
 
 """
 
-import StringIO
 import re
-
-# text substitutions
-# Explanation for text formatting: We want to match text surrounded by a special
-# character (e.g. /, *, _). However, if before the (first) special char there is
-# a backslash, then do not match. That produces the expression ([^\\]|\A)
-# --either a character which is not a backslash, or the start of a string--
-text_subs = [
-    # italics
-    (r'([^\\]|\A)/([^/\s][^/]+[^/\s\\])/', r'\1<i>\2</i>'),
-    # bold
-    (r'([^\\]|\A)\*([^*\s][^*]+[^*\s\\])\*', r'\1<b>\2</b>'),
-    # underscore
-    (r'([^\\]|\A)_([^_\s][^_]+[^_\s\\])_', r'\1<u>\2</u>'),
-    # escaped symbols
-    (r'\\([\*/_])', r'\1'),
-    # datetime
-    (r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3} \d{2}:\d{2})>',
-     r'<span class="datetime">\1</span>'),
-    # date
-    (r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3})>', r'<span class="date">\1</span>'),
-    # external link
-    (r'\[\[([a-zA-Z]+://[^\]]+)\]\[([^\]]+)\]\]',
-     r'<a href="\1">\2</a>'),
-    # internal link
-    (r'\[\[([^\]]+)\]\[([^\]]+)\]\]',
-     r'<a href="#\1">\2</a>'),
-    ]
-
-# Global export options, set up in org_to_html
+import threading
+from collections import OrderedDict
+
+from orgpython.parser.parser import HeadlineNode, TextNode, ListNode, \
+    ListItemNode, HRuleNode, OrgDoc, parse_sections
+
+# Inline markup
+#
+# Text between two special characters (/, * or _) is formatted in italics, bold
+# or underlined. The text can't start or end with whitespace, must be at least
+# three characters long, and the closing character is the next one of the same
+# kind. However, if before the first special char there is a backslash, then it
+# doesn't match, and '\/', '\*' and '\_' produce the special character itself.
+# Formatting can be nested (e.g. bold inside italics), but is not applied
+# inside links.
+#
+# Everything is recognized in a single left to right scan over the candidate
+# positions found by _MARKUP_RE. No regular expression is allowed to backtrack
+# over the rest of the line: the time taken is linear in the length of the
+# text, even for lines crafted to trigger the worst case.
+
+_MARKUP_RE = re.compile(r'[/*_\\<\[]')
+
+_EMPHASIS_TAGS = {'/': ('<i>', '</i>'),
+                  '*': ('<b>', '</b>'),
+                  '_': ('<u>', '</u>')}
+
+# Characters matched by \s
+_WHITESPACE = ' \t\n\r\f\v'
+
+_EXTERNAL_HREF_RE = re.compile(r'[a-zA-Z]+://[^\]]')
+_EXTERNAL_LINK_START_RE = re.compile(r'\[\[[a-zA-Z]+://[^\]]')
+
+_DATETIME_RE = re.compile(r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3} \d{2}:\d{2})>')
+_DATE_RE = re.compile(r'<(\d{4}-\d{2}-\d{2} [a-zA-Z]{3})>')
+
+# Export options, see HtmlExporter
 _default_options = {
     'remove_empty_p': False,
     'hl_offset': 0,
+    'inline_cache': None,
+    'render_cache': None,
+    'stats': None,
 }
 
-_export_options = {}
+# Options which don't change the html
+_CACHE_OPTIONS = ('inline_cache', 'render_cache', 'stats')
 
 
-def _escape_links(text):
-    """Substitute special parameters inside links so that format is not applied
-    inside them
-    """
+def _dates_to_html(text):
+    text = _DATETIME_RE.sub(r'<span class="datetime">\1</span>', text)
+    return _DATE_RE.sub(r'<span class="date">\1</span>', text)
 
-    escaped_text = ''
-    last_index = 0
 
-    for match in re.finditer(r'\[\[([^\]]+)\]\[([^\]]+)\]\]', text):
-        href = match.group(1)
-        desc = match.group(2)
+def _find_links(text):
+    """Find the links in text, with the same result as the leftmost matches of
+    r'\[\[([^\]]+)\]\[([^\]]+)\]\]'. Returns a list of (start, end, href, desc)
+    tuples.
 
-        href = re.sub(r'(/|\*|_)', r'\\\1', href)
-        desc = re.sub(r'(/|\*|_)', r'\\\1', desc)
+    The regular expression would take quadratic time on '[[[[[[...', since it
+    scans to the end of the text from every '[['. Here, a failed attempt skips
+    all the '[[' before the first ']' found, which would fail the same way.
+    """
+    links = []
+    find = text.find
+    start = find('[[')
 
-        link = '[[%s][%s]]' % (href, desc)
-        escaped_text += text[last_index:match.start()] + link
-        last_index = match.end()
+    while start != -1:
+        # the description starts after the first ']' and a '['
+        href_end = find(']', start + 2)
+        if href_end == -1:
+            break
 
-    escaped_text += text[last_index:]
+        if href_end > start + 2 and text[href_end + 1:href_end + 2] == '[':
+            desc_end = find(']', href_end + 2)
+            if desc_end == -1:
+                break
 
-    return escaped_text
+            if (desc_end > href_end + 2 and
+                text[desc_end + 1:desc_end + 2] == ']'):
+                links.append((start, desc_end + 2, text[start + 2:href_end],
+                              text[href_end + 2:desc_end]))
+                start = find('[[', desc_end + 2)
+                continue
 
+        start = find('[[', max(start + 1, href_end - 1))
+
+    return links
 
-def text_to_html(text):
+
+def _link_to_html(href, desc):
+    """Links are not formatted, but may contain dates"""
+
+    if '<' in href or '<' in desc:
+        href = _dates_to_html(href)
+        desc = _dates_to_html(desc)
+
+    if _EXTERNAL_HREF_RE.match(href):
+        return '<a href="%s">%s</a>' % (href, desc)
+
+    # In '[[[[http://...][desc]]' the external link starts at the second '[['
+    link_text = '[[' + href
+    inner = _EXTERNAL_LINK_START_RE.search(link_text, 1)
+    if inner:
+        return '%s<a href="%s">%s</a>' % (link_text[:inner.start()],
+                                          link_text[inner.start() + 2:], desc)
+
+    return '<a href="#%s">%s</a>' % (href, desc)
+
+
+class _InlineText(object):
+    """The text being converted by text_to_html, with the links found in it"""
+
+    def __init__(self, text):
+        self.text = text
+
+        # start -> (end, href, desc)
+        self.links = {}
+
+        # marks the characters inside a link
+        self.in_link = None
+
+        if '[[' in text:
+            for start, end, href, desc in _find_links(text):
+                if self.in_link is None:
+                    self.in_link = bytearray(len(text))
+                self.links[start] = (end, href, desc)
+                self.in_link[start:end] = '\x01' * (end - start)
+
+    def render(self, start, end, output):
+        """Append the html for text[start:end] to output"""
+
+        text = self.text
+        search = _MARKUP_RE.search
+        emphasis_tags = _EMPHASIS_TAGS
+
+        # end of the last match of each kind of emphasis. Its closing character
+        # can't be the one before the opening character of the next match
+        last_emphasis = {}
+
+        # text[written:] hasn't been output yet
+        written = start
+        index = start
+
+        while True:
+            match = search(text, index, end)
+            if not match:
+                break
+
+            index = match.start()
+            char = text[index]
+
+            if char in emphasis_tags:
+                close = -1
+
+                # a backslash before the opening character, or being the
+                # closing one of the previous match, prevent it from opening
+                if ((index == 0 or text[index - 1] != '\\') and
+                    last_emphasis.get(char) != index):
+                    close = text.find(char, index + 1, end)
+
+                if (close - index > 3 and
+                    text[index + 1] not in _WHITESPACE and
+                    text[close - 1] not in _WHITESPACE and
+                    text[close - 1] != '\\' and
+                    not (self.in_link and self.in_link[close])):
+
+                    open_tag, close_tag = emphasis_tags[char]
+                    output.append(text[written:index])
+                    output.append(open_tag)
+
+                    if search(text, index + 1, close):
+                        self.render(index + 1, close, output)
+                    else:
+                        output.append(text[index + 1:close])
+
+                    output.append(close_tag)
+                    written = index = last_emphasis[char] = close + 1
+                    continue
+
+            elif char == '[':
+                link = self.links.get(index)
+                if link:
+                    output.append(text[written:index])
+                    output.append(_link_to_html(link[1], link[2]))
+                    written = index = link[0]
+                    continue
+
+            elif char == '\\':
+                if index + 1 < end and text[index + 1] in _EMPHASIS_TAGS:
+                    # drop the backslash, and don't consider the escaped
+                    # character
+                    output.append(text[written:index])
+                    written = index + 1
+                    index += 2
+                    continue
+
+            elif char == '<':
+                date = (_DATETIME_RE.match(text, index, end) or
+                        _DATE_RE.match(text, index, end))
+                if date:
+                    output.append(text[written:index])
+                    if date.re is _DATETIME_RE:
+                        output.append('<span class="datetime">%s</span>' %
+                                      date.group(1))
+                    else:
+                        output.append('<span class="date">%s</span>' %
+                                      date.group(1))
+                    written = index = date.end()
+                    continue
+
+            index += 1
+
+        output.append(text[written:end])
+
+
+def text_to_html(text, cache=None):
     """Convert any special sequences in text to HTML. These can appear in
     Headlines, TextNodes or Lists.
+
+    If an InlineCache is given, the result is looked up and stored in it.
     """
 
-    text = _escape_links(text)
+    if not _MARKUP_RE.search(text):
+        return text
 
-    # apply all text transformations (also, unescaping links)
-    for pattern, repl in text_subs:
-        text = re.sub(pattern, repl, text)
+    if cache is not None:
+        return cache.render(text)
 
-    return text
+    output = []
+    _InlineText(text).render(0, len(text), output)
 
+    return ''.join(output)
 
-class EnterElement:
-    def __init__(self, element):
-        self.element = element
 
-    def generate(self):
-        
-        class_name = self.element.__class__.__name__
+class _LRUCache(object):
+    """Bounded cache which evicts the least recently used entries. A lock
+    guards it, so it can be shared by threads.
+    """
 
-        if class_name == 'HeadlineNode' and self.element.level != 0:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fraction of the lookups which found their entry"""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def clear(self):
+        """Remove all the entries and reset the counters"""
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key):
+        """Return the value for key, or None if it isn't cached"""
+
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+
+            # re-insert it as the most recently used
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+
+class InlineCache(_LRUCache):
+    """Bounded LRU cache of the html of inline text, keyed by the raw text.
+
+    Repeated headlines, list items and paragraphs are only converted once. An
+    instance can be shared by threads exporting different documents, and across
+    documents by passing it as the inline_cache export option.
+    """
 
-            level = self.element.level + _export_options['hl_offset']
-            return '<h%d>%s</h%d>' % (level, self.element.text, level)
+    def __init__(self, maxsize=1024):
+        _LRUCache.__init__(self, maxsize)
 
-        elif class_name == 'TextNode':
+    def render(self, text):
+        """Return the html for text, converting it only if it isn't cached"""
 
-            text_str = text_to_html(str(self.element))
-            if _export_options['remove_empty_p'] and re.match('^\s*$', text_str):
-                output = ''
-            else:
-                output = '<p>%s</p>' % text_str
+        html = self.get(text)
+        if html is None:
+            # Convert outside the lock, so threads don't wait on each other.
+            # Two of them may convert the same text, with the same result
+            output = []
+            _InlineText(text).render(0, len(text), output)
+            html = ''.join(output)
+            self.put(text, html)
 
-            return output
+        return html
 
-        elif class_name == 'ListNode':
-            if self.element.ordered:
-                return '<ol>'
-            else:
-                return '<ul>'
-   
-        elif class_name == 'ListItemNode':
-            return '<li>%s' % text_to_html(self.element.text)
 
-        elif class_name == 'HRuleNode':
-            return '<hr/>'
+class RenderCache(_LRUCache):
+    """Bounded LRU cache of the html of headline subtrees, keyed by their
+    content hash and the export options.
 
-class LeaveElement:
-    def __init__(self, element):
-        self.element = element
+    Passed to org_to_html as the render_cache export option, the subtrees
+    which didn't change since a previous export are not rendered again, and a
+    subtree which did is rendered using the html cached for its unchanged
+    sub-headlines. The document root isn't cached, it changes with any edit.
+    """
 
-    def generate(self):
-        class_name = self.element.__class__.__name__
+    def __init__(self, maxsize=4096):
+        _LRUCache.__init__(self, maxsize)
 
-        if class_name == 'ListNode':
-            if self.element.ordered:
-                return '</ol>'
-            else:
-                return '</ul>'
-        elif class_name == 'ListItemNode':
-            return '</li>'
 
-def org_to_html(tree, **export_options):
-    """Traverse the org tree and execute the appropriate function to generate
-    html code.
+class HtmlExporter(object):
+    """Converts parsed org trees to html with a fixed set of export options
+    (see _default_options).
+
+    The options are kept in the instance, and nothing else is stored while
+    converting, so an exporter can be reused for any number of documents, and
+    shared by threads. The caches in the options are shared too, they are
+    thread-safe.
     """
-    
-    # update global options
-    # FIXME: Perhaps there's a better way of doing this?
-    _export_options.update(_default_options)
-    _export_options.update(export_options)
 
-    events = []
-    output = StringIO.StringIO()
+    def __init__(self, **export_options):
+        options = dict(_default_options)
+        options.update(export_options)
+
+        # not to be modified, the state below is derived from it
+        self.options = options
+
+        self._hl_offset = options['hl_offset']
+        self._remove_empty_p = options['remove_empty_p']
+        self._inline_cache = options['inline_cache']
+        self._render_cache = options['render_cache']
+
+        # the options which change the html, part of the RenderCache keys
+        self._cache_key = tuple(sorted(item for item in options.items()
+                                       if item[0] not in _CACHE_OPTIONS))
+
+        # HTML generators for entering and leaving each node type. Nodes
+        # without a handler (e.g. comments) produce no output
+        self._enter_handlers = {
+            HeadlineNode: self._enter_headline,
+            TextNode: self._enter_text,
+            ListNode: _enter_list,
+            ListItemNode: self._enter_list_item,
+            HRuleNode: _enter_hrule,
+        }
+
+        self._leave_handlers = {
+            ListNode: _leave_list,
+            ListItemNode: _leave_list_item,
+        }
+
+        # With an orgpython.instrument.Stats, the nodes and the inline markup
+        # conversions are counted and timed
+        stats = options['stats']
+        if stats is None:
+            self._text_to_html = text_to_html
+        else:
+            self._text_to_html = stats.inline(text_to_html)
+            self._enter_handlers, self._leave_handlers = stats.handlers(
+                self._enter_handlers, self._leave_handlers)
+
+    def _enter_headline(self, node):
+        # The root of the document is a level 0 headline, and isn't printed
+        if node.level != 0:
+            level = node.level + self._hl_offset
+            return '<h%d>%s</h%d>' % (level, node.text, level)
+
+    def _enter_text(self, node):
+        text_str = self._text_to_html(str(node), self._inline_cache)
+        if self._remove_empty_p and _EMPTY_RE.match(text_str):
+            return ''
+        return '<p>%s</p>' % text_str
+
+    def _enter_list_item(self, node):
+        return '<li>%s' % self._text_to_html(node.text, self._inline_cache)
+
+    def _write_html(self, node, write):
+        """Traverse the subtree under node pre-order, passing the generated
+        html to write.
+
+        The traversal keeps an explicit stack of (node, children iterator)
+        pairs, so every node is visited exactly once and deep trees don't hit
+        the recursion limit.
+        """
+        enter_handlers = self._enter_handlers
+        leave_handlers = self._leave_handlers
+
+        stack = [(None, iter((node,)))]
+
+        while stack:
+            parent, children = stack[-1]
+
+            for child in children:
+                handler = enter_handlers.get(child.__class__)
+                if handler:
+                    output = handler(child)
+                    if output:
+                        write(output)
+
+                if child.children:
+                    # Descend into the child, its leave event is generated once
+                    # all its children have been handled
+                    stack.append((child, iter(child.children)))
+                    break
+
+                handler = leave_handlers.get(child.__class__)
+                if handler:
+                    write(handler(child))
+            else:
+                stack.pop()
+
+                handler = leave_handlers.get(parent.__class__)
+                if handler:
+                    write(handler(parent))
+
+    def _write_cached(self, tree, write):
+        """Like _write_html for the whole document tree, but taking the html of
+        the headline subtrees from the RenderCache, and adding it for the ones
+        which weren't there.
+        """
+        cache = self._render_cache
+        key = self._cache_key
+        enter_headline = self._enter_handlers[HeadlineNode]
+        root = tree.root
+        hashes = tree.content_hashes()
+
+        # headlines being rendered, as (headline, children iterator, html
+        # pieces)
+        stack = [(root, iter(root.children), [])]
+
+        while stack:
+            headline, children, output = stack[-1]
+
+            for child in children:
+                if child.__class__ is not HeadlineNode:
+                    self._write_html(child, output.append)
+                    continue
+
+                html = cache.get((key, hashes[child]))
+                if html is None:
+                    stack.append((child, iter(child.children),
+                                  [enter_headline(child)]))
+                    break
+
+                output.append(html)
+            else:
+                stack.pop()
+                html = ''.join(output)
+
+                if stack:
+                    cache.put((key, hashes[headline]), html)
+                    stack[-1][2].append(html)
+                else:
+                    write(html)
 
-    events.append(EnterElement(tree.root))
+    def to_html(self, tree):
+        """Return the html for the org tree"""
 
-    # Traverse the tree pre-order
-    while len(events) != 0:
+        output = []
 
-        event = events.pop(0)
+        if self._render_cache is None:
+            self._write_html(tree.root, output.append)
+        else:
+            self._write_cached(tree, output.append)
 
-        # Handle the node
-        output.write(event.generate())
+        return ''.join(output)
 
-        # Add leave event and children if this is an EnterElement event
-        if isinstance(event, EnterElement):
-            children = [EnterElement(child) for child in event.element.children]
-            leave_event = [LeaveElement(event.element)]
-            events = children + leave_event + events
+    def to_html_stream(self, doc, out):
+        """Parse doc (a string or a file handle) and write its html to the
+        file-like out as each headline's section is complete.
 
-    result = output.getvalue()
-    output.close()
+        The sections are removed from the tree once written, so memory is
+        bounded by the section being parsed and the headlines enclosing it, not
+        by the size of the document. With the stats option, the parsing is
+        measured too.
+        """
 
-    return result
+        write = out.write
+        for headline in parse_sections(doc, OrgDoc(), self.options['stats']):
+            self._write_section(headline, write)
+
+    def _write_section(self, headline, write):
+        """Pass the html of a complete section (see parse_sections) to write,
+        and remove it from the tree
+        """
+        output = self._enter_handlers[HeadlineNode](headline)
+        if output:
+            write(output)
+
+        # Write the body, the next headline may already be a child
+        for child in headline.children:
+            if child.__class__ is not HeadlineNode:
+                self._write_html(child, write)
+
+        # Everything before this headline has been written, including the
+        # earlier children of its parent
+        del headline.children[:]
+        if headline.parent:
+            del headline.parent.children[:]
+
+
+_EMPTY_RE = re.compile(r'\s*$')
+
+def _enter_list(node):
+    if node.ordered:
+        return '<ol>'
+    return '<ul>'
+
+def _enter_hrule(node):
+    return '<hr/>'
+
+def _leave_list(node):
+    if node.ordered:
+        return '</ol>'
+    return '</ul>'
+
+def _leave_list_item(node):
+    return '</li>'
+
+
+def org_to_html(tree, **export_options):
+    """Traverse the org tree and execute the appropriate function to generate
+    html code. To convert many documents with the same options, create an
+    HtmlExporter once instead.
+    """
+    return HtmlExporter(**export_options).to_html(tree)
+
+
+def org_to_html_stream(doc, out, **export_options):
+    """Parse doc (a string or a file handle) and write its html to the
+    file-like out as each headline's section is complete, see
+    HtmlExporter.to_html_stream.
+    """
+    HtmlExporter(**export_options).to_html_stream(doc, out)
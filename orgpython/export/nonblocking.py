@@ -0,0 +1,164 @@
+"""
+Non-blocking html conversion, for servers built on an event loop.
+
+HtmlPushConverter converts org text fed in chunks, as they arrive, and returns
+the html of every headline section as soon as it is complete. Each call only
+does the work of the chunk it is given, so an event loop is never blocked by a
+whole document.
+
+AsyncRenderServer is an asyncore server using it: a client sends org text and
+shuts down its side of the connection, and receives the html while it is being
+converted. A connection isn't read while more than high_water bytes of its
+html are waiting to be sent, so a slow client can't make the server buffer a
+whole document.
+
+"""
+
+import asyncore
+import os
+import socket
+
+from orgpython.export.html import HtmlExporter
+from orgpython.parser.parser import OrgDoc, PushParser, TreeBuilder
+
+
+class HtmlPushConverter(object):
+    """Converts org text fed in chunks to html with the HtmlExporter exporter,
+    one section at a time. Every section is removed from the tree once
+    converted, as in HtmlExporter.to_html_stream.
+    """
+
+    def __init__(self, exporter):
+        self._exporter = exporter
+        self._builder = TreeBuilder(OrgDoc())
+
+        stats = exporter.options['stats']
+        if stats is None:
+            self._parser = PushParser(self._builder)
+        else:
+            self._parser = stats.push_parser(self._builder)
+
+    def feed(self, chunk):
+        """Parse a chunk of the document, and return the html of the sections
+        it completed
+        """
+        self._parser.feed(chunk)
+        return self._sections()
+
+    def close(self):
+        """Parse the end of the document, and return the rest of the html"""
+        self._parser.close()
+        self._builder.sections.append(self._builder.headline)
+        return self._sections()
+
+    def _sections(self):
+        sections = self._builder.sections
+        if not sections:
+            return ''
+
+        output = []
+        for headline in sections:
+            self._exporter._write_section(headline, output.append)
+        del sections[:]
+
+        return ''.join(output)
+
+
+class _RenderChannel(asyncore.dispatcher):
+    """Converts the org text read from a connection, and sends its html"""
+
+    def __init__(self, sock, server):
+        asyncore.dispatcher.__init__(self, sock, map=server.map)
+        self._server = server
+        self._converter = HtmlPushConverter(server.exporter)
+
+        # the html waiting to be sent, the offset sent of the first piece, and
+        # the number of bytes left
+        self._output = []
+        self._offset = 0
+        self._pending = 0
+
+    def _queue(self, html):
+        if html:
+            self._output.append(html)
+            self._pending += len(html)
+
+    def readable(self):
+        return (self._converter is not None and
+                self._pending < self._server.high_water)
+
+    def writable(self):
+        return bool(self._output)
+
+    def handle_read(self):
+        chunk = self.recv(self._server.chunk_size)
+        if chunk and self._converter is not None:
+            self._queue(self._converter.feed(chunk))
+
+    def handle_write(self):
+        html = self._output[0]
+        sent = self.send(buffer(html, self._offset, self._server.chunk_size))
+        self._offset += sent
+        self._pending -= sent
+
+        if self._offset == len(html):
+            del self._output[0]
+            self._offset = 0
+
+            if not self._output and self._converter is None:
+                self.close()
+
+    def handle_close(self):
+        if self._converter is None:
+            # the client went away before receiving all the html
+            self.close()
+            return
+
+        # the client sent the whole document
+        self._queue(self._converter.close())
+        self._converter = None
+        if not self._output:
+            self.close()
+
+
+class AsyncRenderServer(asyncore.dispatcher):
+    """Converts org documents to html for the clients connecting to address,
+    a Unix socket path or a (host, port) tuple (see server.parse_address), in
+    an asyncore loop. map is the asyncore socket map, by default the global
+    one.
+
+    Documents are read chunk_size bytes at a time, and the export options
+    apply to all of them. See the module documentation about high_water.
+    """
+
+    def __init__(self, address, map=None, chunk_size=65536, high_water=262144,
+                 **export_options):
+        asyncore.dispatcher.__init__(self, map=map)
+        self.map = map
+        self.chunk_size = chunk_size
+        self.high_water = high_water
+        self.exporter = HtmlExporter(**export_options)
+
+        if isinstance(address, tuple):
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        else:
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            if os.path.exists(address):
+                os.remove(address)
+        self.bind(address)
+        self.listen(16)
+
+        self.address = self.socket.getsockname()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            _RenderChannel(pair[0], self)
+
+    def close(self):
+        """Stop accepting connections. The open ones are still served"""
+        asyncore.dispatcher.close(self)
+        if not isinstance(self.address, tuple) and \
+           os.path.exists(self.address):
+            os.remove(self.address)
@@ -0,0 +1,321 @@
+"""
+A long-running html render server, and its client.
+
+Editors and other tools which convert documents often can keep a server
+running instead of starting an interpreter for every conversion. The parsed
+files and the html of inline text stay cached between requests.
+
+The server listens on a Unix socket, or a TCP port on localhost: requests can
+name any file the server can read, so other hosts mustn't reach it. A connection
+carries any number of requests, which can be sent without waiting for the
+previous responses (pipelining). They are converted by a bounded pool of
+worker threads, and the responses are sent in the order of the requests.
+
+Every request and response is a line with a JSON object, followed by a body
+of the length it gives:
+
+  request    {"length": n, "options": {...}} and n bytes of org text, or
+             {"path": "file.org", "options": {...}} without a body.
+             "options" is optional, see EXPORT_OPTIONS
+  response   {"length": n} and n bytes of html, or {"error": "message"}
+
+"""
+
+import json
+import os
+import Queue
+import socket
+import SocketServer
+import threading
+from multiprocessing.pool import ThreadPool
+
+from orgpython.export.html import HtmlExporter, InlineCache, _LRUCache
+from orgpython.parser.parser import parse
+
+# The export options a request can set. The caches are the server's
+EXPORT_OPTIONS = ('hl_offset', 'remove_empty_p')
+
+
+def parse_address(address):
+    """Return the socket address for 'host:port', or ':port' for localhost,
+    and the path of a Unix socket otherwise
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host or 'localhost', int(port)
+    return address
+
+
+def _check_loopback(host):
+    """Raise ValueError unless every address of host is a loopback one"""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None)]
+    except socket.gaierror, e:
+        raise ValueError('Unknown host %r: %s' % (host, e))
+
+    for address in addresses:
+        if not (address.startswith('127.') or address == '::1'):
+            raise ValueError('The render server only listens on localhost, '
+                             'not on %r' % host)
+
+
+def _read_message(rfile):
+    """Read a header and its body from rfile. Returns (None, None) at the end
+    of the stream.
+    """
+    line = rfile.readline()
+    if not line:
+        return None, None
+
+    header = json.loads(line)
+    if not isinstance(header, dict):
+        raise ValueError('The header must be a JSON object')
+
+    body = None
+    if 'length' in header:
+        length = header['length']
+        if not isinstance(length, (int, long)) or length < 0:
+            raise ValueError('Invalid length %r' % (length,))
+
+        body = rfile.read(length)
+        if len(body) != length:
+            raise ValueError('Truncated message')
+
+    return header, body
+
+
+def _write_message(wfile, header, body=None):
+    if body is not None:
+        header['length'] = len(body)
+    wfile.write(json.dumps(header) + '\n')
+    if body is not None:
+        wfile.write(body)
+
+
+class _RenderHandler(SocketServer.StreamRequestHandler):
+    """Reads the requests of a connection and queues them on the server's
+    pool, while a thread sends the responses in order
+    """
+
+    def handle(self):
+        server = self.server
+        # the requests being converted. When it is full, no more requests are
+        # read until the oldest one is answered
+        pending = Queue.Queue(server.max_pending)
+
+        writer = threading.Thread(target=self._write_responses,
+                                  args=(pending,))
+        writer.daemon = True
+        writer.start()
+
+        try:
+            while True:
+                try:
+                    header, body = _read_message(self.rfile)
+                except ValueError, e:
+                    # the rest of the stream can't be understood
+                    pending.put(('Invalid request: %s' % e, None))
+                    break
+
+                if header is None:
+                    break
+
+                pending.put((None, server.pool.apply_async(server.render,
+                                                           (header, body))))
+        finally:
+            pending.put(None)
+            writer.join()
+
+    def _write_responses(self, pending):
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+
+            error, result = item
+            if result is not None:
+                html, error = result.get()
+
+            try:
+                if error is None:
+                    _write_message(self.wfile, {}, html)
+                else:
+                    _write_message(self.wfile, {'error': error})
+                self.wfile.flush()
+            except socket.error:
+                # the client went away, the remaining responses are dropped
+                pass
+
+
+class RenderServer(object):
+    """Converts org documents to html for the clients connecting to address,
+    a Unix socket path or a (host, port) tuple, see parse_address.
+
+    The host of a TCP address must be a loopback one, since requests can read
+    any file the server can. Otherwise ValueError is raised.
+
+    Requests are converted by a pool of worker threads, and each connection
+    has at most max_pending requests waiting to be answered. Parsed files,
+    exporters and the html of inline text are cached for all of them.
+    """
+
+    def __init__(self, address, workers=4, max_pending=64, max_docs=64):
+        if isinstance(address, tuple):
+            _check_loopback(address[0])
+
+        self.max_pending = max_pending
+        self.pool = ThreadPool(workers)
+        self.requests = 0
+
+        self.inline_cache = InlineCache()
+
+        # path -> (size, modification time, parsed document)
+        self._docs = _LRUCache(max_docs)
+
+        # sorted export options -> HtmlExporter
+        self._exporters = {}
+
+        if isinstance(address, tuple):
+            server_class = _ThreadingTCPServer
+        else:
+            server_class = _ThreadingUnixServer
+            if os.path.exists(address):
+                os.remove(address)
+
+        self._server = server_class(address, _RenderHandler)
+        self._server.render = self.render
+        self._server.pool = self.pool
+        self._server.max_pending = max_pending
+
+        self.address = self._server.server_address
+
+    def _exporter(self, options):
+        for key in options:
+            if key not in EXPORT_OPTIONS:
+                raise ValueError('Unknown export option %r' % key)
+
+        key = tuple(sorted(options.items()))
+        exporter = self._exporters.get(key)
+        if exporter is None:
+            # several threads may create it, with the same result
+            exporter = self._exporters[key] = HtmlExporter(
+                inline_cache=self.inline_cache,
+                **dict((str(name), value) for name, value in key))
+        return exporter
+
+    def _parse_file(self, path):
+        """The document at path, parsed again only if it changed"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        cached = self._docs.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime):
+            return cached[2]
+
+        with open(path, 'r') as f:
+            orgdoc = parse(f)
+        self._docs.put(path, (stat.st_size, stat.st_mtime, orgdoc))
+
+        return orgdoc
+
+    def render(self, header, body):
+        """Convert a request. Returns (html, None), or (None, error)"""
+
+        self.requests += 1
+
+        try:
+            exporter = self._exporter(header.get('options') or {})
+
+            if body is not None:
+                orgdoc = parse(body)
+            elif 'path' in header:
+                orgdoc = self._parse_file(header['path'])
+            else:
+                raise ValueError('The request has no text or path')
+
+            return exporter.to_html(orgdoc), None
+
+        except Exception, e:
+            return None, '%s: %s' % (e.__class__.__name__, e)
+
+    def serve_forever(self):
+        """Serve requests until shutdown() is called from another thread"""
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop serve_forever(), and close the server"""
+        self._server.shutdown()
+        self.close()
+
+    def close(self):
+        self._server.server_close()
+        self.pool.terminate()
+        if not isinstance(self.address, tuple) and \
+           os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class _ThreadingUnixServer(SocketServer.ThreadingMixIn,
+                           SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(SocketServer.ThreadingMixIn,
+                          SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RenderClient(object):
+    """A connection to a RenderServer at address, see RenderServer"""
+
+    def __init__(self, address):
+        if isinstance(address, tuple):
+            self._socket = socket.create_connection(address)
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+
+        self._rfile = self._socket.makefile('rb')
+        self._wfile = self._socket.makefile('wb')
+
+    def send(self, text=None, path=None, **export_options):
+        """Send a request for the html of text, or of the file at path, without
+        waiting for the response. Responses are read with receive(), in the
+        order of the requests.
+
+        The server stops reading requests while it has too many to answer, and
+        the responses wait in the socket until they are received, so requests
+        should be sent in batches of reasonable size.
+        """
+        header = {}
+        if export_options:
+            header['options'] = export_options
+
+        if text is not None:
+            _write_message(self._wfile, header, text)
+        else:
+            header['path'] = os.path.abspath(path)
+            _write_message(self._wfile, header)
+        self._wfile.flush()
+
+    def receive(self):
+        """Return the html for the oldest request without a response. Raises
+        ValueError with the server's message if it couldn't be converted.
+        """
+        header, html = _read_message(self._rfile)
+        if header is None:
+            raise EOFError('The server closed the connection')
+        if 'error' in header:
+            raise ValueError(header['error'])
+        return html
+
+    def render(self, text=None, path=None, **export_options):
+        """Return the html for text, or for the file at path"""
+        self.send(text, path, **export_options)
+        return self.receive()
+
+    def close(self):
+        self._wfile.close()
+        self._rfile.close()
+        self._socket.close()
@@ -0,0 +1,221 @@
+"""
+Opt-in instrumentation of parsing and html export.
+
+A Stats object passed to parse() (stats=...) counts the lines of every kind
+and the time spent parsing them, and passed to the exporter (the stats export
+option) counts the nodes of every type, the time spent converting them, and
+the time spent in inline markup conversion. Stats.phase() measures the time
+and peak memory of any part of the work:
+
+    stats = Stats()
+    with stats.phase('parse'):
+        orgdoc = parse(doc, stats=stats)
+    with stats.phase('export'):
+        html = org_to_html(orgdoc, stats=stats)
+    print stats.report()
+
+Without a Stats object, nothing is measured and the usual code runs.
+
+Python 2 has no tracemalloc, so the memory of a phase is the growth of the
+peak resident set size of the process during the phase.
+
+"""
+
+import contextlib
+import resource
+import timeit
+
+from orgpython.parser.parser import PushParser, classify_line, \
+    HeadlineNode, TextNode, ListNode, ListItemNode, CommentNode, HRuleNode
+
+_timer = timeit.default_timer
+
+# The node types counted by the exporter
+_NODE_CLASSES = (HeadlineNode, TextNode, ListNode, ListItemNode, CommentNode,
+                 HRuleNode)
+
+
+def _resident():
+    """Current resident set size, in bytes, or None if it isn't available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except IOError:
+        return None
+
+
+def _peak_resident():
+    """Peak resident set size since _reset_peak() or the start of the process,
+    in bytes
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _reset_peak():
+    """Start measuring the peak resident set size again, where the system
+    allows it. Otherwise the peak is the process', or the parent's for a forked
+    process.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        pass
+
+
+class _ProfilingPushParser(PushParser):
+    """A PushParser which adds the kind and parse time of every line to
+    stats
+    """
+
+    def __init__(self, handler, stats):
+        PushParser.__init__(self, handler)
+        self._stats = stats
+
+    def feed_line(self, line):
+        start = _timer()
+        PushParser.feed_line(self, line)
+        seconds = _timer() - start
+
+        # classified again, outside of the measured time
+        kind = classify_line(line)[0]
+        stats = self._stats
+        stats.line_counts[kind] = stats.line_counts.get(kind, 0) + 1
+        stats.line_seconds[kind] = stats.line_seconds.get(kind, 0.0) + seconds
+
+
+class Stats(object):
+    """Counts and times of parsing and export, see the module documentation.
+    A Stats object isn't thread-safe, use one per thread.
+    """
+
+    def __init__(self):
+        # line kind (see classify_line) -> number of lines, and seconds
+        self.line_counts = {}
+        self.line_seconds = {}
+
+        # node class name -> number of nodes, and seconds spent converting
+        # them, not counting their children
+        self.node_counts = {}
+        self.node_seconds = {}
+
+        # calls to text_to_html, and seconds spent in them
+        self.inline_calls = 0
+        self.inline_seconds = 0.0
+
+        # (name, seconds, peak memory growth in bytes) of every phase
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Measure the time and peak memory of the code in a with block"""
+        _reset_peak()
+        before = _resident()
+        start = _timer()
+        try:
+            yield
+        finally:
+            seconds = _timer() - start
+            if before is None:
+                memory = None
+            else:
+                memory = max(_peak_resident() - before, 0)
+            self.phases.append((name, seconds, memory))
+
+    def push_parser(self, handler):
+        """Return a PushParser reporting to handler, and adding its lines to
+        these stats
+        """
+        return _ProfilingPushParser(handler, self)
+
+    def inline(self, text_to_html):
+        """Return text_to_html, counting its calls and time"""
+        def timed_text_to_html(text, cache=None):
+            start = _timer()
+            html = text_to_html(text, cache)
+            self.inline_seconds += _timer() - start
+            self.inline_calls += 1
+            return html
+        return timed_text_to_html
+
+    def handlers(self, enter_handlers, leave_handlers):
+        """Return copies of the exporter's handler tables which add the number
+        of nodes of every type, and the time spent converting them, to these
+        stats
+        """
+        counts = self.node_counts
+        node_seconds = self.node_seconds
+
+        def timed(name, handler, count):
+            def timed_handler(node):
+                start = _timer()
+                output = handler(node) if handler else None
+                node_seconds[name] = (node_seconds.get(name, 0.0) +
+                                      _timer() - start)
+                if count:
+                    counts[name] = counts.get(name, 0) + 1
+                return output
+            return timed_handler
+
+        # every node is entered, and counted then
+        enter = dict((cls, timed(cls.__name__, enter_handlers.get(cls), True))
+                     for cls in _NODE_CLASSES)
+        leave = dict((cls, timed(cls.__name__, handler, False))
+                     for cls, handler in leave_handlers.items())
+        return enter, leave
+
+    def as_dict(self):
+        """The stats as a dictionary, e.g. to save them as JSON"""
+        return {
+            'lines': dict((kind, {'count': count,
+                                  'seconds': self.line_seconds[kind]})
+                          for kind, count in self.line_counts.items()),
+            'nodes': dict((name, {'count': count,
+                                  'seconds': self.node_seconds.get(name, 0.0)})
+                          for name, count in self.node_counts.items()),
+            'inline': {'calls': self.inline_calls,
+                       'seconds': self.inline_seconds},
+            'phases': [{'name': name, 'seconds': seconds, 'peak_memory': memory}
+                       for name, seconds, memory in self.phases],
+        }
+
+    def report(self):
+        """A readable summary of the stats"""
+        lines = []
+
+        for name, seconds, memory in self.phases:
+            if memory is None:
+                lines.append('%-10s %9.3f s' % (name, seconds))
+            else:
+                lines.append('%-10s %9.3f s  peak memory +%.1f MB' % (
+                    name, seconds, memory / 1048576.0))
+
+        for title, counts, times in (
+                ('line kind', self.line_counts, self.line_seconds),
+                ('node type', self.node_counts, self.node_seconds)):
+            if not counts:
+                continue
+
+            lines.append('')
+            lines.append('%-14s %10s %10s %10s' % (title, 'count', 'seconds',
+                                                   'us each'))
+            for name, seconds in sorted(times.items(), key=lambda item:
+                                        -item[1]):
+                count = counts.get(name, 0)
+                lines.append('%-14s %10d %10.3f %10.2f' % (
+                    name, count, seconds, seconds * 1e6 / (count or 1)))
+
+        if self.inline_calls:
+            lines.append('')
+            lines.append('inline markup: %d calls, %.3f s (part of the node '
+                         'times)' % (self.inline_calls, self.inline_seconds))
+
+        return '\n'.join(lines)
@@ -0,0 +1,204 @@
+"""
+On-disk cache of parsed org files.
+
+Every file gets an entry in the cache directory, named after a hash of its
+path, with the file's size, modification time and content hash, and its tree
+serialized. An entry is used while the size and modification time match, or,
+if only the modification time changed, while the content is the same.
+
+Entries are written to a temporary file and renamed, so processes sharing the
+directory never read a partial entry. The cache is bounded in size by removing
+the least recently used entries.
+
+"""
+
+import hashlib
+import marshal
+import os
+import tempfile
+
+from orgpython.parser import parser, serialize
+from orgpython.parser.parser import parse
+
+
+def _source_stamp(*modules):
+    """A hash of the source of modules"""
+    stamp = hashlib.sha1()
+    for module in modules:
+        path = os.path.splitext(module.__file__)[0] + '.py'
+        if not os.path.exists(path):
+            path = module.__file__
+        with open(path, 'rb') as f:
+            stamp.update(f.read())
+    return stamp.hexdigest()
+
+# Entries written by a different parser or serialization format are not used
+VERSION = '%d-%s' % (serialize.FORMAT_VERSION,
+                     _source_stamp(parser, serialize)[:16])
+
+_SUFFIX = '.orgcache'
+
+
+class ParseCache(object):
+    """A directory of parsed org files, which parse() takes the trees from
+    when the files haven't changed. max_size is the size of the directory, in
+    bytes, above which the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        # estimated size of the directory, None until it is first needed
+        self._size = None
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+    def _entry_path(self, path):
+        name = hashlib.sha1(os.path.abspath(path)).hexdigest()
+        return os.path.join(self.directory, name + _SUFFIX)
+
+    def _read_entry(self, entry_path):
+        """Return the header and the serialized tree of an entry, or None if it
+        can't be read or was written by another version
+        """
+        try:
+            with open(entry_path, 'rb') as f:
+                header = marshal.load(f)
+                if header[0] != VERSION:
+                    return None
+                return header, f.read()
+        except (IOError, EOFError, ValueError, TypeError, IndexError):
+            return None
+
+    def _write_entry(self, entry_path, header, data):
+        """Write an entry, returning its size"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(header, f)
+                f.write(data)
+                size = f.tell()
+            os.rename(tmp_path, entry_path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+        return size
+
+    def parse(self, path):
+        """Return the OrgDoc for the file at path, from the cache if possible"""
+
+        stat = os.stat(path)
+        entry_path = self._entry_path(path)
+        entry = self._read_entry(entry_path)
+        content = None
+
+        if entry:
+            (version, entry_source, size, mtime, digest), data = entry
+
+            if entry_source == os.path.abspath(path) and size == stat.st_size:
+                fresh = mtime == stat.st_mtime
+                if not fresh:
+                    # touched, but possibly not changed
+                    with open(path, 'rb') as f:
+                        content = f.read()
+                    fresh = hashlib.sha1(content).hexdigest() == digest
+                    if fresh:
+                        self._write_entry(entry_path,
+                                          (VERSION, entry_source, size,
+                                           stat.st_mtime, digest), data)
+
+                if fresh:
+                    try:
+                        orgdoc = serialize.loads(data)
+                    except (EOFError, ValueError, TypeError):
+                        pass
+                    else:
+                        self.hits += 1
+                        self._touch(entry_path)
+                        return orgdoc
+
+        self.misses += 1
+
+        if content is None:
+            with open(path, 'rb') as f:
+                content = f.read()
+
+        orgdoc = parse(content)
+        data = serialize.dumps(orgdoc)
+
+        # the size and time read before the content, so a change while it was
+        # read makes the entry stale
+        self._added(self._write_entry(entry_path,
+                                      (VERSION, os.path.abspath(path),
+                                       stat.st_size, stat.st_mtime,
+                                       hashlib.sha1(content).hexdigest()),
+                                      data))
+
+        return orgdoc
+
+    def _touch(self, entry_path):
+        """Mark an entry as recently used"""
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            # removed by another process
+            pass
+
+    def _entries(self):
+        """Return (last use, size, path) for the entries in the directory"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                entry_path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        return entries
+
+    def _added(self, size):
+        """Account for a new entry, and remove the least recently used ones if
+        the directory is too big
+        """
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self._entries())
+        else:
+            self._size += size
+
+        if self._size <= self.max_size:
+            return
+
+        # Other processes may have added and removed entries, so the estimate
+        # is corrected. Entries are removed until there is some room, to avoid
+        # doing this again for the next one
+        entries = sorted(self._entries())
+        self._size = sum(entry[1] for entry in entries)
+
+        for mtime, size, entry_path in entries:
+            if self._size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """Remove all the entries"""
+        for mtime, size, entry_path in self._entries():
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        self._size = 0
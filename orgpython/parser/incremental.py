@@ -0,0 +1,326 @@
+"""
+Incremental re-parsing of edited org documents.
+
+The parser never looks ahead, and a headline closes everything open before it,
+so the nodes built for a headline's subtree only depend on the subtree's lines
+and the headline's level. After an edit, only the smallest subtree enclosing
+the changed lines has to be parsed again, as long as it still is a single
+subtree of the same level. Comments and options always belong to the document
+root, so subtrees which have them are only re-parsed from the top level.
+
+An EditableDoc keeps the source lines of every section for this, and the
+number of lines of every subtree to find the one enclosing an edit.
+
+"""
+
+from orgpython.parser.parser import OrgDoc, HeadlineNode, CommentNode, \
+    PushParser, TreeBuilder, classify_line, content_hashes, _OPTION_RE, \
+    _lines
+
+
+class EditableDoc(OrgDoc):
+    """An OrgDoc which can be edited with reparse(). Created by
+    parse_editable().
+    """
+
+    def __init__(self):
+        OrgDoc.__init__(self)
+
+        # headline -> its source lines, from its own line to its first
+        # sub-headline. For the root, the lines before the first headline
+        self._body = {}
+
+        # headline -> number of lines of its subtree
+        self._nlines = {self.root: 0}
+
+        # headline -> content hash of its subtree, for the subtrees which
+        # haven't changed since they were computed
+        self._hashes = {}
+
+    def lines(self):
+        """The source lines of the document"""
+        return _subtree_lines(self._body, self.root)
+
+    def content_hashes(self):
+        """The content hashes of the headlines in the document. They are kept
+        between calls, and reparse() forgets those of the subtrees it changes,
+        so the tree must not be modified otherwise.
+        """
+        return content_hashes(self.root, self._hashes)
+
+
+class _LineBuilder(TreeBuilder):
+    """A TreeBuilder which records the line number of every headline"""
+
+    def __init__(self, orgdoc):
+        TreeBuilder.__init__(self, orgdoc)
+        self.lineno = 0
+        self.starts = []
+
+    def enter(self, kind, value):
+        TreeBuilder.enter(self, kind, value)
+
+        if kind == 'headline':
+            self.starts.append((self.headline, self.lineno))
+            # the sections aren't used
+            del self.sections[:]
+
+
+def _parse_lines(lines, orgdoc, body, nlines):
+    """Parse lines into orgdoc, adding the source lines and sizes of its
+    headlines to body and nlines. The lines before the first headline are
+    returned instead.
+    """
+
+    builder = _LineBuilder(orgdoc)
+    push_parser = PushParser(builder)
+
+    for lineno, line in enumerate(lines):
+        builder.lineno = lineno
+        push_parser.feed_line(line)
+    push_parser.close()
+
+    starts = builder.starts
+    ends = [start for headline, start in starts[1:]] + [len(lines)]
+
+    # open subtrees, as (level, headline, start). Levels are increasing
+    stack = []
+
+    for (headline, start), end in zip(starts, ends):
+        body[headline] = lines[start:end]
+
+        while stack and stack[-1][0] >= headline.level:
+            level, node, node_start = stack.pop()
+            nlines[node] = start - node_start
+
+        stack.append((headline.level, headline, start))
+
+    for level, node, node_start in stack:
+        nlines[node] = len(lines) - node_start
+
+    if starts:
+        return lines[:starts[0][1]]
+    return lines
+
+
+def _headlines(nodes):
+    """Iterate over the headlines in the subtrees under nodes, in document
+    order
+    """
+    stack = [iter(nodes)]
+    while stack:
+        for node in stack[-1]:
+            if node.__class__ is HeadlineNode:
+                yield node
+                stack.append(iter(node.children))
+                break
+        else:
+            stack.pop()
+
+
+def _subtree_lines(body, headline):
+    lines = list(body[headline])
+    for node in _headlines(headline.children):
+        lines.extend(body[node])
+    return lines
+
+
+def _update_options(orgdoc):
+    """Set the document options from the option lines, which are kept as
+    comments in the root
+    """
+    orgdoc.options.clear()
+    for node in orgdoc.root.children:
+        if node.__class__ is CommentNode:
+            match = _OPTION_RE.match('#' + node.text)
+            if match:
+                orgdoc.options[match.group(1)] = match.group(2).strip()
+
+
+def parse_editable(doc):
+    """Parse an org document, either a string or a file handle, like parse(),
+    into an EditableDoc.
+    """
+    orgdoc = EditableDoc()
+    lines = list(_lines(doc))
+
+    orgdoc._body[orgdoc.root] = _parse_lines(lines, orgdoc, orgdoc._body,
+                                             orgdoc._nlines)
+    orgdoc._nlines[orgdoc.root] = len(lines)
+
+    return orgdoc
+
+
+def _is_subtree(lines, level):
+    """Check whether lines are the source of a single subtree with a headline
+    of the given level. Returns a tuple (is subtree, has comments).
+    """
+    if not lines:
+        return False, False
+
+    kind, groups = classify_line(lines[0])
+    if kind != 'HEADLINE' or len(groups[0]) != level:
+        return False, False
+
+    comments = False
+    for line in lines[1:]:
+        first = line[:1]
+        if first == '*':
+            kind, groups = classify_line(line)
+            if kind == 'HEADLINE' and len(groups[0]) <= level:
+                return False, False
+        elif first == '#':
+            comments = True
+
+    return True, comments
+
+
+def _new_lines(text):
+    """Split text in lines as the parser does"""
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def reparse(orgdoc, start, end, text):
+    """Replace the lines start to end (excluded) of the EditableDoc orgdoc with
+    text, which may have any number of lines, and update its tree.
+
+    Only the smallest headline subtree enclosing the edit is parsed again, and
+    the tree is the same as if the whole document was. Returns the set of
+    nodes which were replaced, each with its subtree.
+    """
+    body = orgdoc._body
+    nlines = orgdoc._nlines
+    root = orgdoc.root
+
+    if not 0 <= start <= end <= nlines[root]:
+        raise ValueError('Invalid line range %d-%d' % (start, end))
+
+    new_lines = _new_lines(text)
+    delta = len(new_lines) - (end - start)
+
+    # The headlines enclosing the edit, outermost first, as (headline, line)
+    enclosing = []
+    headline, line = root, 0
+    while headline:
+        enclosing.append((headline, line))
+
+        child_line = line + len(body[headline])
+        parent, headline = headline, None
+        for child in parent.children:
+            if child.__class__ is not HeadlineNode:
+                continue
+            if child_line > start:
+                break
+            if end <= child_line + nlines[child]:
+                headline, line = child, child_line
+                break
+            child_line += nlines[child]
+
+    for headline, line in reversed(enclosing[1:]):
+        lines = _subtree_lines(body, headline)
+
+        # '#' lines are comments and options, which belong to the root
+        comments = _has_comments(lines[start - line:end - line] + new_lines)
+        lines[start - line:end - line] = new_lines
+
+        is_subtree, has_comments = _is_subtree(lines, headline.level)
+        top = headline.parent is root
+        if not is_subtree or (comments or has_comments) and not top:
+            continue
+
+        # Parse the new subtree on its own
+        new_doc = OrgDoc()
+        _parse_lines(lines, new_doc, body, nlines)
+
+        parent = headline.parent
+        index = parent.children.index(headline)
+        last = index + 1
+        if top:
+            # the comments of the subtree follow it in the root
+            last = _next_headline(root.children, last)
+
+        replaced = parent.children[index:last]
+        _replace(orgdoc, parent, index, last, new_doc.root.children)
+
+        while parent is not None:
+            nlines[parent] += delta
+            orgdoc._hashes.pop(parent, None)
+            parent = parent.parent
+
+        if comments:
+            _update_options(orgdoc)
+
+        return set(replaced)
+
+    preamble = body[root]
+    if end <= len(preamble):
+        lines = preamble[:start] + new_lines + preamble[end:]
+        if not any(l[:1] == '*' and classify_line(l)[0] == 'HEADLINE'
+                   for l in new_lines):
+            # Only the text before the first headline changes
+            new_doc = OrgDoc()
+            _parse_lines(lines, new_doc, body, nlines)
+
+            last = _next_headline(root.children, 0)
+            replaced = root.children[:last]
+            _replace(orgdoc, root, 0, last, new_doc.root.children)
+
+            body[root] = lines
+            nlines[root] += delta
+            orgdoc._hashes.pop(root, None)
+            if _has_comments(preamble[start:end] + new_lines):
+                _update_options(orgdoc)
+
+            return set(replaced)
+
+    # Parse the whole document again
+    lines = _subtree_lines(body, root)
+    lines[start:end] = new_lines
+
+    replaced = root.children[:]
+    _replace(orgdoc, root, 0, len(replaced), [])
+
+    body.clear()
+    nlines.clear()
+    orgdoc._hashes.clear()
+    body[root] = _parse_lines(lines, orgdoc, body, nlines)
+    nlines[root] = len(lines)
+    _update_options(orgdoc)
+
+    return set(replaced)
+
+
+def _has_comments(lines):
+    for line in lines:
+        if line[:1] == '#':
+            return True
+    return False
+
+
+def _next_headline(nodes, index):
+    """The index of the first headline in nodes from index on, or the length of
+    nodes if there is none
+    """
+    while index < len(nodes) and nodes[index].__class__ is not HeadlineNode:
+        index += 1
+    return index
+
+
+def _replace(orgdoc, parent, index, last, nodes):
+    """Replace parent.children[index:last] with nodes, forgetting the
+    headlines in the replaced subtrees
+    """
+    body = orgdoc._body
+    nlines = orgdoc._nlines
+
+    for headline in _headlines(parent.children[index:last]):
+        del body[headline]
+        del nlines[headline]
+        orgdoc._hashes.pop(headline, None)
+
+    for node in nodes:
+        node.parent = parent
+    parent.children[index:last] = nodes
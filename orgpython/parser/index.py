@@ -0,0 +1,201 @@
+"""
+Index of the headlines of large org files, to parse a single section without
+parsing the whole file.
+
+The index has the path of every headline (the text of its ancestors and its
+own, joined by '/'), its level, and the offsets of its subtree in the file. It
+is built with a single scan for the headline lines, and can be saved next to
+the file. A saved index is only used while the file keeps the size and
+modification time it had when the index was built.
+
+"""
+
+import marshal
+import mmap
+import os
+import re
+import tempfile
+
+from orgpython.parser.parser import parse, _HEADLINE_RE
+
+# Changed whenever the saved format changes
+INDEX_VERSION = 1
+
+_SUFFIX = '.orgidx'
+
+# The start of a headline line, and the newline before one
+_HEADLINE_START_RE = re.compile(r'\*+[ \t\r\f\v]')
+_HEADLINE_LINE_RE = re.compile(r'\n(?=\*+[ \t\r\f\v])')
+
+
+class HeadlineIndex(object):
+    """The headlines of the org file filename, which had the given size and
+    modification time. entries is a list of (path, level, start, end) tuples
+    in document order, start and end being the offsets of the headline's
+    subtree.
+    """
+
+    def __init__(self, filename, size, mtime, entries):
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+        self.entries = entries
+
+        # path -> entry. If several headlines have the same path, the first
+        self._paths = {}
+        for entry in reversed(entries):
+            self._paths[entry[0]] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self._paths
+
+    def lookup(self, path):
+        """Return (level, start, end) for the headline at path. Raises
+        KeyError if there isn't one.
+        """
+        path, level, start, end = self._paths[path]
+        return level, start, end
+
+    def is_current(self):
+        """Whether the file still has the size and modification time it had
+        when the index was built
+        """
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    def save(self, index_path=None):
+        """Write the index to index_path, by default next to the file"""
+
+        if index_path is None:
+            index_path = self.filename + _SUFFIX
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path) or '.',
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump((INDEX_VERSION, self.size, self.mtime,
+                              self.entries), f)
+            os.rename(tmp_path, index_path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+
+def _headline_starts(data):
+    """Iterate over the offsets of the headline lines in data"""
+    if _HEADLINE_START_RE.match(data):
+        yield 0
+    for match in _HEADLINE_LINE_RE.finditer(data):
+        yield match.end()
+
+
+def build_index(filename):
+    """Scan the org file filename for its headlines and return their
+    HeadlineIndex
+    """
+
+    with open(filename, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap can't map an empty file
+            data = ''
+
+    try:
+        size = len(data)
+        find = data.find
+        entries = []
+
+        # open headlines, innermost last, as (level, index in entries)
+        stack = []
+
+        for start in _headline_starts(data):
+            end = find('\n', start)
+            if end == -1:
+                end = size
+
+            stars, text = _HEADLINE_RE.match(data[start:end]).groups()
+            level = len(stars)
+
+            while stack and stack[-1][0] >= level:
+                entries[stack.pop()[1]][3] = start
+
+            if stack:
+                path = entries[stack[-1][1]][0] + '/' + text
+            else:
+                path = text
+
+            stack.append((level, len(entries)))
+            entries.append([path, level, start, size])
+
+    finally:
+        if not isinstance(data, str):
+            data.close()
+
+    return HeadlineIndex(filename, stat.st_size, stat.st_mtime,
+                         [tuple(entry) for entry in entries])
+
+
+def load_index(filename, index_path=None):
+    """Return the HeadlineIndex of filename saved to index_path (by default
+    next to the file), or None if there is none or it is out of date
+    """
+
+    if index_path is None:
+        index_path = filename + _SUFFIX
+
+    try:
+        with open(index_path, 'rb') as f:
+            version, size, mtime, entries = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+    if version != INDEX_VERSION:
+        return None
+
+    index = HeadlineIndex(filename, size, mtime, entries)
+    if not index.is_current():
+        return None
+
+    return index
+
+
+def get_index(filename, index_path=None):
+    """Return the HeadlineIndex of filename, loading it if it was saved and is
+    up to date, or building and saving it otherwise
+    """
+
+    index = load_index(filename, index_path)
+    if index is None:
+        index = build_index(filename)
+        index.save(index_path)
+
+    return index
+
+
+def parse_section(path, index):
+    """Parse the subtree of the headline at path, in the file of the
+    HeadlineIndex index, without reading the rest of the file.
+
+    Returns an OrgDoc with the headline as its only top level headline. As in
+    any document, the comments and options of the subtree belong to its root,
+    and options set elsewhere in the file aren't included. Raises KeyError if
+    there is no such headline, and ValueError if the file changed since the
+    index was built.
+    """
+
+    level, start, end = index.lookup(path)
+
+    if not index.is_current():
+        raise ValueError('The index of %s is out of date' % index.filename)
+
+    with open(index.filename, 'rb') as f:
+        f.seek(start)
+        return parse(f.read(end - start))
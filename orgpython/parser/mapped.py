@@ -0,0 +1,112 @@
+"""
+Parsing of memory mapped org files.
+
+parse() reads a file line by line, and keeps a copy of the text of every line
+in the tree. parse_mapped() maps the file instead, finds the line boundaries
+in the mapping, and the nodes only keep the offsets of their text, as LazyText:
+it is decoded when it is first read. A text node keeps a single LazyText for
+all its lines, as long as they are consecutive in the file.
+
+The tree takes little more memory than its structure, and the text stays in
+the page cache, shared by all the processes which map the same file. The
+mapping stays open while any node refers to it.
+
+"""
+
+import mmap
+
+from orgpython.parser.parser import LazyText, PushParser, TreeBuilder, \
+    OrgDoc, parse
+
+
+class _MappedBuilder(TreeBuilder):
+    """A TreeBuilder which gives the nodes the offsets of their text in a
+    buffer instead of the text. start and end are the offsets of the line being
+    parsed, without its newline character.
+    """
+
+    def __init__(self, orgdoc, buffer):
+        TreeBuilder.__init__(self, orgdoc)
+        self.buffer = buffer
+        self.start = 0
+        self.end = 0
+
+    def enter(self, kind, value):
+        TreeBuilder.enter(self, kind, value)
+
+        if kind == 'text':
+            return
+
+        node = self._nodes[-1]
+        if kind == 'headline' or kind == 'item':
+            # the text is the end of the line
+            node._text = LazyText(self.buffer, self.end - len(node._text),
+                                  self.end)
+        elif kind == 'hrule':
+            node._text = LazyText(self.buffer, self.start, self.end)
+        elif kind == 'comment' or kind == 'option':
+            # the line without the leading '#'
+            node._text = LazyText(self.buffer, self.start + 1, self.end)
+
+    def data(self, kind, value):
+        node = self._nodes[-1]
+
+        if kind == 'text':
+            lines = node._lines
+            if not lines:
+                node._lines = LazyText(self.buffer, self.start, self.end)
+            elif lines.__class__ is LazyText and lines.end + 1 == self.start:
+                lines.end = self.end
+            else:
+                # not the next line, e.g. after a comment
+                node.lines.append(value)
+        else:
+            text = node._text
+            if text.__class__ is LazyText and text.end + 1 == self.start:
+                text.end = self.end
+            else:
+                TreeBuilder.data(self, kind, value)
+
+
+def parse_mapped(doc):
+    """Parse an org file, like parse(), memory mapping it. doc is the path of
+    the file, or a file handle of a real file, which is closed.
+
+    The text of the nodes is decoded from the mapping when it is first read.
+    """
+
+    if isinstance(doc, basestring):
+        doc = open(doc, 'rb')
+
+    try:
+        buffer = mmap.mmap(doc.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # mmap can't map an empty file
+        doc.close()
+        return parse('')
+
+    # the mapping keeps its own reference to the file
+    doc.close()
+
+    orgdoc = OrgDoc()
+    builder = _MappedBuilder(orgdoc, buffer)
+    push_parser = PushParser(builder)
+    feed_line = push_parser.feed_line
+    find = buffer.find
+    size = len(buffer)
+
+    start = 0
+    while start < size:
+        end = find('\n', start)
+        if end == -1:
+            end = size
+
+        builder.start = start
+        builder.end = end
+        feed_line(buffer[start:end])
+
+        start = end + 1
+
+    push_parser.close()
+
+    return orgdoc
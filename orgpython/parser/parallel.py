@@ -0,0 +1,129 @@
+"""
+Parallel parsing of large org documents.
+
+A level-1 headline closes every element open before it and always becomes a
+child of the document root, so the parser's state after one doesn't depend on
+what came before. A document can therefore be split just before its level-1
+headlines, the parts parsed independently in worker processes, and the trees
+put back together under a single root. The result is the same as parse().
+
+"""
+
+import mmap
+import multiprocessing
+import re
+
+from orgpython.parser import serialize
+from orgpython.parser.parser import OrgDoc, parse
+
+# The start of a line which the parser takes as a level 1 headline
+_SPLIT_RE = re.compile(r'^\*[ \t\r\f\v]', re.M)
+
+# Parts smaller than this aren't worth sending to a worker
+MIN_PART_SIZE = 1024 * 1024
+
+# The document being parsed, in the worker processes
+_document = None
+
+
+def split_points(text, size):
+    """Return the offsets at which text is split into parts of at least size
+    bytes (except the last one). Every part but the first starts with a level 1
+    headline.
+
+    text can be a string or an mmap.
+    """
+    points = [0]
+
+    while True:
+        match = _SPLIT_RE.search(text, points[-1] + size)
+        if not match:
+            break
+        points.append(match.start())
+
+    points.append(len(text))
+
+    return points
+
+
+def _init_worker(document):
+    global _document
+    _document = document
+
+
+def _parse_part(span):
+    """Parse a part of the document, returning it serialized. Pickling the
+    nodes would take longer than parsing them.
+    """
+    start, end = span
+    return serialize.dumps(parse(_document[start:end]))
+
+
+def _stitch(orgdoc, part):
+    """Add the top level nodes and the options of a parsed part to orgdoc"""
+    part = serialize.loads(part)
+
+    for node in part.root.children:
+        node.parent = orgdoc.root
+    orgdoc.root.children.extend(part.root.children)
+
+    # later options override earlier ones, as in a sequential parse
+    orgdoc.options.update(part.options)
+
+
+def parse_parallel(doc, workers=None, part_size=None):
+    """Parse an org document, like parse(), on a pool of worker processes.
+
+    doc is a string or a file handle, which must be a real file. Files are
+    memory mapped rather than read, and the workers get the document when
+    they start (they are forked), so only the parsed trees are sent between
+    processes.
+
+    The document is split at level 1 headlines into parts of at least
+    part_size bytes. By default there are about four parts per worker, so the
+    work stays balanced, and parts are at least MIN_PART_SIZE. With a single
+    worker, or a single part, the document is parsed with parse() in this
+    process.
+    """
+
+    if isinstance(doc, str):
+        text = doc
+    else:
+        try:
+            text = mmap.mmap(doc.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap can't map an empty file
+            text = ''
+
+    try:
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        if part_size is None:
+            part_size = max(MIN_PART_SIZE, len(text) // (workers * 4))
+
+        points = split_points(text, part_size)
+        spans = zip(points, points[1:])
+
+        if workers == 1 or len(spans) <= 1:
+            return parse(text[:])
+
+        orgdoc = OrgDoc()
+
+        pool = multiprocessing.Pool(workers, _init_worker, (text,))
+        try:
+            # parts are received in order, and added to the tree while the
+            # next ones are being parsed
+            for part in pool.imap(_parse_part, spans):
+                _stitch(orgdoc, part)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    finally:
+        if not isinstance(doc, str):
+            if not isinstance(text, str):
+                text.close()
+            doc.close()
+
+    return orgdoc
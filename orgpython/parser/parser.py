@@ -2,6 +2,10 @@
 This module provides a parser method for org-mode files. It basically performs
 line-by-line parsing and constructs an internal representation of a document.
 
+The parsing itself is done by PushParser, which accepts the document in chunks
+and reports its structure as events. parse() builds a tree out of them with a
+TreeBuilder.
+
 Supported features:
   - Options
   - Comments
@@ -10,11 +14,13 @@ Supported features:
   - Lists
 
 """
+import collections
+import hashlib
 import re
 import StringIO
 
 
-class OrgDoc:
+class OrgDoc(object):
     """An org document"""
     def __init__(self):
         # this is a special Headline, which shouldn't be printed. It is just
@@ -22,16 +28,142 @@ class OrgDoc:
         self.root = HeadlineNode(None, 0, None)
         self.options = {}
 
+        # node -> Span, if the document was parsed with spans=True
+        self.spans = None
+
+        # If the document was parsed with index=True, node class -> nodes of
+        # that class, and (class, level) -> nodes of that class and level for
+        # headlines and lists, in document order. And headline path -> the
+        # first headline with that path, see headline()
+        self.nodes = None
+        self.headline_paths = None
+
     def children(self):
         return self.root.children
 
+    def find_all(self, cls, level=None):
+        """Return the nodes of class cls (not of its subclasses) in document
+        order, only those of the given level if it isn't None.
+
+        If the document was parsed with index=True, this costs only the number
+        of nodes found. Otherwise the whole tree is walked. The index has the
+        nodes created by the parser, and isn't updated when the tree changes.
+        """
+        if self.nodes is not None:
+            return list(self.nodes.get(cls if level is None else (cls, level),
+                                       ()))
+
+        return [node for node in _walk(self.root)
+                if node.__class__ is cls and node is not self.root and
+                (level is None or node.level == level)]
+
+    def headline(self, path):
+        """Return the headline at path: the text of its ancestors and its
+        own, joined by '/'. If several headlines have the same path, the first
+        one. Raises KeyError if there is none.
+
+        See find_all() about parsing with index=True.
+        """
+        if self.headline_paths is not None:
+            return self.headline_paths[path]
+
+        # only the headlines whose path starts the one searched are visited
+        stack = [(headline, headline.text)
+                 for headline in reversed(self.root.headlines())]
+        while stack:
+            headline, headline_path = stack.pop()
+            if headline_path == path:
+                return headline
+            if path.startswith(headline_path + '/'):
+                stack.extend((child, headline_path + '/' + child.text)
+                             for child in reversed(headline.headlines()))
+
+        raise KeyError(path)
+
+    def content_hashes(self):
+        """The content hashes of the headlines in the document, see
+        content_hashes()
+        """
+        return content_hashes(self.root)
+
     def __str__(self):
         return str(self.root)
 
-class OrgNode:
-    """A node"""
+    def write(self, out):
+        """Write the org text of the document to the file-like out"""
+        write_org(self.root, out.write)
+
+def _get_slots_state(self):
+    """The values of the set __slots__ of self and its bases, for pickle: the
+    protocols before 2 refuse objects with __slots__ and no __getstate__
+    """
+    state = {}
+    for cls in self.__class__.__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+    return state
+
+def _set_slots_state(self, state):
+    for name, value in state.items():
+        setattr(self, name, value)
+
+
+class LazyText(object):
+    """The text of a node which hasn't been decoded yet: the bytes start to end
+    of data, which can be a string, an mmap or any other buffer. Nodes decode it
+    the first time their text is read.
+    """
+    __slots__ = ('data', 'start', 'end')
+
+    def __init__(self, data, start, end):
+        self.data = data
+        self.start = start
+        self.end = end
+
+    def decode(self):
+        text = self.data[self.start:self.end]
+        if text.__class__ is not str:
+            if isinstance(text, memoryview):
+                text = text.tobytes()
+            else:
+                text = str(text)
+        return text
+
+    def __getstate__(self):
+        # data can be an mmap, keep only the text's own bytes
+        return {'data': self.decode(), 'start': 0, 'end': self.end - self.start}
+
+    __setstate__ = _set_slots_state
+
+
+def _get_text(self):
+    text = self._text
+    if text.__class__ is LazyText:
+        text = self._text = text.decode()
+    return text
+
+def _set_text(self, text):
+    self._text = text
+
+_text_property = property(_get_text, _set_text, doc="The node's text")
+
+
+class OrgNode(object):
+    """A node
+
+    Nodes define __slots__ to keep their size small in large documents. Only
+    nodes which can have children get a list of their own, leaves share an empty
+    tuple. Their text can be a LazyText, decoded when it is first read.
+    """
+    __slots__ = ('parent',)
+
+    children = ()
+
+    __getstate__ = _get_slots_state
+    __setstate__ = _set_slots_state
+
     def __init__(self, parent):
-        self.children = []
         self.parent = parent
         if parent:
             parent.append(self)
@@ -40,321 +172,1097 @@ class OrgNode:
         self.children.append(child)
 
     def __str__(self):
-        return '\n'.join([str(ch) for ch in self.children])
-        
+        output = []
+        write_org(self, output.append)
+        return ''.join(output)
+
 
 class TextNode(OrgNode):
     """Just text"""
+    __slots__ = ('_lines',)
+
     def __init__(self, parent):
         OrgNode.__init__(self, parent)
-        self.lines = []
+        self._lines = []
+
+    def _get_lines(self):
+        lines = self._lines
+        if lines.__class__ is LazyText:
+            lines = self._lines = lines.decode().split('\n')
+        return lines
+
+    def _set_lines(self, lines):
+        self._lines = lines
+
+    lines = property(_get_lines, _set_lines, doc="The node's lines")
 
     def __str__(self):
         return "\n".join(self.lines)
 
 class CommentNode(OrgNode):
+    __slots__ = ('_text',)
+
+    text = _text_property
+
     def __init__(self, parent, text):
         OrgNode.__init__(self, parent)
-        self.text = text
+        self._text = text
 
     def __str__(self):
         return '#' + self.text
 
     
+class _Outline(list):
+    """The sub-headlines of a headline whose body hasn't been parsed yet, see
+    parse(). body is the LazyText of its lines.
+    """
+    __slots__ = ('body',)
+
+    __getstate__ = _get_slots_state
+    __setstate__ = _set_slots_state
+
+
 class HeadlineNode(OrgNode):
     """A headline"""
+    __slots__ = ('_children', 'level', '_text')
+
+    text = _text_property
+
     def __init__(self, parent, level, text):
+        self._children = []
         OrgNode.__init__(self, parent)
         self.level = level
-        self.text = text
+        self._text = text
 
-    # FIXME: Ugly!
-    def __str__(self):
+    def _get_children(self):
+        children = self._children
+        if children.__class__ is _Outline:
+            children = _parse_body(self)
+        return children
 
-        if self.level != 0:
-            hl_str = self.level * '*' + ' ' + self.text
-        else:
-            hl_str= ''
+    def _set_children(self, children):
+        self._children = children
 
-        children_str = OrgNode.__str__(self)
+    children = property(_get_children, _set_children,
+                        doc="The node's children. A body left for later by "
+                            "parse(outline=True) is parsed when they are "
+                            "first used")
 
-        if children_str != '' and self.level != 0:
-            hl_str += '\n'
+    def append(self, child):
+        self._children.append(child)
+
+    def headlines(self):
+        """The sub-headlines of this headline. Unlike children, this doesn't
+        parse a body left for later by parse(outline=True)
+        """
+        return [child for child in self._children
+                if child.__class__ is HeadlineNode]
 
-        return hl_str + children_str
+    def content_hash(self):
+        """A hash of the content of this headline's subtree, see
+        content_hashes()
+        """
+        return content_hashes(self)[self]
 
 class ListNode(OrgNode):
     """Base class for Lists"""
+    __slots__ = ('children', 'char', 'level', 'ordered')
+
     def __init__(self, parent, char, level):
+        self.children = []
         OrgNode.__init__(self, parent)
         self.char = char
         self.level = level
         self.ordered = char[0].isdigit()
 
 class ListItemNode(OrgNode):
-    
+    __slots__ = ('children', '_text')
+
+    text = _text_property
+
     def __init__(self, parent, text):
+        self.children = []
         OrgNode.__init__(self, parent)
-        self.text = text
-
-    def __str__(self):
-        hl_str = self.parent.level * ' ' + self.parent.char + ' ' + self.text
-        children_str = OrgNode.__str__(self)
+        self._text = text
 
-        if children_str != '':
-            hl_str += '\n'
 
-        return hl_str + children_str
+class HRuleNode(OrgNode):
+    __slots__ = ('_text',)
 
+    text = _text_property
 
-class HRuleNode(OrgNode):
-    
     def __init__(self, parent, text):
         OrgNode.__init__(self, parent)
-        self.text = text
+        self._text = text
 
     def __str__(self):
         return self.text
 
-class LineMatcher:
-    """Helper class for compiling all possible patterns and performing line by
-    line matching.
+def _is_empty(node):
+    """Whether the org text of node is empty. Only the document root, texts
+    without lines or with one empty line, empty rules and lists without items
+    can be, or nodes whose only child is.
+    """
+    while True:
+        cls = node.__class__
+        if cls is TextNode:
+            lines = node.lines
+            return not lines or lines == ['']
+        if cls is HRuleNode:
+            return not node.text
+        if cls is CommentNode or cls is ListItemNode or \
+           cls is HeadlineNode and node.level:
+            return False
+
+        # the root or a list, whose text is only their children's
+        children = node.children
+        if len(children) != 1:
+            return not children
+        node = children[0]
+
+
+def _walk(node):
+    """Iterate over the subtree under node, included, in document order"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+def write_org(node, write):
+    """Pass the org text of the subtree under node to write, in pieces.
+
+    Every node's text is followed by its children's, each child separated
+    from the previous one by a newline. Headlines and list items are separated
+    from their children by a newline too, unless the children's text is
+    empty. There is no newline at the end.
+
+    The tree is traversed with an explicit stack, so deep trees don't hit the
+    recursion limit, and each piece is written once.
     """
-    ## List of regexes
-    RE = {'COMMENT': re.compile(r'^#.*'),
-          'OPTION': re.compile(r'^#\+([A-Z_]+):(.*)$'),
-          'HEADLINE': re.compile(r'^(\*+)\s(.*)$'),
-          'ULIST': re.compile(r'^(\s*)([\+\-\*])\s(.*)$'),
-          'OLIST': re.compile(r'^(\s*)(\d+[\.\)])\s(.*)$'),
-          'HRULE': re.compile(r'^\s*\-{5,}\s*'),
-          'EMPTYLINE': re.compile(r'^\s*$'),
-          'TEXT': re.compile(r'^(\s*)(.*)$'),
-          }
 
-    def __init__(self):
-        self.line = ''
-        self.match = None
+    # iterators over the children of the nodes being written, and whether
+    # the next child is the first one
+    stack = [[iter((node,)), True]]
+
+    while stack:
+        frame = stack[-1]
+
+        for child in frame[0]:
+            # the newline before every child but the first is written with its
+            # text
+            if frame[1]:
+                frame[1] = False
+                sep = ''
+            else:
+                sep = '\n'
+
+            cls = child.__class__
+            if cls is TextNode:
+                write(sep + '\n'.join(child.lines))
+                continue
+            elif cls is CommentNode:
+                write(sep + '#' + child.text)
+                continue
+            elif cls is HRuleNode:
+                write(sep + child.text)
+                continue
+
+            children = child.children
+            if cls is HeadlineNode and child.level != 0:
+                text = sep + child.level * '*' + ' ' + child.text
+            elif cls is ListItemNode:
+                parent = child.parent
+                text = sep + parent.level * ' ' + parent.char + ' ' + child.text
+            else:
+                # the root or a list, written as their children
+                if sep:
+                    write(sep)
+                if children:
+                    stack.append([iter(children), True])
+                    break
+                continue
+
+            if children:
+                if len(children) > 1 or not _is_empty(children[0]):
+                    text += '\n'
+                write(text)
+                stack.append([iter(children), True])
+                break
+
+            write(text)
+        else:
+            stack.pop()
+
 
-    def matches(self, line, linetype):
+# Characters matched by \s in regular expressions
+_WHITESPACE = ' \t\n\r\f\v'
+_DIGITS = '0123456789'
 
-        # We need to reset these, since a matcher can be used multiple times
-        self.line = line
-        self.match = None
+_OPTION_RE = re.compile(r'#\+([A-Z_]+):(.*)$')
+_HEADLINE_RE = re.compile(r'(\*+)\s(.*)$')
+_OLIST_RE = re.compile(r'(\d+[\.\)])\s(.*)$')
 
-        try:
-            pattern = self.RE[linetype]
-            self.match = pattern.match(line)
-        except KeyError:
-            pass
+def classify_line(line):
+    """Decide the type of a line in a single step, dispatching on its first
+    non-blank character and running at most one pattern.
 
-        return self.match
+    Returns a (kind, groups) tuple, kind being the type of the line and groups
+    the captured values:
 
+      OPTION         (key, value), for '#+KEY: value' lines
+      COMMENT        (), for other lines starting with '#'
+      HEADLINE       (stars, text)
+      ULIST, OLIST   (indent, bullet, text), for unordered and ordered items
+      HRULE          (), for rules of five or more dashes
+      EMPTYLINE      (), for lines with only whitespace
+      TEXT           (indent, text), for any other line
+
+    A line which could be several kinds is the first one in this list, e.g.
+    '#+KEY: value' is an option and not a comment, and '  - item' an
+    unordered item and not text.
+    """
+    first = line[:1]
+
+    # Options, comments and headlines must start at the first column
+    if first == '#':
+        match = _OPTION_RE.match(line)
+        if match:
+            return 'OPTION', match.groups()
+        return 'COMMENT', ()
+
+    if first == '*':
+        match = _HEADLINE_RE.match(line)
+        if match:
+            return 'HEADLINE', match.groups()
+
+    text = line.lstrip(_WHITESPACE)
+    if not text:
+        return 'EMPTYLINE', ()
+
+    indent = line[:len(line) - len(text)]
+    first = text[0]
+
+    if first in '+-*':
+        if len(text) > 1 and text[1] in _WHITESPACE:
+            return 'ULIST', (indent, first, text[2:])
+        if text.startswith('-----'):
+            return 'HRULE', ()
+
+    elif first in _DIGITS:
+        match = _OLIST_RE.match(text)
+        if match:
+            return 'OLIST', (indent,) + match.groups()
+
+    return 'TEXT', (indent, text)
+
+
+# The parser keeps a stack of open elements, innermost last, as (kind, level)
+# pairs. Headlines are always at the bottom of the stack, the first one being the
+# document itself (a level 0 headline). The functions below return the index of
+# the element a new node has to be attached to, and all the elements above it
+# are closed.
 
 # TODO: The next three functions are very similar. Try to refactor them
 
-def __find_headline_parent(level, prev):
+def _find_headline_parent(level, stack, prev):
     """Find the parent of a node with the given level in the tree hierarchy, if
-    the previous considered node is prev.
+    the previous considered headline is stack[prev].
     """
-    while level < prev.level:
-        prev = prev.parent
+    while level < stack[prev][1]:
+        prev -= 1
 
     # Determine this node's parent
-    if level > prev.level:
+    if level > stack[prev][1]:
         parent = prev
     else: # Must be level == prev.level because of the first loop
-        parent = prev.parent
+        parent = prev - 1
 
     return parent
 
-def __find_text_parent(level, prev):
-    """Find a parent for a text node in the tree hierarchy"""
+def _find_text_parent(level, stack, prev):
+    """Find a parent for a text node in the tree hierarchy, starting from the
+    list at stack[prev]
+    """
 
     while True:
         # return either the first list item with a lower level, or the first
         # head line
-        if isinstance(prev, ListNode):
-            if prev.level < level:
-                return prev.children[-1]
+        kind = stack[prev][0]
+
+        if kind == 'list':
+            if stack[prev][1] < level:
+                # its last item
+                return prev + 1
             else:
-                prev = prev.parent
+                prev -= 1
 
-        elif isinstance(prev, ListItemNode):
-            prev = prev.parent
+        elif kind == 'item':
+            prev -= 1
 
-        elif isinstance(prev, HeadlineNode):
+        elif kind == 'headline':
             return prev
 
         else:
-            raise Exception("Unandled node type")
+            raise Exception("Unhandled node type")
         
 
-def __find_list_parent(level, parent, char):
-    """Similar to __find_headline_parent, but in this case it tries to find a list's
-    parent. The parent node can either be a ListItemNode or e.g. a
-    HeadlineNode. In the first case we just return the LI's parent, in the
-    second case we create a new ListNode with the --non-list-- parent and return
-    it.
+def _find_list_parent(level, stack, parent):
+    """Similar to _find_headline_parent, but in this case it tries to find a
+    list's parent, starting from the list at stack[parent]. The parent can
+    either be a list item or e.g. a headline. In the first case we just return
+    the item's list, in the second case a new list has to be created under the
+    --non-list-- parent.
+
+    Returns a tuple (index, new), new being True if a new list has to be
+    created under stack[index] and False if stack[index] is the list to add
+    the item to.
     """
-    while level < parent.level:
-        parent = parent.parent
-        if isinstance(parent, ListItemNode):
-            parent = parent.parent
-        elif not isinstance(parent, ListNode):
-            return ListNode(parent, char, level)
+    while level < stack[parent][1]:
+        parent -= 1
+        if stack[parent][0] == 'item':
+            parent -= 1
+        elif stack[parent][0] != 'list':
+            return parent, True
         else:
             raise Exception("ListNode is parent of ListNode!!")
 
     # There is an existing list
-    if parent.level == level:
+    if stack[parent][1] == level:
         # same level as previous list, it is a child
-        return parent
+        return parent, False
 
-    elif parent.level < level:
-        # higher level, create a new list under the last child of the previous
+    elif stack[parent][1] < level:
+        # higher level, create a new list under the last item of the previous
         # list
-        parent = parent.children[-1]
-        return ListNode(parent, char, level)
+        return parent + 1, True
 
     else:
         raise Exception("This shouldn't happen!")
 
 
-    return parent
-    
+def _body_records(node):
+    """Describe the subtree under node, which can't contain headlines, as a
+    list of tuples
+    """
+    records = []
+    stack = [iter((node,))]
+
+    while stack:
+        for node in stack[-1]:
+            cls = node.__class__
+
+            if cls is TextNode:
+                records.append(('T', node.lines))
+            elif cls is ListNode:
+                records.append(('L', node.char, node.level, len(node.children)))
+            elif cls is ListItemNode:
+                records.append(('I', node.text, len(node.children)))
+            else:
+                records.append((cls.__name__, node.text))
 
-def parse(doc):
-    """Parse an org document.
+            if node.children:
+                stack.append(iter(node.children))
+                break
+        else:
+            stack.pop()
 
-    It receives either a string or a file handle, and returns its
-    representation. 
+    return records
+
+
+def content_hashes(headline, hashes=None):
+    """Return a dictionary with a hash of the content of every headline
+    subtree under headline, included.
+
+    The hash is a hex digest which only depends on the headlines and nodes in
+    the subtree, so it is the same for equal subtrees in different trees or
+    documents, and changes when anything in the subtree changes. Sub-headlines
+    are hashed first, and their hashes are part of their parent's.
+
+    hashes may have the hashes of some subtrees, which are taken as unchanged
+    and not traversed again. It is updated with the new ones and returned.
     """
+    if hashes is None:
+        hashes = {}
+    elif headline in hashes:
+        return hashes
+
+    stack = [(headline, iter(headline.children),
+              hashlib.sha1(repr((headline.level, headline.text))))]
+
+    while stack:
+        node, children, content = stack[-1]
+
+        for child in children:
+            if child.__class__ is HeadlineNode:
+                digest = hashes.get(child)
+                if digest is None:
+                    stack.append((child, iter(child.children),
+                                  hashlib.sha1(repr((child.level,
+                                                     child.text)))))
+                    break
+                content.update('H' + digest)
+            else:
+                content.update(repr(_body_records(child)))
+        else:
+            stack.pop()
+            hashes[node] = digest = content.hexdigest()
 
-    if isinstance(doc, str):
-        doc_handle = StringIO.StringIO(doc)
-    else:
-        # Could check for other types, but let's assume doc is a file-like
-        # object
-        doc_handle = doc
+            if stack:
+                stack[-1][2].update('H' + digest)
 
+    return hashes
 
-    orgdoc = OrgDoc()
 
-    matcher = LineMatcher()
+class ContentHandler(object):
+    """Receives the events generated by a PushParser. Override the methods you
+    are interested in.
 
-    prev_node = orgdoc.root
+    The kinds of elements, and the values they come with, are:
 
-    prev_hl = orgdoc.root
-    prev_list = None
-    prev_text = None
-    emptylines = 0
+      headline   (level, text)
+      list       (level, char)
+      item       text
+      text       None, followed by one 'text' data event per line
+      hrule      the line
+      comment    the line without the leading '#'
+      option     (key, value, the line without the leading '#')
 
-    for line in doc_handle:
-    
-        line = line.strip('\n')
+    A list item's text may continue on the next lines, which are reported as
+    'item' data events.
 
-        if matcher.matches(line, 'OPTION'):
-            key = matcher.match.group(1)
-            value = matcher.match.group(2).strip()
-            orgdoc.options[key] = value
+    Comments and options belong to the document itself, like in the tree built
+    by parse(), but their events come inside whatever elements are open at
+    their line, e.g. in the middle of a text. Handlers which keep track of the
+    nesting should not take them as children of the innermost element.
+    """
+    def enter(self, kind, value):
+        pass
 
-            # add the option line to the tree hierarchy to keep all info
-            CommentNode(orgdoc.root, line[1:])
+    def leave(self, kind):
+        pass
+
+    def data(self, kind, value):
+        pass
+
+
+class PushParser(object):
+    """Incremental org parser.
+
+    Chunks of an org document are passed to feed() as they arrive, and the
+    structure found is reported to a ContentHandler as enter/leave/data events,
+    without building any tree. Lines split across chunks are put back together.
+    close() must be called at the end of the document.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+        # pieces of a line whose end hasn't arrived yet
+        self._partial = []
+
+        # open elements, see _find_headline_parent
+        self._stack = [('headline', 0)]
+
+        # indexes in the stack of the current headline, list and node (either
+        # a headline or a list item) new nodes are added to
+        self._hl = 0
+        self._list = None
+        self._node = 0
+
+        # whether the element on top of the stack is a text receiving lines
+        self._text = False
+        self._emptylines = 0
+
+    def feed(self, data):
+        """Parse a chunk of the document"""
+
+        lines = data.split('\n')
+
+        if len(lines) == 1:
+            self._partial.append(data)
+            return
+
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = ''.join(self._partial)
+
+        self._partial = [lines.pop()]
+
+        for line in lines:
+            self.feed_line(line)
+
+    def close(self):
+        """Parse the last line, if it wasn't terminated, and close all open
+        elements
+        """
+        line = ''.join(self._partial)
+        self._partial = []
+
+        if line:
+            self.feed_line(line)
+
+        self._close_above(0)
+
+    def _close_above(self, index):
+        """Leave all the open elements above stack[index]"""
+        stack = self._stack
+        while len(stack) > index + 1:
+            self.handler.leave(stack.pop()[0])
 
-        elif matcher.matches(line, 'COMMENT'):
-            CommentNode(orgdoc.root, line[1:])
+    def feed_line(self, line):
+        """Parse a whole line, without its newline character"""
 
-        elif matcher.matches(line, 'HEADLINE'):
-            level = matcher.match.group(1).count('*')
-            text = matcher.match.group(2)
+        handler = self.handler
+        stack = self._stack
+        kind, groups = classify_line(line)
 
-            parent = __find_headline_parent(level, prev_hl)
+        # comments and options belong to the document, but are reported inside
+        # the open elements, see ContentHandler
+        if kind == 'OPTION':
+            key, value = groups
 
-            headline_node = HeadlineNode(parent, level, text)
-            prev_node = headline_node
-            prev_hl = headline_node
-            prev_list = None
-            prev_text = None
-            emptylines = 0
+            # the option line is also reported to keep all info
+            handler.enter('option', (key, value.strip(), line[1:]))
+            handler.leave('option')
 
-        elif matcher.matches(line, 'ULIST') or matcher.matches(line, 'OLIST'):
-            level = len(matcher.match.group(1))
-            char = matcher.match.group(2)
-            text = matcher.match.group(3)
+        elif kind == 'COMMENT':
+            handler.enter('comment', line[1:])
+            handler.leave('comment')
+
+        elif kind == 'HEADLINE':
+            level = len(groups[0])
+
+            parent = _find_headline_parent(level, stack, self._hl)
+            self._close_above(parent)
+
+            stack.append(('headline', level))
+            handler.enter('headline', (level, groups[1]))
+
+            self._hl = self._node = len(stack) - 1
+            self._list = None
+            self._text = False
+            self._emptylines = 0
+
+        elif kind == 'ULIST' or kind == 'OLIST':
+            indent, char, text = groups
+            level = len(indent)
 
             # If there is no previous list, create a new one
-            if prev_list == None:
-                parent_list = ListNode(prev_node, char, level)
+            if self._list is None:
+                parent, new = self._node, True
             else:
                 # find the correct parent from the previous list
-                parent_list = __find_list_parent(level, prev_list, char)
+                parent, new = _find_list_parent(level, stack, self._list)
+
+            self._close_above(parent)
+
+            if new:
+                stack.append(('list', level))
+                handler.enter('list', (level, char))
+
+            self._list = len(stack) - 1
 
-            list_item = ListItemNode(parent_list, text)
+            stack.append(('item', level))
+            handler.enter('item', text)
 
-            prev_list = parent_list
-            prev_node = list_item
-            prev_text = None
-            emptylines = 0
+            self._node = len(stack) - 1
+            self._text = False
+            self._emptylines = 0
 
-        elif matcher.matches(line, 'EMPTYLINE'):
-            # An empty line starts a new TextNode. We add an empty TextNode to
-            # keep all information. In 'prettified' output those shouldn't be
-            # used. Also, if this is the *second* emptyline in a row, any
-            # current list is ended. We set the prev_node to be a hl (since we
-            # want to forget about the current list)
-            emptylines += 1
-            prev_text = None
+        elif kind == 'EMPTYLINE':
+            # An empty line starts a new text. We add an empty text to keep all
+            # information. In 'prettified' output those shouldn't be used.
+            # Also, if this is the *second* emptyline in a row, any current list
+            # is ended. We set the current node to be a hl (since we want to
+            # forget about the current list)
+            self._emptylines += 1
+            self._text = False
 
-            if emptylines == 2:
-                prev_list = None
-                prev_node = prev_hl
-                emptylines = 0
+            if self._emptylines == 2:
+                self._list = None
+                self._node = self._hl
+                self._emptylines = 0
 
-            TextNode(prev_node)
+            self._close_above(self._node)
+            handler.enter('text', None)
+            handler.leave('text')
 
-        elif matcher.matches(line, 'HRULE'):
+        elif kind == 'HRULE':
             # Horizontal rules break the flow of lists and text
-            HRuleNode(prev_hl, line)
+            self._close_above(self._hl)
+            handler.enter('hrule', line)
+            handler.leave('hrule')
 
-            prev_text = None
-            prev_list = None
-            prev_node = prev_hl
-            emptylines = 0
+            self._text = False
+            self._list = None
+            self._node = self._hl
+            self._emptylines = 0
 
-        elif matcher.matches(line, 'TEXT'):
-            level = len(matcher.match.group(1))
+        else: # TEXT
+            level = len(groups[0])
 
-            if not prev_text:
+            if not self._text:
                 
-                if prev_list:
+                if self._list is not None:
                     # Here we deal with all possible list termination cases that
                     # involve text nodes.
-                    if level <= prev_list.level:
+                    if level <= stack[self._list][1]:
                         # this text node ends the previous list. Either find an
                         # ancestor list with a lower level or a HL node
-                        
-                        parent = __find_text_parent(level, prev_list)
-                        prev_list = None
-                        prev_node = prev_hl
+                        parent = _find_text_parent(level, stack, self._list)
+                        self._list = None
+                        self._node = self._hl
+                    elif self._emptylines == 0:
+                        # if text comes just after list item and there is no
+                        # empty line in between, instead of a text node, this
+                        # will be part of the previous list item text
+                        handler.data('item', line)
+                        return
                     else:
-                        if emptylines == 0:
-                            # if text comes just after list item and there is no
-                            # empty line in between, instead of a text node,
-                            # this will be part of the previous list item text
-                            prev_list.children[-1].text += '\n' + line
-                            continue
-                        else:
-                            parent = prev_node
+                        parent = self._node
                 else:
-                    parent = prev_node
-                                           
-                        
-                prev_text = TextNode(parent)
+                    parent = self._node
+
+                self._close_above(parent)
+                stack.append(('text', level))
+                handler.enter('text', None)
+                self._text = True
+
+            handler.data('text', line)
+            self._emptylines = 0
+
+
+class TreeBuilder(ContentHandler):
+    """A ContentHandler which builds an OrgDoc out of the parser events"""
+
+    def __init__(self, orgdoc=None, index=False):
+        if orgdoc is None:
+            orgdoc = OrgDoc()
+
+        self.orgdoc = orgdoc
+        self.headline = orgdoc.root
+
+        # see OrgDoc.find_all(), and the open headlines and their paths
+        if index:
+            orgdoc.nodes = {}
+            orgdoc.headline_paths = {}
+            self._paths = [(orgdoc.root, None)]
+        self._index = index
+
+        # headlines whose section is complete, see parse_sections
+        self.sections = []
+
+        self._nodes = [orgdoc.root]
+
+        # open list item -> its lines, for the items receiving continuation
+        # lines. They are joined when the item is left, instead of adding them
+        # to its text one by one. An item may still be receiving lines while
+        # a nested one is, so every item keeps its own
+        self._item_lines = {}
+
+    def enter(self, kind, value):
+        parent = self._nodes[-1]
+
+        if kind == 'text':
+            node = TextNode(parent)
+
+        elif kind == 'item':
+            node = ListItemNode(parent, value)
+
+        elif kind == 'list':
+            level, char = value
+            node = ListNode(parent, char, level)
+
+        elif kind == 'headline':
+            # the previous section is complete
+            self.sections.append(self.headline)
+
+            level, text = value
+            node = self.headline = HeadlineNode(parent, level, text)
+
+        elif kind == 'hrule':
+            node = HRuleNode(parent, value)
+
+        elif kind == 'comment':
+            # comments always belong to the document
+            node = CommentNode(self.orgdoc.root, value)
+
+        elif kind == 'option':
+            key, option_value, text = value
+            self.orgdoc.options[key] = option_value
+
+            # add the option line to the tree hierarchy to keep all info
+            node = CommentNode(self.orgdoc.root, text)
+
+        self._nodes.append(node)
+
+        if self._index:
+            self._add_to_index(node, parent)
+
+    def _add_to_index(self, node, parent):
+        nodes = self.orgdoc.nodes
+        cls = node.__class__
+        if cls in nodes:
+            nodes[cls].append(node)
+        else:
+            nodes[cls] = [node]
+
+        if cls is HeadlineNode or cls is ListNode:
+            nodes.setdefault((cls, node.level), []).append(node)
+
+        if cls is HeadlineNode:
+            # the parent of a headline is always a headline
+            paths = self._paths
+            while paths[-1][0] is not parent:
+                paths.pop()
+
+            parent_path = paths[-1][1]
+            if parent_path is None:
+                path = node.text
+            else:
+                path = parent_path + '/' + node.text
+
+            paths.append((node, path))
+            self.orgdoc.headline_paths.setdefault(path, node)
+
+    def leave(self, kind):
+        node = self._nodes.pop()
+        if self._item_lines and node in self._item_lines:
+            node._text = '\n'.join(self._item_lines.pop(node))
+
+    def data(self, kind, value):
+        node = self._nodes[-1]
+        if kind == 'text':
+            # the nodes were created here, so their text isn't lazy
+            node._lines.append(value)
+        elif node in self._item_lines:
+            self._item_lines[node].append(value)
+        else:
+            self._item_lines[node] = [node.text, value]
+
+
+# Where a node and its descendants are in the source: the line numbers of their
+# first line and of the line after their last one (counting from 0), and the
+# offsets of the start of the first line and of the end of the last one,
+# without its newline
+Span = collections.namedtuple('Span', 'start_line end_line start end')
+
+
+class _SpanBuilder(TreeBuilder):
+    """A TreeBuilder which records the Span of every node in orgdoc.spans.
+    line, start and end must be set to the number and offsets of every line
+    before it is fed.
+    """
+
+    def __init__(self, orgdoc=None, index=False):
+        TreeBuilder.__init__(self, orgdoc, index)
+        self.orgdoc.spans = {}
+
+        # no line yet
+        self.line = -1
+        self.start = self.end = 0
+
+        # (line, start) of the open nodes, as in _nodes
+        self._starts = [(0, 0)]
+        # (line after it, end) of the last line of the open nodes. Comments
+        # and options belong to the root, so they don't count
+        self._last = (0, 0)
+
+    def enter(self, kind, value):
+        TreeBuilder.enter(self, kind, value)
+        self._starts.append((self.line, self.start))
+        if kind != 'comment' and kind != 'option':
+            self._last = (self.line + 1, self.end)
+
+    def leave(self, kind):
+        start_line, start = self._starts.pop()
+        if kind == 'comment' or kind == 'option':
+            end_line, end = start_line + 1, self.end
+        else:
+            end_line, end = self._last
+        self.orgdoc.spans[self._nodes[-1]] = Span(start_line, end_line, start,
+                                                  end)
+        TreeBuilder.leave(self, kind)
+
+    def data(self, kind, value):
+        TreeBuilder.data(self, kind, value)
+        self._last = (self.line + 1, self.end)
+
+
+class _EventCollector(ContentHandler):
+
+    def __init__(self):
+        self.events = []
+
+    def enter(self, kind, value):
+        self.events.append(('enter', kind, value))
+
+    def leave(self, kind):
+        self.events.append(('leave', kind, None))
+
+    def data(self, kind, value):
+        self.events.append(('data', kind, value))
+
+
+def _lines(doc):
+    """Iterate over the lines of doc, either a string or a file handle, without
+    their newline characters
+    """
+    if isinstance(doc, str):
+        doc_handle = StringIO.StringIO(doc)
+    else:
+        # Could check for other types, but let's assume doc is a file-like
+        # object
+        doc_handle = doc
 
-            prev_text.lines.append(line)
-            emptylines = 0
+    for line in doc_handle:
+        yield line.strip('\n')
 
     doc_handle.close()
 
+
+def _positioned_lines(doc, builder):
+    """Iterate over the lines of doc like _lines(), setting the line number
+    and offsets of each one on the _SpanBuilder builder
+    """
+    number = -1
+    end = -1
+    for line in _lines(doc):
+        number += 1
+        start = end + 1
+        end = start + len(line)
+        builder.line = number
+        builder.start = start
+        builder.end = end
+        yield line
+
+
+def iterparse(doc):
+    """Parse an org document, either a string or a file handle, generating
+    (event, kind, value) tuples instead of building a tree. event is one of
+    'enter', 'leave' and 'data', see ContentHandler for the rest.
+    """
+    collector = _EventCollector()
+    push_parser = PushParser(collector)
+
+    for line in _lines(doc):
+        push_parser.feed_line(line)
+
+        if collector.events:
+            for event in collector.events:
+                yield event
+            del collector.events[:]
+
+    push_parser.close()
+
+    for event in collector.events:
+        yield event
+
+
+def parse(doc, outline=False, stats=None, spans=False, index=False):
+    """Parse an org document.
+
+    It receives either a string or a file handle, and returns its
+    representation. 
+
+    If outline is True, only the headlines, comments and options are parsed
+    (and the text before the first headline). The body of every headline is
+    kept as it is, and parsed the first time the headline's children are used:
+    the tree is then the same as without outline. HeadlineNode.headlines()
+    gives the sub-headlines without parsing the body.
+
+    If stats, an orgpython.instrument.Stats, is given, the lines of every kind
+    and the time spent parsing them are added to it. Outline parsing isn't
+    measured.
+
+    If spans is True, orgdoc.spans maps every node to its Span: where the node
+    and its descendants are in doc, to slice it for the node's source. The
+    span of a headline or a list includes any comments between its lines.
+    Spans can't be recorded with outline.
+
+    If index is True, the nodes are indexed by type, and the headlines by
+    path, as they are created, for OrgDoc.find_all() and OrgDoc.headline().
+    The index can't be built with outline either.
+    """
+
+    orgdoc = OrgDoc()
+
+    if outline:
+        if spans or index:
+            raise ValueError("Spans and the index can't be recorded with "
+                             "outline")
+        _parse_outline(doc, orgdoc)
+        return orgdoc
+
+    for headline in parse_sections(doc, orgdoc, stats, spans, index):
+        pass
+
     return orgdoc
-    
+
+
+# The headline, comment and option lines, which parse(outline=True) doesn't
+# leave for later. Searching for the newline before them is much faster than
+# for the start of a line
+_OUTLINE_LINE_RE = re.compile(r'\*+[ \t\r\f\v]|#')
+_OUTLINE_RE = re.compile(r'\n(?=\*+[ \t\r\f\v]|#)')
+
+def _outline_starts(text):
+    """Iterate over the offsets of the lines of text matching
+    _OUTLINE_LINE_RE
+    """
+    if _OUTLINE_LINE_RE.match(text):
+        yield 0
+    for match in _OUTLINE_RE.finditer(text):
+        yield match.end()
+
+
+def _parse_outline(doc, orgdoc):
+    """Parse the headlines, comments and options of doc into orgdoc, leaving
+    the body of the headlines for _parse_body
+    """
+
+    if isinstance(doc, str):
+        text = doc
+    else:
+        text = doc.read()
+        doc.close()
+
+    root = orgdoc.root
+    options = orgdoc.options
+    find = text.find
+
+    # open headlines, innermost last
+    stack = [root]
+    # where the body of the last headline starts, None before the first one
+    body_start = None
+
+    for start in _outline_starts(text):
+        end = find('\n', start)
+        if end == -1:
+            end = len(text)
+        line = text[start:end]
+
+        if line[0] == '#':
+            if body_start is None:
+                # parsed with the text before the first headline
+                continue
+
+            option = _OPTION_RE.match(line)
+            if option:
+                key, value = option.groups()
+                options[key] = value.strip()
+            CommentNode(root, line[1:])
+            continue
+
+        if body_start is None:
+            # the text before the first headline is parsed as usual
+            _parse_preamble(text[:start], orgdoc)
+        elif body_start < start:
+            # the previous headline's body ends before this line
+            _add_body(stack[-1], text, body_start, start - 1)
+
+        stars, title = _HEADLINE_RE.match(line).groups()
+        level = len(stars)
+        while stack[-1].level >= level:
+            stack.pop()
+
+        node = HeadlineNode(stack[-1], level, title)
+        node._children = _Outline()
+        stack.append(node)
+        body_start = end + 1
+
+    if body_start is None:
+        _parse_preamble(text, orgdoc)
+        return
+
+    # the last line is empty if the text ends with a newline
+    end = len(text) - 1 if text.endswith('\n') else len(text)
+    if body_start <= end:
+        _add_body(stack[-1], text, body_start, end)
+
+
+def _parse_preamble(text, orgdoc):
+    push_parser = PushParser(TreeBuilder(orgdoc))
+    push_parser.feed(text)
+    push_parser.close()
+
+
+def _add_body(headline, text, start, end):
+    """Keep the lines from start to end of text as the body of headline"""
+    headline._children.body = LazyText(text, start, end)
+
+
+def _parse_body(headline):
+    """Parse the body of a headline left for later by parse(outline=True),
+    returning its children
+    """
+    sub_headlines = headline._children
+    children = headline._children = []
+
+    body = getattr(sub_headlines, 'body', None)
+    if body is not None:
+        builder = TreeBuilder()
+        builder._nodes = [headline]
+
+        push_parser = PushParser(builder)
+        # the parser state is the same as after the headline
+        push_parser._stack = [('headline', headline.level)]
+
+        for line in body.decode().split('\n'):
+            # comments and options were added to the root
+            if line[:1] != '#':
+                push_parser.feed_line(line)
+        push_parser.close()
+
+    children.extend(sub_headlines)
+    return children
+
+
+def parse_sections(doc, orgdoc, stats=None, spans=False, index=False):
+    """Parse an org document into orgdoc, one section at a time.
+
+    This is a generator which yields every HeadlineNode as soon as its section
+    is complete, i.e. when the next headline starts or the document ends. At
+    that point the headline's children are its body (text, lists...), and at
+    most one sub-headline: the one which just started, as the last child. The
+    document root is yielded first, for the text before the first headline.
+
+    Since nothing else is added to a yielded section (except comments, which
+    always go to the root), callers may process it and then detach it from the
+    tree to keep memory bounded.
+
+    stats is an optional orgpython.instrument.Stats, and spans and index are
+    flags, see parse().
+    """
+
+    if spans:
+        builder = _SpanBuilder(orgdoc, index)
+    else:
+        builder = TreeBuilder(orgdoc, index)
+    if stats is None:
+        push_parser = PushParser(builder)
+    else:
+        push_parser = stats.push_parser(builder)
+    sections = builder.sections
+
+    if spans:
+        lines = _positioned_lines(doc, builder)
+    else:
+        lines = _lines(doc)
+
+    for line in lines:
+        push_parser.feed_line(line)
+
+        if sections:
+            for headline in sections:
+                yield headline
+            del sections[:]
+
+    push_parser.close()
+
+    if spans:
+        orgdoc.spans[orgdoc.root] = Span(0, builder.line + 1, 0, builder.end)
+
+    yield builder.headline
@@ -0,0 +1,265 @@
+"""
+Compact binary serialization of parsed org documents, to send them between
+processes and store them in caches.
+
+A document is stored as a flat table of its nodes in pre-order, with the
+number of children of each, and a table of the distinct strings they use. All
+integers are 32 bit little endian:
+
+  header    'ORGT', the format version (16 bits), and the number of nodes,
+            strings and options
+  nodes     3 integers per node: its kind and level (kind | level << 3), its
+            string and its number of children. The string of a text node is
+            its lines joined, or -1 if it has none
+  options   2 strings per option: its name and its value
+  strings   the offset of the end of every string in the string data, followed
+            by the data
+
+Pickling the nodes instead takes longer than parsing them. Here the tables are
+decoded in bulk with the array module, and text can be left undecoded in the
+buffer until it is used, see LazyText.
+
+"""
+
+import array
+import struct
+import sys
+
+from orgpython.parser.parser import OrgDoc, HeadlineNode, TextNode, \
+    ListNode, ListItemNode, CommentNode, HRuleNode, LazyText
+
+# Changed whenever the format changes, so old data isn't misread
+FORMAT_VERSION = 2
+
+_MAGIC = 'ORGT'
+_HEADER = struct.Struct('<4sHIII')
+
+_TEXT, _HEADLINE, _LIST, _ITEM, _COMMENT, _HRULE = range(6)
+
+_KINDS = {
+    TextNode: _TEXT,
+    HeadlineNode: _HEADLINE,
+    ListNode: _LIST,
+    ListItemNode: _ITEM,
+    CommentNode: _COMMENT,
+    HRuleNode: _HRULE,
+}
+
+# The tables are stored little endian
+_SWAP = sys.byteorder == 'big'
+
+assert array.array('i').itemsize == 4
+
+
+def _int_array(data, start, count):
+    """Decode count integers from data, any buffer, at offset start"""
+    table = array.array('i')
+    if count:
+        chunk = data[start:start + count * 4]
+        if chunk.__class__ is not str:
+            if isinstance(chunk, memoryview):
+                chunk = chunk.tobytes()
+            else:
+                chunk = str(chunk)
+        table.fromstring(chunk)
+        if _SWAP:
+            table.byteswap()
+    return table
+
+
+def dumps(orgdoc):
+    """Return the OrgDoc orgdoc serialized as a string"""
+
+    nodes = array.array('i')
+    add = nodes.extend
+
+    # string -> index in the string table
+    indexes = {}
+    strings = []
+
+    def index(text):
+        i = indexes.get(text)
+        if i is None:
+            i = indexes[text] = len(strings)
+            strings.append(text)
+        return i
+
+    kinds = _KINDS
+    count = 0
+    stack = [iter(orgdoc.root.children)]
+
+    while stack:
+        for node in stack[-1]:
+            count += 1
+            kind = kinds[node.__class__]
+
+            if kind == _TEXT:
+                lines = node.lines
+                add((_TEXT, index('\n'.join(lines)) if lines else -1, 0))
+            elif kind == _COMMENT or kind == _HRULE:
+                add((kind, index(node.text), 0))
+            else:
+                if kind == _HEADLINE:
+                    add((_HEADLINE | node.level << 3, index(node.text),
+                         len(node.children)))
+                elif kind == _LIST:
+                    add((_LIST | node.level << 3, index(node.char),
+                         len(node.children)))
+                else:
+                    add((_ITEM, index(node.text), len(node.children)))
+
+                if node.children:
+                    stack.append(iter(node.children))
+                    break
+        else:
+            stack.pop()
+
+    options = array.array('i')
+    for key, value in sorted(orgdoc.options.items()):
+        options.extend((index(key), index(value)))
+
+    offsets = array.array('i')
+    end = 0
+    for text in strings:
+        end += len(text)
+        offsets.append(end)
+
+    if _SWAP:
+        for table in (nodes, options, offsets):
+            table.byteswap()
+
+    return ''.join([_HEADER.pack(_MAGIC, FORMAT_VERSION, count, len(strings),
+                                 len(options) // 2),
+                    nodes.tostring(), options.tostring(), offsets.tostring()] +
+                   strings)
+
+
+def dump(orgdoc, f):
+    """Write the OrgDoc orgdoc serialized to the file f"""
+    f.write(dumps(orgdoc))
+
+
+def loads(data, lazy=False):
+    """Return the OrgDoc serialized in data by dumps(). data can be a string
+    or any buffer, e.g. a memoryview or an mmap.
+
+    If lazy is True, the text of the nodes isn't decoded until it is used, and
+    the nodes keep a reference to data.
+    """
+    try:
+        magic, version, count, nstrings, noptions = \
+            _HEADER.unpack_from(data, 0)
+    except struct.error:
+        raise ValueError('Not a serialized org document')
+    if magic != _MAGIC:
+        raise ValueError('Not a serialized org document')
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported serialization format %r' % (version,))
+
+    offset = _HEADER.size
+    if len(data) < offset + count * 12 + noptions * 8 + nstrings * 4:
+        raise ValueError('Truncated serialized org document')
+
+    nodes = _int_array(data, offset, count * 3)
+    offset += count * 12
+    options = _int_array(data, offset, noptions * 2)
+    offset += noptions * 8
+    offsets = _int_array(data, offset, nstrings)
+    offset += nstrings * 4
+
+    if len(data) != offset + (offsets[-1] if nstrings else 0):
+        raise ValueError('Truncated serialized org document')
+
+    # the strings, as text or as LazyText
+    if lazy:
+        strings = []
+        start = offset
+        for end in offsets:
+            strings.append(LazyText(data, start, offset + end))
+            start = offset + end
+    else:
+        text = LazyText(data, offset, len(data)).decode()
+        strings = []
+        start = 0
+        for end in offsets:
+            strings.append(text[start:end])
+            start = end
+
+    orgdoc = OrgDoc()
+    for i in xrange(0, len(options), 2):
+        key = strings[options[i]]
+        value = strings[options[i + 1]]
+        if lazy:
+            key = key.decode()
+            value = value.decode()
+        orgdoc.options[key] = value
+
+    # The nodes are allocated and filled in directly rather than through their
+    # constructors, which would take as long as the rest of the work
+    new = object.__new__
+
+    parent = orgdoc.root
+    append = parent.children.append
+    # children of parent still to come. The root takes any number of them
+    remaining = -1
+    stack = []
+
+    for i in xrange(0, len(nodes), 3):
+        kind = nodes[i]
+        string = nodes[i + 1]
+        children = nodes[i + 2]
+
+        code = kind & 7
+        if code == _TEXT:
+            node = new(TextNode)
+            if string < 0:
+                node._lines = []
+            elif lazy:
+                node._lines = strings[string]
+            else:
+                node._lines = strings[string].split('\n')
+        elif code == _HEADLINE:
+            node = new(HeadlineNode)
+            node.level = kind >> 3
+            node._text = strings[string]
+            node._children = []
+        elif code == _LIST:
+            node = new(ListNode)
+            node.char = char = strings[string]
+            if lazy:
+                node.char = char = char.decode()
+            node.level = kind >> 3
+            node.ordered = char[0].isdigit()
+            node.children = []
+        elif code == _ITEM:
+            node = new(ListItemNode)
+            node._text = strings[string]
+            node.children = []
+        elif code == _COMMENT:
+            node = new(CommentNode)
+            node._text = strings[string]
+        elif code == _HRULE:
+            node = new(HRuleNode)
+            node._text = strings[string]
+        else:
+            raise ValueError('Invalid node kind %d' % code)
+
+        node.parent = parent
+        append(node)
+        remaining -= 1
+
+        if children:
+            stack.append((parent, append, remaining))
+            parent = node
+            append = node.children.append
+            remaining = children
+        else:
+            while remaining == 0:
+                parent, append, remaining = stack.pop()
+
+    return orgdoc
+
+
+def load(f, lazy=False):
+    """Return the OrgDoc serialized to the file f by dump()"""
+    return loads(f.read(), lazy)
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orgpython.parser import parser
+from orgpython.export.html import org_to_html
+from orgpython.export.batch import convert_batch, find_inputs
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.docs = {
+            os.path.join('notes', 'a.org'): '* A\n/text/',
+            os.path.join('notes', 'sub', 'b.org'): '+ one\n+ two',
+            'c.org': '* C\n** C.1\n-----',
+        }
+        for name, org_str in self.docs.items():
+            path = os.path.join(self.tmp, 'in', name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(org_str)
+
+        # not an org file, ignored in directories
+        with open(os.path.join(self.tmp, 'in', 'notes', 'x.txt'), 'w') as f:
+            f.write('x')
+
+        self.inputs = [os.path.join(self.tmp, 'in', 'notes'),
+                       os.path.join(self.tmp, 'in', 'c.org')]
+        self.out = os.path.join(self.tmp, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _assert_outputs(self):
+        outputs = {
+            os.path.join('a.html'): 'notes/a.org',
+            os.path.join('sub', 'b.html'): 'notes/sub/b.org',
+            os.path.join('c.html'): 'c.org',
+        }
+        for html_name, org_name in outputs.items():
+            with open(os.path.join(self.out, html_name)) as f:
+                org_str = self.docs[os.path.join(*org_name.split('/'))]
+                self.assertEqual(f.read(), org_to_html(parser.parse(org_str)))
+
+    def test_find_inputs(self):
+        """Directories should be searched for org files, keeping their
+        structure in the output names
+        """
+
+        self.assertEqual([name for src, name in find_inputs(self.inputs)],
+                         ['a', os.path.join('sub', 'b'), 'c'])
+
+    def test_batch(self):
+        """Every file should be converted, in this process or in a pool"""
+
+        for workers in (1, 2):
+            result = convert_batch(self.inputs, self.out, workers, chunksize=1)
+            self.assertEqual(result.files, 3)
+            self.assertEqual(result.failures, [])
+            self._assert_outputs()
+            shutil.rmtree(self.out)
+
+    def test_cache(self):
+        """Parsed files should be taken from the cache in later batches"""
+
+        cache_dir = os.path.join(self.tmp, 'cache')
+
+        result = convert_batch(self.inputs, self.out, 2, cache_dir=cache_dir)
+        self.assertEqual((result.files, result.cached), (3, 0))
+        shutil.rmtree(self.out)
+
+        result = convert_batch(self.inputs, self.out, 2, cache_dir=cache_dir)
+        self.assertEqual((result.files, result.cached), (3, 3))
+        self._assert_outputs()
+
+    def test_failures(self):
+        """A file that can't be converted should be reported, without stopping
+        the rest
+        """
+
+        missing = os.path.join(self.tmp, 'in', 'missing.org')
+        result = convert_batch([missing] + self.inputs, self.out, 2)
+
+        self.assertEqual(result.files, 4)
+        self.assertEqual([src for src, error in result.failures], [missing])
+        self.assertTrue(result.failures[0][1].startswith('OSError'))
+        self._assert_outputs()
+        self.assertTrue('FAILED %s' % missing in result.summary())
+
+    def test_duplicate_outputs(self):
+        """Inputs with the same output should be reported as failures
+        instead of overwriting each other
+        """
+
+        journal = os.path.join(self.tmp, 'journal')
+        os.makedirs(os.path.join(journal, 'sub'))
+        for name in 'a.org', os.path.join('sub', 'b.org'), 'new.org':
+            with open(os.path.join(journal, name), 'w') as f:
+                f.write('* Journal')
+        os.makedirs(os.path.join(self.tmp, 'loose'))
+        loose = os.path.join(self.tmp, 'loose', 'c.org')
+        with open(loose, 'w') as f:
+            f.write('* Journal')
+
+        for workers in (1, 2):
+            result = convert_batch(self.inputs + [journal, loose], self.out,
+                                   workers, chunksize=1)
+
+            self.assertEqual(result.files, 7)
+            self.assertEqual([src for src, error in result.failures],
+                             sorted([os.path.join(journal, 'a.org'),
+                                     os.path.join(journal, 'sub', 'b.org'),
+                                     loose]))
+            self.assertTrue('already the output of' in result.failures[0][1])
+
+            # the first inputs keep their outputs
+            self._assert_outputs()
+            self.assertTrue(os.path.exists(os.path.join(self.out, 'new.html')))
+            shutil.rmtree(self.out)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orgpython.parser import parser
+from orgpython.parser.cache import ParseCache
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self.path = os.path.join(self.tmp, 'doc.org')
+        self._write('#+TITLE: T\n* A\n- item\n** B\ntext')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, org_str, mtime=None):
+        with open(self.path, 'w') as f:
+            f.write(org_str)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def _assert_parsed(self, cache):
+        orgdoc = cache.parse(self.path)
+        expected = parser.parse(open(self.path).read())
+        self.assertEqual(str(orgdoc), str(expected))
+        self.assertEqual(orgdoc.options, expected.options)
+
+    def test_hits(self):
+        """Files should only be parsed again when they change"""
+
+        cache = ParseCache(self.cache_dir)
+        self._assert_parsed(cache)
+        self._assert_parsed(cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # another process sharing the directory
+        other = ParseCache(self.cache_dir)
+        self._assert_parsed(other)
+        self.assertEqual((other.hits, other.misses), (1, 0))
+
+        # same content and size, but a different modification time
+        os.utime(self.path, (1000, 1000))
+        self._assert_parsed(cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # same size, different content
+        self._write('#+TITLE: U\n* A\n- item\n** B\ntext', mtime=2000)
+        self._assert_parsed(cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        self._write('* Changed')
+        self._assert_parsed(cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_invalid_entries(self):
+        """Entries which can't be read should be ignored and replaced"""
+
+        cache = ParseCache(self.cache_dir)
+        cache.parse(self.path)
+
+        entry, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, entry), 'w') as f:
+            f.write('garbage')
+
+        self._assert_parsed(cache)
+        self._assert_parsed(cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        cache.clear()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_eviction(self):
+        """The least recently used entries should be removed to keep the
+        directory within its size
+        """
+
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(self.tmp, '%d.org' % i))
+            with open(paths[-1], 'w') as f:
+                f.write('* %d\n' % i)
+
+        cache = ParseCache(self.cache_dir)
+        cache.parse(paths[0])
+        entry_size = os.path.getsize(cache._entry_path(paths[0]))
+        cache.clear()
+
+        cache = ParseCache(self.cache_dir, max_size=entry_size * 5 / 2)
+        for path in paths:
+            cache.parse(path)
+
+        entries = os.listdir(self.cache_dir)
+        self.assertEqual(sorted(entries),
+                         sorted(os.path.basename(cache._entry_path(path))
+                                for path in paths[1:]))
+
+if __name__ == '__main__':
+    unittest.main()
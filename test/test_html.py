@@ -1,7 +1,10 @@
+import StringIO
+import threading
 import unittest
 
 from orgpython.parser import parser
-from orgpython.export.html import org_to_html
+from orgpython.export.html import org_to_html, org_to_html_stream, \
+    text_to_html, InlineCache, RenderCache, HtmlExporter
 
 class TestHtml(unittest.TestCase):
 
@@ -108,6 +111,29 @@ class TestHtml(unittest.TestCase):
                           '<p><a href="http://itsahack.com/projects/org-python"\
 >x</a></p>')
 
+        # an external link needs something after ://
+        self._assert_html('[[http://][a]]', '<p><a href="#http://">a</a></p>')
+        self._assert_html('[[[http://][b]]', '<p><a href="#[http://">b</a></p>')
+
+    def test_nested_markup(self):
+        """Formatting can be nested, but is not applied inside links"""
+
+        self._assert_html('*bold /italics/ text*',
+                          '<p><b>bold <i>italics</i> text</b></p>')
+
+        self._assert_html('/abc/*def*', '<p><i>abc</i><b>def</b></p>')
+
+        self._assert_html('/abc//def/', '<p><i>abc</i>/def/</p>')
+
+        self._assert_html('/see [[http://a.com/b][the *site*]] now/',
+                          '<p>/see <a href="http://a.com/b">the *site*</a> now/\
+</p>')
+
+        self._assert_html('*a [[x][y* z]]', '<p>*a <a href="#x">y* z</a></p>')
+
+        self._assert_html('[[[[http://a.com][x]]',
+                          '<p>[[<a href="http://a.com">x</a></p>')
+
     def test_lists(self):
         """Lists should produce <ul>/<ol> and <li> elements"""
 
@@ -149,3 +175,150 @@ class TestHtml(unittest.TestCase):
         self._assert_html('* foo', '<h1>foo</h1>')
 
         self._assert_html('* foo', '<h2>foo</h2>', hl_offset=1)
+
+    def test_stream(self):
+        """Streaming export writes the same HTML as exporting the whole tree"""
+
+        docs = ['', '* Hello', 'Text\n\nText2', '- A\n   - B\n  - C',
+                '#+TITLE: x\ntext\n* A\n- li1\n-----\n** B\n*** C\n* D\ntext',
+                open('test/test.org').read()]
+
+        for org_str in docs:
+            for export_options in [{}, {'remove_empty_p': True}]:
+                out = StringIO.StringIO()
+                org_to_html_stream(org_str, out, **export_options)
+                self.assertEqual(out.getvalue(),
+                                 org_to_html(parser.parse(org_str),
+                                             **export_options))
+
+    def test_inline_cache(self):
+        """Cached inline text should render as uncached, and the least recently
+        used entries should be evicted
+        """
+
+        cache = InlineCache(maxsize=2)
+        org_str = '* A\n/one/\n\n/one/\n+ *two*\n+ *two*\n\n_three_'
+
+        self.assertEqual(org_to_html(parser.parse(org_str), inline_cache=cache),
+                         org_to_html(parser.parse(org_str)))
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(len(cache), 2)
+
+        cache.clear()
+        for text in ('/one/', '*two*', '/one/', '_three_'):
+            text_to_html(text, cache)
+
+        # '*two*' was evicted, '/one/' wasn't
+        self.assertEqual(text_to_html('/one/', cache), '<i>one</i>')
+        self.assertEqual(text_to_html('*two*', cache), '<b>two</b>')
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+        # text without markup isn't cached
+        self.assertEqual(text_to_html('plain', cache), 'plain')
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_inline_cache_threads(self):
+        """A cache shared by several threads should stay within its size and
+        give the right html to all of them
+        """
+
+        cache = InlineCache(maxsize=50)
+        texts = ['/item %d/ and *%d*' % (i, i % 7) for i in range(200)]
+        expected = [text_to_html(text) for text in texts]
+        errors = []
+
+        def render(offset):
+            for i in range(2000):
+                j = (i * 7 + offset) % len(texts)
+                if text_to_html(texts[j], cache) != expected[j]:
+                    errors.append(texts[j])
+
+        threads = [threading.Thread(target=render, args=(n,))
+                   for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(len(cache) <= 50)
+        self.assertEqual(cache.hits + cache.misses, 8 * 2000)
+
+    def test_render_cache(self):
+        """Only the headlines whose subtree changed should be rendered again,
+        and the cached html should depend on the export options
+        """
+
+        org_str = '* A\n/a/\n** A.1\n- x\n** A.2\n* B\n*b*'
+        changed = org_str.replace('- x', '- y')
+        cache = RenderCache()
+
+        for doc_str in (org_str, org_str, changed):
+            doc = parser.parse(doc_str)
+            self.assertEqual(org_to_html(doc, render_cache=cache),
+                             org_to_html(doc))
+
+        # A, A.1, A.2 and B rendered, then all found, then A and A.1 again
+        self.assertEqual((cache.hits, cache.misses), (2 + 1 + 1, 4 + 2))
+
+        doc = parser.parse(org_str)
+        self.assertEqual(org_to_html(doc, hl_offset=1, render_cache=cache),
+                         org_to_html(doc, hl_offset=1))
+        self.assertEqual(cache.misses, 6 + 4)
+        self.assertEqual(cache.hit_rate, 4 / 14.0)
+
+    def test_exporter(self):
+        """An exporter should keep its options between documents"""
+
+        exporter = HtmlExporter(hl_offset=2, remove_empty_p=True)
+        for org_str in ('* A\n\ntext', '** B\n- x'):
+            doc = parser.parse(org_str)
+            self.assertEqual(exporter.to_html(doc),
+                             org_to_html(doc, hl_offset=2, remove_empty_p=True))
+
+        out = StringIO.StringIO()
+        exporter.to_html_stream('* A\n\ntext', out)
+        self.assertEqual(out.getvalue(), '<h3>A</h3><p>text</p>')
+
+        # the module functions don't change it
+        org_to_html(parser.parse('* A'), hl_offset=0)
+        self.assertEqual(exporter.to_html(parser.parse('* A')), '<h3>A</h3>')
+
+    def test_exporter_threads(self):
+        """Threads exporting with different options should each get the html
+        for their own options
+        """
+
+        doc = parser.parse(open('test/test.org').read() + '\n* Z\n\n\ntext')
+        caches = [None, InlineCache(maxsize=20)]
+        options = [dict(hl_offset=offset, remove_empty_p=remove,
+                        inline_cache=cache)
+                   for offset in range(3) for remove in (False, True)
+                   for cache in caches]
+        expected = [org_to_html(doc, hl_offset=option['hl_offset'],
+                                remove_empty_p=option['remove_empty_p'])
+                    for option in options]
+        errors = []
+
+        def export(n):
+            exporter = HtmlExporter(**options[n % len(options)])
+            for i in range(30):
+                if i % 2:
+                    # a new exporter for every document
+                    html = org_to_html(doc, **options[n % len(options)])
+                else:
+                    html = exporter.to_html(doc)
+                if html != expected[n % len(options)]:
+                    errors.append(n)
+
+        threads = [threading.Thread(target=export, args=(n,))
+                   for n in range(2 * len(options))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
@@ -0,0 +1,100 @@
+import random
+import unittest
+
+from orgpython.parser import parser
+from orgpython.parser.incremental import parse_editable, reparse
+from test.trees import dump_tree, random_lines
+
+# Lines of all kinds, with headlines of the levels the edits create and remove
+_LINES = ['* A', '** B', '*** C', '** D', '*\tE', '*', '*bold* text',
+          '# note', '#+TITLE: one', '#+AUTHOR: two', '- item', '  - sub',
+          '1. first', '+ plus', '', '', '-----', 'text', '  indented',
+          ' * star item', 'more text']
+
+
+def _text(lines):
+    return ''.join(line + '\n' for line in lines)
+
+
+class TestIncremental(unittest.TestCase):
+
+    def _assert_parsed(self, orgdoc, lines):
+        expected = parser.parse(_text(lines))
+        self.assertEqual(dump_tree(orgdoc.root), dump_tree(expected.root))
+        self.assertEqual(orgdoc.options, expected.options)
+        self.assertEqual(orgdoc.lines(), lines)
+
+        # the hashes kept from before the edit must be up to date
+        self.assertEqual(orgdoc.content_hashes(),
+                         parser.content_hashes(orgdoc.root))
+
+    def test_section_edit(self):
+        """Editing a section should only replace its subtree"""
+
+        lines = ['* A', 'text', '** A.1', '- item', '** A.2', '* B', 'end']
+        orgdoc = parse_editable(_text(lines))
+        a, b = [node for node in orgdoc.root.children]
+        a1, a2 = a.children[1:]
+
+        replaced = reparse(orgdoc, 3, 4, '- changed\n- and added\n')
+        lines[3:4] = ['- changed', '- and added']
+
+        self.assertEqual(replaced, set([a1]))
+        self.assertTrue(orgdoc.root.children[0] is a)
+        self.assertTrue(a.children[2] is a2)
+        self._assert_parsed(orgdoc, lines)
+
+        # a headline which changes level takes its parent with it
+        replaced = reparse(orgdoc, 5, 6, '*** A.2\n')
+        lines[5] = '*** A.2'
+
+        self.assertEqual(replaced, set([a]))
+        self._assert_parsed(orgdoc, lines)
+
+        # and going up to the top level, the whole document
+        top = set(orgdoc.root.children)
+        replaced = reparse(orgdoc, 5, 6, '* A.2\n')
+        lines[5] = '* A.2'
+
+        self.assertEqual(replaced, top)
+        self._assert_parsed(orgdoc, lines)
+
+    def test_options(self):
+        """Options added or removed anywhere should be updated"""
+
+        lines = ['#+TITLE: one', '* A', '** B', 'text']
+        orgdoc = parse_editable(_text(lines))
+
+        reparse(orgdoc, 3, 3, '#+TITLE: two\n')
+        lines[3:3] = ['#+TITLE: two']
+        self._assert_parsed(orgdoc, lines)
+        self.assertEqual(orgdoc.options, {'TITLE': 'two'})
+
+        reparse(orgdoc, 3, 4, '')
+        del lines[3]
+        self._assert_parsed(orgdoc, lines)
+        self.assertEqual(orgdoc.options, {'TITLE': 'one'})
+
+        self.assertRaises(ValueError, reparse, orgdoc, 3, 5, '')
+
+    def test_random_edits(self):
+        """Any sequence of edits should give the same tree as parsing the
+        edited document
+        """
+
+        rand = random.Random(0)
+        for _ in range(300):
+            lines = random_lines(rand, _LINES)
+            orgdoc = parse_editable(_text(lines))
+
+            for _ in range(10):
+                start = rand.randint(0, len(lines))
+                end = rand.randint(start, min(len(lines), start + 3))
+                new_lines = random_lines(rand, _LINES, 3)
+
+                reparse(orgdoc, start, end, _text(new_lines))
+                lines[start:end] = new_lines
+                self._assert_parsed(orgdoc, lines)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orgpython.parser import parser
+from orgpython.parser.index import build_index, load_index, get_index, \
+    parse_section
+
+_DOC = ('#+TITLE: archive\nintro\n'
+        '* Projects\n'
+        '** Foo\ntext\n'
+        '*** Notes\n- one\n- two\n# comment\n'
+        '** Bar\n*bold*\n'
+        '* Projects\n** Foo\nsecond\n'
+        '* Misc\n\n-----\n')
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'archive.org')
+        with open(self.path, 'w') as f:
+            f.write(_DOC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        """Every headline should be indexed with the offsets of its subtree"""
+
+        index = build_index(self.path)
+        self.assertEqual([entry[:2] for entry in index.entries],
+                         [('Projects', 1), ('Projects/Foo', 2),
+                          ('Projects/Foo/Notes', 3), ('Projects/Bar', 2),
+                          ('Projects', 1), ('Projects/Foo', 2), ('Misc', 1)])
+
+        level, start, end = index.lookup('Projects/Foo')
+        self.assertEqual(_DOC[start:end], '** Foo\ntext\n*** Notes\n- one\n'
+                                          '- two\n# comment\n')
+        level, start, end = index.lookup('Misc')
+        self.assertEqual(_DOC[start:end], '* Misc\n\n-----\n')
+
+        self.assertTrue('Projects/Bar' in index)
+        self.assertFalse('Bar' in index)
+        self.assertRaises(KeyError, index.lookup, 'Bar')
+
+        with open(self.path, 'w') as f:
+            f.write('* A')
+        self.assertEqual(build_index(self.path).entries, [('A', 1, 0, 3)])
+
+    def test_parse_section(self):
+        """A section should be parsed as in the whole document"""
+
+        index = build_index(self.path)
+        orgdoc = parse_section('Projects/Foo', index)
+
+        projects = parser.parse(_DOC).root.children[2]
+        self.assertEqual(str(orgdoc.root.children[0]),
+                         str(projects.children[0]))
+        self.assertEqual(orgdoc.root.children[0].children[1].text, 'Notes')
+        self.assertEqual(orgdoc.root.children[1].text, ' comment')
+
+        self.assertRaises(KeyError, parse_section, 'Projects/Baz', index)
+
+        with open(self.path, 'a') as f:
+            f.write('more\n')
+        self.assertRaises(ValueError, parse_section, 'Projects/Foo', index)
+
+    def test_persist(self):
+        """A saved index should be used until the file changes"""
+
+        self.assertEqual(load_index(self.path), None)
+
+        index = get_index(self.path)
+        self.assertTrue(os.path.exists(self.path + '.orgidx'))
+        self.assertEqual(load_index(self.path).entries, index.entries)
+
+        # a different modification time
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(load_index(self.path), None)
+
+        index = get_index(self.path)
+        self.assertTrue(index.is_current())
+        self.assertEqual(load_index(self.path).mtime,
+                         os.stat(self.path).st_mtime)
+
+        # the same modification time and a different size
+        with open(self.path, 'a') as f:
+            f.write('* New\n')
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(load_index(self.path), None)
+        self.assertTrue('New' in get_index(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import random
+import re
+import time
+import unittest
+
+from orgpython.export.html import text_to_html, _find_links
+
+# Lines crafted to trigger the worst case of a backtracking implementation
+_SIZE = 200000
+
+_ADVERSARIAL = {
+    'unclosed emphasis': 'a/' + 'b' * _SIZE,
+    'slashes': '/' * _SIZE,
+    'spaced slashes': '/ ' * (_SIZE // 2),
+    'mixed emphasis': '/*_' * (_SIZE // 3),
+    'backslashes': '\\' * _SIZE,
+    'angle brackets': '<' * _SIZE,
+    'link openings': '[[' * (_SIZE // 2),
+    'unclosed hrefs': '[[a]' * (_SIZE // 4),
+    'unclosed descriptions': '[[a][' * (_SIZE // 5),
+    'log line': ' '.join(['/usr/lib/*_x'] * (_SIZE // 12)),
+}
+
+# Seconds allowed for each line. Far more than a linear scan needs, so they
+# only fail if something becomes quadratic
+_BUDGET = 5.0
+
+
+def _time(text):
+    start = time.time()
+    text_to_html(text)
+    return time.time() - start
+
+
+class TestInlinePerf(unittest.TestCase):
+
+    def test_adversarial_lines(self):
+        """Formatting a pathological line should take time linear in its
+        length
+        """
+
+        for name, text in sorted(_ADVERSARIAL.items()):
+            elapsed = _time(text)
+            self.assertTrue(elapsed < _BUDGET,
+                            '%s took %.2fs' % (name, elapsed))
+
+    def test_scaling(self):
+        """Doubling the length of a line shouldn't much more than double the
+        time to format it
+        """
+
+        for unit in ('[[', '[[a]', '[[a][', '/ '):
+            small = unit * 20000
+            # best of three, to ignore noise on short runs
+            t1 = min(_time(small) for _ in range(3))
+            t2 = min(_time(small * 2) for _ in range(3))
+            self.assertTrue(t2 < 4 * t1 + 0.05,
+                            '%r: %.3fs -> %.3fs' % (unit, t1, t2))
+
+    def test_find_links(self):
+        """The link scanner should find the same links as the regular
+        expression it replaces
+        """
+
+        link_re = re.compile(r'\[\[([^\]]+)\]\[([^\]]+)\]\]')
+        rand = random.Random(0)
+
+        for _ in range(20000):
+            text = ''.join(rand.choice('[]a') for _ in range(rand.randint(0, 14)))
+            expected = [(m.start(), m.end(), m.group(1), m.group(2))
+                        for m in link_re.finditer(text)]
+            self.assertEqual(_find_links(text), expected, text)
+
+if __name__ == '__main__':
+    unittest.main()
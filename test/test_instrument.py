@@ -0,0 +1,64 @@
+import unittest
+
+from orgpython.export.html import org_to_html, org_to_html_stream
+from orgpython.instrument import Stats
+from orgpython.parser import parser
+
+_DOC = '#+TITLE: t\n* A\ntext\n/more/\n\n- item\n  - sub\n# note\n-----\n'
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_parse(self):
+        """Every line should be counted by kind, and the tree not change"""
+
+        stats = Stats()
+        orgdoc = parser.parse(_DOC, stats=stats)
+
+        self.assertEqual(str(orgdoc), str(parser.parse(_DOC)))
+        self.assertEqual(stats.line_counts,
+                         {'OPTION': 1, 'HEADLINE': 1, 'TEXT': 2,
+                          'EMPTYLINE': 1, 'ULIST': 2, 'COMMENT': 1,
+                          'HRULE': 1})
+        self.assertEqual(sorted(stats.line_seconds),
+                         sorted(stats.line_counts))
+
+    def test_export(self):
+        """Every node should be counted by type, and the html not change"""
+
+        orgdoc = parser.parse(_DOC)
+        stats = Stats()
+
+        self.assertEqual(org_to_html(orgdoc, stats=stats), org_to_html(orgdoc))
+        self.assertEqual(stats.node_counts,
+                         {'HeadlineNode': 2, 'CommentNode': 2, 'TextNode': 2,
+                          'ListNode': 2, 'ListItemNode': 2, 'HRuleNode': 1})
+        # the paragraph and the list items
+        self.assertEqual(stats.inline_calls, 4)
+
+    def test_phases(self):
+        """Phases should be measured, and the stats reported"""
+
+        stats = Stats()
+        with stats.phase('parse'):
+            orgdoc = parser.parse(_DOC, stats=stats)
+        with stats.phase('export'):
+            org_to_html(orgdoc, stats=stats)
+
+        self.assertEqual([phase[0] for phase in stats.phases],
+                         ['parse', 'export'])
+        for name, seconds, memory in stats.phases:
+            self.assertTrue(seconds >= 0)
+            self.assertTrue(memory is None or memory >= 0)
+
+        report = stats.report()
+        for name in ('parse', 'export', 'HEADLINE', 'ListItemNode',
+                     'inline markup'):
+            self.assertTrue(name in report, name)
+
+        as_dict = stats.as_dict()
+        self.assertEqual(as_dict['lines']['ULIST']['count'], 2)
+        self.assertEqual(as_dict['nodes']['TextNode']['count'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from orgpython.parser import parser
+from orgpython.parser.mapped import parse_mapped
+from test.trees import dump_tree, random_docs
+
+_LINES = ['* A', '** C', '*bold* text', '# note', '#+TITLE: one', '- item',
+          '  - sub', '1. first', '  more', '', '', '-----', 'text',
+          '  indented', ' * star item', 'dos\r']
+
+
+class TestMapped(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.org')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _parse(self, doc_str):
+        with open(self.path, 'wb') as f:
+            f.write(doc_str)
+        return parse_mapped(self.path)
+
+    def _assert_same(self, doc_str):
+        expected = parser.parse(doc_str)
+        orgdoc = self._parse(doc_str)
+
+        self.assertEqual(dump_tree(orgdoc.root), dump_tree(expected.root))
+        self.assertEqual(orgdoc.options, expected.options)
+
+    def test_same_tree(self):
+        """The tree should be the same as with parse()"""
+
+        self._assert_same('')
+        self._assert_same('\n')
+        self._assert_same(open('test/test.org').read())
+        # lines of a text and a list item separated by comments
+        self._assert_same('text\n# note\nmore\n- item\n#+A: b\n  more\n')
+
+        for doc_str in random_docs(_LINES, 50, max_lines=40):
+            self._assert_same(doc_str)
+
+    def test_lazy(self):
+        """Nodes should keep the offsets of their text in the file"""
+
+        orgdoc = self._parse('* Headline\nsome\ntext\n- item\n  more\n')
+        headline, = orgdoc.root.children
+        text, items = headline.children
+
+        self.assertTrue(isinstance(headline._text, parser.LazyText))
+        self.assertEqual((headline._text.start, headline._text.end), (2, 10))
+        self.assertEqual((text._lines.start, text._lines.end), (11, 20))
+        self.assertEqual(text.lines, ['some', 'text'])
+        self.assertEqual(items.children[0].text, 'item\n  more')
+
+        # a file handle is closed, the mapping stays open
+        f = open(self.path, 'rb')
+        orgdoc = parse_mapped(f)
+        self.assertTrue(f.closed)
+        self.assertEqual(orgdoc.root.children[0].text, 'Headline')
+
+    def test_pickle(self):
+        """Text not decoded yet should be pickled without the mapping"""
+
+        doc_str = open('test/test.org').read()
+        for protocol in (0, 1, 2):
+            orgdoc = self._parse(doc_str)
+            copy = pickle.loads(pickle.dumps(orgdoc, protocol))
+            self.assertEqual(dump_tree(copy.root),
+                             dump_tree(parser.parse(doc_str).root))
+
+if __name__ == '__main__':
+    unittest.main()
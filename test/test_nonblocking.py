@@ -0,0 +1,119 @@
+import asyncore
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from orgpython.export.html import HtmlExporter, org_to_html
+from orgpython.export.nonblocking import AsyncRenderServer, \
+    HtmlPushConverter
+from orgpython.parser import parser
+
+
+class TestNonBlocking(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.map = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def tearDown(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def start(self, address, **options):
+        server = AsyncRenderServer(address, map=self.map, **options)
+
+        def loop():
+            while not self.stopped.is_set():
+                asyncore.loop(0.01, map=self.map, count=1)
+            asyncore.close_all(self.map)
+
+        self.thread = threading.Thread(target=loop)
+        self.thread.start()
+        return server.address
+
+    def render(self, address, org_str, read_delay=0):
+        if isinstance(address, tuple):
+            client = socket.create_connection(address)
+        else:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(address)
+
+        def send():
+            client.sendall(org_str)
+            client.shutdown(socket.SHUT_WR)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        time.sleep(read_delay)
+
+        output = []
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            output.append(data)
+
+        sender.join()
+        client.close()
+        return ''.join(output)
+
+    def test_push_converter(self):
+        """Any chunks should give the html of the whole document, each
+        section as soon as it is complete
+        """
+        org_str = open('test/test.org').read()
+        expected = org_to_html(parser.parse(org_str))
+        exporter = HtmlExporter()
+
+        for size in 1, 7, 100, len(org_str):
+            converter = HtmlPushConverter(exporter)
+            output = [converter.feed(org_str[i:i + size])
+                      for i in range(0, len(org_str), size)]
+            output.append(converter.close())
+            self.assertEqual(''.join(output), expected)
+
+        converter = HtmlPushConverter(exporter)
+        self.assertEqual(converter.feed('* A\ntext\n'), '')
+        self.assertEqual(converter.feed('* B\n'), '<h1>A</h1><p>text</p>')
+        self.assertEqual(converter.close(), '<h1>B</h1>')
+
+    def test_server(self):
+        """Documents should be converted for concurrent clients, also when they
+        read slower than the server converts
+        """
+        org_str = open('test/test.org').read()
+        address = self.start(os.path.join(self.directory, 'render.sock'),
+                             chunk_size=64, high_water=128, hl_offset=1)
+        expected = org_to_html(parser.parse(org_str), hl_offset=1)
+
+        self.assertEqual(self.render(address, org_str), expected)
+        self.assertEqual(self.render(address, ''), '')
+
+        big_str = org_str * 200
+        results = []
+        clients = [threading.Thread(target=lambda delay=delay: results.append(
+            self.render(address, big_str, delay))) for delay in (0, 0.2, 0)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        self.assertEqual(results, [org_to_html(parser.parse(big_str),
+                                               hl_offset=1)] * 3)
+
+    def test_tcp(self):
+        address = self.start(('localhost', 0))
+        self.assertEqual(self.render(address, '* A\n- b'),
+                         '<h1>A</h1><ul><li>b</li></ul>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from orgpython.parser import parser
+from orgpython.parser.parallel import parse_parallel, split_points
+from test.trees import dump_tree, random_docs
+
+_LINES = ['* A', '*\tB', '* ', '** C', '*** D', '*', '*bold* text', '# note',
+          '#+TITLE: one', '#+TITLE: two', '- item', '  - sub', '1. first',
+          '', '', '-----', 'text', '  indented', ' * star item']
+
+
+class TestParallel(unittest.TestCase):
+
+    def _assert_same(self, doc_str, **options):
+        expected = parser.parse(doc_str)
+        orgdoc = parse_parallel(doc_str, **options)
+
+        self.assertEqual(dump_tree(orgdoc.root), dump_tree(expected.root))
+        self.assertEqual(orgdoc.options, expected.options)
+
+    def test_split_points(self):
+        """Documents should only be split before level 1 headlines"""
+
+        doc_str = 'a\n* A\n** B\n*bold*\n*\n* C\n* D\n'
+        self.assertEqual(split_points(doc_str, 1), [0, 2, 20, 24, len(doc_str)])
+        self.assertEqual(split_points(doc_str, 10), [0, 20, len(doc_str)])
+        self.assertEqual(split_points(doc_str, 100), [0, len(doc_str)])
+
+    def test_same_tree(self):
+        """The stitched tree should be the same as a sequential parse"""
+
+        self._assert_same('', workers=2)
+        self._assert_same(open('test/test.org').read(), workers=1, part_size=1)
+        self._assert_same(open('test/test.org').read(), workers=2, part_size=1)
+
+        for i, doc_str in enumerate(random_docs(_LINES, 30, max_lines=40)):
+            self._assert_same(doc_str, workers=2, part_size=i % 50 + 1)
+
+    def test_workers(self):
+        """Parts should be parsed by the worker processes, from strings or
+        files
+        """
+
+        doc_str = open('test/test.org').read() * 20
+        self._assert_same(doc_str, workers=2, part_size=100)
+
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, doc_str)
+            os.close(fd)
+
+            orgdoc = parse_parallel(open(path), workers=2, part_size=100)
+            self.assertEqual(dump_tree(orgdoc.root),
+                             dump_tree(parser.parse(doc_str).root))
+
+            # empty files can't be mapped
+            open(path, 'w').close()
+            orgdoc = parse_parallel(open(path), workers=2)
+            self.assertEqual(orgdoc.root.children, [])
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
+import StringIO
+import pickle
+import sys
 import unittest
 
 from orgpython.parser import parser
+from test.trees import dump_tree, random_docs
 
 
 class TestParser(unittest.TestCase):
@@ -281,7 +285,20 @@ class TestParser(unittest.TestCase):
 
         for l in lr:
             self.assertEqual(l, str(parser.parse(l)))
-            
+
+    def test_continued_nested_items(self):
+        """The continuation lines of an item should be kept while a nested
+        item gets its own
+        """
+        doc_str = '- item\n text\n  - sub\n    more\n- next\n again'
+        doc = parser.parse(doc_str)
+
+        item, next_item = doc.root.children[0].children
+        self.assertEqual(item.text, 'item\n text')
+        self.assertEqual(item.children[0].children[0].text, 'sub\n    more')
+        self.assertEqual(next_item.text, 'next\n again')
+        self.assertEqual(str(doc), doc_str)
+
     def test_options(self):
         """The document may have options in the form #+NAME: VALUE"""
 
@@ -310,3 +327,286 @@ class TestParser(unittest.TestCase):
 
         self.assertEqual(len(doc.children()), 3)
         self.assertEqual(str(doc), doc_str)
+
+    def test_classify_line(self):
+        """Each line is classified in one step, with its captured groups"""
+
+        cases = [('#+TITLE: The title', ('OPTION', ('TITLE', ' The title'))),
+                 ('# comment', ('COMMENT', ())),
+                 ('** Headline', ('HEADLINE', ('**', 'Headline'))),
+                 ('  - item', ('ULIST', ('  ', '-', 'item'))),
+                 ('* ', ('HEADLINE', ('*', ''))),
+                 (' * item', ('ULIST', (' ', '*', 'item'))),
+                 ('12) item', ('OLIST', ('', '12)', 'item'))),
+                 ('12 item', ('TEXT', ('', '12 item'))),
+                 ('  \t', ('EMPTYLINE', ())),
+                 (' ------', ('HRULE', ())),
+                 ('- -----', ('ULIST', ('', '-', '-----'))),
+                 ('**bold**', ('TEXT', ('', '**bold**'))),
+                 ('  #+TITLE: x', ('TEXT', ('  ', '#+TITLE: x'))),
+                 ]
+
+        for line, expected in cases:
+            self.assertEqual(parser.classify_line(line), expected)
+
+    def test_push_parser(self):
+        """Feeding a document in arbitrary chunks builds the same tree as
+        parsing it at once
+        """
+        doc_str = open('test/test.org').read()
+        expected = str(parser.parse(doc_str))
+
+        for size in (1, 2, 7, 100):
+            builder = parser.TreeBuilder()
+            push_parser = parser.PushParser(builder)
+
+            for i in range(0, len(doc_str), size):
+                push_parser.feed(doc_str[i:i + size])
+            push_parser.close()
+
+            self.assertEqual(str(builder.orgdoc), expected)
+            self.assertEqual(builder.orgdoc.options['TITLE'], 'Test Org File')
+
+    def test_iterparse(self):
+        """iterparse generates the structure as enter/leave/data events"""
+
+        doc_str = '* H\n- L1\n continued\n - L2\ntext\n# c'
+        events = list(parser.iterparse(doc_str))
+
+        self.assertEqual(events,
+                         [('enter', 'headline', (1, 'H')),
+                          ('enter', 'list', (0, '-')),
+                          ('enter', 'item', 'L1'),
+                          ('data', 'item', ' continued'),
+                          ('enter', 'list', (1, '-')),
+                          ('enter', 'item', 'L2'),
+                          ('leave', 'item', None),
+                          ('leave', 'list', None),
+                          ('leave', 'item', None),
+                          ('leave', 'list', None),
+                          ('enter', 'text', None),
+                          ('data', 'text', 'text'),
+                          ('enter', 'comment', ' c'),
+                          ('leave', 'comment', None),
+                          ('leave', 'text', None),
+                          ('leave', 'headline', None)])
+
+    def test_content_hash(self):
+        """Equal subtrees have the same hash in any document, and changes in a
+        subtree change its hash and its ancestors'
+        """
+
+        doc = parser.parse('* A\ntext\n** B\n- item\n** C\nmore')
+        a = doc.root.children[0]
+        b, c = a.children[1:]
+        hashes = parser.content_hashes(doc.root)
+
+        other = parser.parse('* D\n** B\n- item\n* E\n** C\nmore\n')
+        other_hashes = parser.content_hashes(other.root)
+        self.assertEqual(other_hashes[other.root.children[0].children[0]],
+                         hashes[b])
+        self.assertEqual(other.root.children[1].children[0].content_hash(),
+                         c.content_hash())
+
+        b.children[0].children[0].text = 'changed'
+        changed = parser.content_hashes(doc.root)
+        self.assertNotEqual(changed[b], hashes[b])
+        self.assertNotEqual(changed[a], hashes[a])
+        self.assertNotEqual(changed[doc.root], hashes[doc.root])
+        self.assertEqual(changed[c], hashes[c])
+
+        # the same text split in two paragraphs
+        self.assertNotEqual(parser.parse('* A\na\nb').root.content_hash(),
+                            parser.parse('* A\na\n\nb').root.content_hash())
+
+    def test_outline(self):
+        """An outline parse gives the headlines, and the same tree once the
+        bodies are parsed
+        """
+
+        doc_str = ('#+TITLE: t\nintro\n- item\n* A\ntext\n# note\nmore\n'
+                   '  - item\n#+AUTHOR: me\n  more\n** B\n\n*** C\n'
+                   '*bold*\n* D\n\n')
+        doc = parser.parse(doc_str, outline=True)
+
+        self.assertEqual(doc.options, {'TITLE': 't', 'AUTHOR': 'me'})
+        a, d = doc.root.headlines()
+        b, = a.headlines()
+        c, = b.headlines()
+        self.assertEqual([h.text for h in (a, b, c, d)], ['A', 'B', 'C', 'D'])
+        self.assertTrue(a._children.__class__ is parser._Outline)
+
+        self.assertEqual(a.children[0].lines, ['text', 'more'])
+        self.assertTrue(a.children[-1] is b)
+        self.assertTrue(a._children.__class__ is list)
+
+        for doc_str in (doc_str, open('test/test.org').read(), '', 'a\nb',
+                        '* A', '* A\n', '* A\n\n', '* A\nb', '#c\n* A\n#d'):
+            expected = parser.parse(doc_str)
+            doc = parser.parse(doc_str, outline=True)
+            self.assertEqual(doc.options, expected.options)
+            self.assertEqual(doc.root.content_hash(),
+                             expected.root.content_hash())
+            self.assertEqual(str(doc), str(expected))
+
+    def test_pickle(self):
+        """A document should come back the same from pickle, whatever the
+        protocol
+        """
+
+        doc_str = open('test/test.org').read()
+        for protocol in (0, 1, 2):
+            for doc in (parser.parse(doc_str),
+                        parser.parse(doc_str, outline=True),
+                        parser.parse(doc_str, spans=True, index=True)):
+                copy = pickle.loads(pickle.dumps(doc, protocol))
+                self.assertEqual(copy.options, doc.options)
+                self.assertEqual(dump_tree(copy.root), dump_tree(doc.root))
+                self.assertEqual(str(copy), str(doc))
+                if doc.spans is not None:
+                    self.assertEqual(copy.spans[copy.root], doc.spans[doc.root])
+                    self.assertEqual(sorted(copy.spans.values()),
+                                     sorted(doc.spans.values()))
+
+    def test_write_org(self):
+        """The org text should be the same as the one built recursively, and
+        deep trees shouldn't hit the recursion limit
+        """
+
+        def recursive_str(node):
+            children_str = '\n'.join(recursive_str(ch) for ch in node.children)
+            if isinstance(node, parser.TextNode):
+                return '\n'.join(node.lines)
+            elif isinstance(node, parser.CommentNode):
+                return '#' + node.text
+            elif isinstance(node, parser.HRuleNode):
+                return node.text
+            elif isinstance(node, parser.HeadlineNode) and node.level:
+                head = node.level * '*' + ' ' + node.text
+            elif isinstance(node, parser.ListItemNode):
+                head = (node.parent.level * ' ' + node.parent.char + ' ' +
+                        node.text)
+            else:
+                return children_str
+            return head + ('\n' if children_str else '') + children_str
+
+        lines = ['* A', '** B', '- item', '  - sub', '1. one', '', '', 'text',
+                 '  more', '# note', '#+TITLE: t', '-----']
+        docs = [open('test/test.org').read(), '', '\n', '* A\n\n', '- a\n\n']
+        docs += random_docs(lines, 300)
+
+        for doc_str in docs:
+            doc = parser.parse(doc_str)
+            expected = recursive_str(doc.root)
+            self.assertEqual(str(doc), expected)
+
+            out = StringIO.StringIO()
+            doc.write(out)
+            self.assertEqual(out.getvalue(), expected)
+
+            for node in doc.root.children:
+                self.assertEqual(str(node), recursive_str(node))
+
+        # lists and headlines nested deeper than the recursion limit
+        depth = sys.getrecursionlimit() * 2
+        doc_str = '\n'.join([' ' * i + '- item %d' % i for i in range(depth)] +
+                            ['*' * (i + 1) + ' hl' for i in range(depth)])
+        self.assertEqual(str(parser.parse(doc_str)), doc_str)
+
+    def test_spans(self):
+        """Every node should have the span of its lines in the source, within
+        the span of its parent
+        """
+
+        lines = ['* A', '** B', '- item', '  - sub', '  more', '1. one', '',
+                 'text', '# note', '#+TITLE: t', '-----']
+        docs = [open('test/test.org').read(), '', '\n', '* A\n\n', 'a\n']
+        docs += random_docs(lines, 300, seed=1)
+
+        for doc_str in docs:
+            doc = parser.parse(doc_str, spans=True)
+            self.assertEqual(str(doc), str(parser.parse(doc_str)))
+            self.assertIsNone(parser.parse(doc_str).spans)
+
+            doc_lines = doc_str.splitlines()
+            self.assertEqual(doc.spans[doc.root],
+                             (0, len(doc_lines), 0, len('\n'.join(doc_lines))))
+
+            nodes = [doc.root]
+            while nodes:
+                node = nodes.pop()
+                span = doc.spans[node]
+                source = doc_str[span.start:span.end]
+                self.assertEqual(
+                    source, '\n'.join(doc_lines[span.start_line:span.end_line]))
+
+                if node.parent is not None:
+                    parent_span = doc.spans[node.parent]
+                    self.assertTrue(parent_span.start <= span.start and
+                                    span.end <= parent_span.end)
+
+                if isinstance(node, parser.TextNode) and '#' not in source:
+                    self.assertEqual(
+                        '\n'.join(l.strip() for l in source.split('\n')),
+                        '\n'.join(l.strip() for l in node.lines))
+                elif isinstance(node, (parser.CommentNode, parser.HRuleNode)):
+                    self.assertEqual(source, str(node))
+                elif isinstance(node, parser.HeadlineNode) and node.level:
+                    self.assertEqual(source.split('\n')[0],
+                                     '*' * node.level + ' ' + node.text)
+
+                nodes.extend(node.children)
+
+        self.assertRaises(ValueError, parser.parse, '* A', outline=True,
+                          spans=True)
+
+    def test_find_all(self):
+        """The indexed queries should find the same nodes as walking the
+        tree
+        """
+
+        lines = ['* A', '** B', '*** C', '** A', '- item', '  - sub', '1. one',
+                 '', 'text', '# note', '#+TITLE: t', '-----']
+        docs = [open('test/test.org').read(), '', '* A\n** B\n* A\n** B\n*** C']
+        docs += random_docs(lines, 200, seed=2)
+
+        queries = [(cls, None) for cls in (
+            parser.HeadlineNode, parser.TextNode, parser.ListNode,
+            parser.ListItemNode, parser.CommentNode, parser.HRuleNode)]
+        queries += [(parser.HeadlineNode, level) for level in (1, 2, 3, 4)]
+        queries += [(parser.ListNode, level) for level in (0, 2)]
+
+        for doc_str in docs:
+            walked = parser.parse(doc_str)
+            indexed = parser.parse(doc_str, index=True)
+            self.assertIsNone(walked.nodes)
+
+            for cls, level in queries:
+                self.assertEqual(
+                    [str(node) for node in indexed.find_all(cls, level)],
+                    [str(node) for node in walked.find_all(cls, level)])
+
+            # the path of every headline finds it, or an earlier one with the
+            # same path
+            for doc in walked, indexed:
+                stack = [(headline, headline.text)
+                         for headline in doc.root.headlines()]
+                while stack:
+                    headline, path = stack.pop()
+                    found = doc.headline(path)
+                    found_path = [found.text]
+                    while found.parent is not doc.root:
+                        found = found.parent
+                        found_path.insert(0, found.text)
+                    self.assertEqual('/'.join(found_path), path)
+                    stack.extend((child, path + '/' + child.text)
+                                 for child in headline.headlines())
+
+                self.assertRaises(KeyError, doc.headline, 'A/missing')
+
+        # A/B/C is only under the second A/B
+        for doc in parser.parse(docs[2]), parser.parse(docs[2], index=True):
+            self.assertIs(doc.headline('A/B/C').parent.parent,
+                          doc.root.children[1])
+            self.assertIs(doc.headline('A/B'),
+                          doc.root.children[0].children[0])
@@ -0,0 +1,79 @@
+import mmap
+import os
+import tempfile
+import unittest
+
+from orgpython.parser import parser, serialize
+from orgpython.export.html import org_to_html
+from test.trees import dump_tree
+
+
+class TestSerialize(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = parser.parse(open('test/test.org').read() +
+                                '\n* Empty\n\n\n  - deep\n 1. one\n-----\n')
+
+    def _assert_same(self, orgdoc):
+        self.assertEqual(dump_tree(orgdoc.root), dump_tree(self.doc.root))
+        self.assertEqual(orgdoc.options, self.doc.options)
+
+    def test_round_trip(self):
+        """A document should load as it was dumped, from any kind of buffer"""
+
+        data = serialize.dumps(self.doc)
+
+        for buf in (data, buffer(data), memoryview(data), bytearray(data)):
+            self._assert_same(serialize.loads(buf))
+            self._assert_same(serialize.loads(buf, lazy=True))
+
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                serialize.dump(self.doc, f)
+
+            with open(path, 'rb') as f:
+                self._assert_same(serialize.load(f))
+
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._assert_same(serialize.loads(mapping, lazy=True))
+        finally:
+            os.remove(path)
+
+        empty = serialize.loads(serialize.dumps(parser.OrgDoc()))
+        self.assertEqual(empty.root.children, [])
+
+    def test_lazy(self):
+        """Text should only be decoded when it is used"""
+
+        orgdoc = serialize.loads(memoryview(serialize.dumps(self.doc)),
+                                 lazy=True)
+        headline = orgdoc.root.children[1]
+
+        self.assertTrue(isinstance(headline._text, parser.LazyText))
+        self.assertEqual(headline.text, self.doc.root.children[1].text)
+        self.assertEqual(headline._text, headline.text)
+
+        self.assertEqual(org_to_html(orgdoc), org_to_html(self.doc))
+
+    def test_compact(self):
+        """The encoding should be smaller than the text of the document, and
+        than a pickle of the tree
+        """
+        import cPickle
+
+        data = serialize.dumps(self.doc)
+        self.assertTrue(len(data) <
+                        len(cPickle.dumps(self.doc, cPickle.HIGHEST_PROTOCOL)))
+
+    def test_invalid(self):
+        """Data which isn't a serialized document should be rejected"""
+
+        data = serialize.dumps(self.doc)
+
+        for invalid in ('', 'ORGT', 'xxxx' + data[4:], data[:-1], data[:40]):
+            self.assertRaises(ValueError, serialize.loads, invalid)
+
+if __name__ == '__main__':
+    unittest.main()
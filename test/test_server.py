@@ -0,0 +1,116 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from orgpython.export.html import org_to_html
+from orgpython.export.server import RenderServer, RenderClient, \
+    parse_address
+from orgpython.parser import parser
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = RenderServer(os.path.join(self.directory, 'render.sock'),
+                                   workers=2, max_pending=4)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:8000'), ('localhost', 8000))
+        self.assertEqual(parse_address(':8000'), ('localhost', 8000))
+        self.assertEqual(parse_address('/tmp/org.sock'), '/tmp/org.sock')
+
+    def test_loopback_only(self):
+        """TCP servers should only listen on localhost"""
+        for host in '0.0.0.0', '', '::':
+            self.assertRaises(ValueError, RenderServer, (host, 0))
+
+        server = RenderServer(('127.0.0.1', 0), workers=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = RenderClient(server.address)
+            self.assertEqual(client.render('* A'), '<h1>A</h1>')
+            client.close()
+        finally:
+            server.shutdown()
+            thread.join()
+
+    def test_render(self):
+        """Text and files should be converted with the options of each
+        request
+        """
+        org_str = open('test/test.org').read()
+        doc = parser.parse(org_str)
+        client = RenderClient(self.server.address)
+
+        self.assertEqual(client.render(org_str), org_to_html(doc))
+        self.assertEqual(client.render(org_str, hl_offset=1,
+                                       remove_empty_p=True),
+                         org_to_html(doc, hl_offset=1, remove_empty_p=True))
+        self.assertEqual(client.render(path='test/test.org'), org_to_html(doc))
+        self.assertEqual(client.render(''), '')
+
+        # errors are reported, and the connection is still usable
+        self.assertRaises(ValueError, client.render, path='missing.org')
+        self.assertRaises(ValueError, client.render, 'a', color=True)
+        self.assertEqual(client.render('* A'), '<h1>A</h1>')
+
+        # a file is parsed again when it changes
+        path = os.path.join(self.directory, 'doc.org')
+        with open(path, 'w') as f:
+            f.write('* A')
+        self.assertEqual(client.render(path=path), '<h1>A</h1>')
+        with open(path, 'w') as f:
+            f.write('* Longer')
+        self.assertEqual(client.render(path=path), '<h1>Longer</h1>')
+
+        client.close()
+
+    def test_pipelining(self):
+        """Pipelined requests from several clients should be answered in
+        order
+        """
+        errors = []
+
+        def run(n):
+            client = RenderClient(self.server.address)
+            for batch in range(5):
+                texts = ['* %d.%d.%d\n/x/' % (n, batch, i) for i in range(20)]
+                for i, text in enumerate(texts):
+                    client.send(text, hl_offset=i % 3)
+                for i, text in enumerate(texts):
+                    expected = org_to_html(parser.parse(text), hl_offset=i % 3)
+                    if client.receive() != expected:
+                        errors.append(text)
+            client.close()
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_invalid(self):
+        """A request which can't be read should get an error"""
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.server.address)
+        sock.sendall('not json\n')
+        self.assertTrue('"error"' in sock.makefile().readline())
+        sock.close()
+
+if __name__ == '__main__':
+    unittest.main()
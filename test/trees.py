@@ -0,0 +1,32 @@
+"""
+Helpers to build and compare parsed trees in the tests
+"""
+
+import random
+
+
+def dump_tree(node, parent=None):
+    """The structure and content of the subtree under node, checking the parent
+    links on the way
+    """
+    assert node.parent is parent
+    fields = [node.__class__.__name__]
+    for name in ('level', 'text', 'char', 'ordered', 'lines'):
+        if hasattr(node, name):
+            fields.append(getattr(node, name))
+    fields.append([dump_tree(child, node) for child in node.children])
+    return fields
+
+
+def random_lines(rand, lines, max_lines=30):
+    """Up to max_lines lines chosen from lines by the random.Random rand"""
+    return [rand.choice(lines) for _ in range(rand.randint(0, max_lines))]
+
+
+def random_docs(lines, count, seed=0, max_lines=30):
+    """Generate count documents of up to max_lines lines chosen from lines, the
+    same ones for the same seed
+    """
+    rand = random.Random(seed)
+    for _ in range(count):
+        yield '\n'.join(random_lines(rand, lines, max_lines))